@@ -5,22 +5,80 @@ class USDOracle(sp.Contract):
 
     def __init__(self, admin):
         
-        self.init(USDPrice = sp.nat(0), keysset = sp.set([admin]) , owner = admin,securities = admin, validator = sp.set([admin]))
+        self.init(USDPrice = sp.nat(0), USDPriceTime = sp.timestamp(0), USDPriceRound = sp.nat(0), cumulativePrice = sp.nat(0), PriceHistory = sp.big_map(tkey = sp.TNat, tvalue = sp.TRecord(timestamp = sp.TTimestamp, cumulative = sp.TNat, price = sp.TNat)), minContributors = sp.nat(1), keysset = sp.set([admin]) , owner = admin, validator = sp.set([admin]))
     
+    def updatePrice(self, price, round):
+
+        # Price-time accumulator: the previous price has been live since the previous feed
+        self.data.cumulativePrice += self.data.USDPrice * sp.as_nat(sp.now - self.data.USDPriceTime)
+        self.data.PriceHistory[round] = sp.record(timestamp = sp.now, cumulative = self.data.cumulativePrice, price = price)
+
+        self.data.USDPrice = price
+        self.data.USDPriceTime = sp.now
+        self.data.USDPriceRound = round
+
+        sp.emit(sp.record(price = price, timestamp = sp.now, round = round), tag = "price", with_type = True)
+
     @sp.entry_point
     def feedData(self,params):
         sp.verify(self.data.keysset.contains(sp.sender), message="User Doesn't have permission to Update Price")
+
+        # A single contributor's feed only stands in for the quorum when one contributor is enough
+        sp.verify(self.data.minContributors == 1, message = "Prices are aggregated with feedDataBatch")
         
-        self.data.USDPrice = params.price 
-    
+        self.updatePrice(params.price, self.data.USDPriceRound + 1)
+
     @sp.entry_point
-    def changeSecurities(self,params):
+    def feedDataBatch(self,params):
 
-        sp.set_type(params, sp.TRecord(address = sp.TAddress))
-        
-        sp.verify(sp.sender == self.data.owner, message="Only Governance Contract will Change Securities Contract")
+        # Signed reports of several contributors aggregated into one price update
+        sp.set_type(params, sp.TRecord(reports = sp.TList(sp.TRecord(key = sp.TKey, signature = sp.TSignature, price = sp.TNat))))
+
+        Round = sp.local('Round', self.data.USDPriceRound + 1)
+        Prices = sp.local('Prices', sp.map(tkey = sp.TNat, tvalue = sp.TNat))
+        Contributors = sp.local('Contributors', sp.set(t = sp.TAddress))
+
+        sp.for report in params.reports:
+
+            Contributor = sp.local('Contributor', sp.to_address(sp.implicit_account(sp.hash_key(report.key))))
+
+            sp.verify(self.data.keysset.contains(Contributor.value), message="User Doesn't have permission to Update Price")
+            sp.verify(~Contributors.value.contains(Contributor.value), message = "Contributor reported more than once")
+            sp.verify(sp.check_signature(report.key, report.signature, sp.pack(sp.record(oracle = sp.self_address, round = Round.value, price = report.price))), message = "Invalid report signature")
+
+            Contributors.value.add(Contributor.value)
+            Prices.value[report.price] = Prices.value.get(report.price, sp.nat(0)) + 1
+
+        Count = sp.local('Count', sp.len(params.reports))
+        sp.verify(Count.value >= self.data.minContributors, message = "Not enough contributors reported")
+
+        # Map keys iterate in ascending order, so walking the price counts finds the middle reports
+        LowerIndex = sp.local('LowerIndex', sp.as_nat(Count.value - 1) / 2)
+        UpperIndex = sp.local('UpperIndex', Count.value / 2)
+        Lower = sp.local('Lower', sp.nat(0))
+        Upper = sp.local('Upper', sp.nat(0))
+        Position = sp.local('Position', sp.nat(0))
 
-        self.data.securities = params.address
+        sp.for entry in Prices.value.items():
+
+            sp.if (Position.value <= LowerIndex.value) & (LowerIndex.value < Position.value + entry.value):
+                Lower.value = entry.key
+            sp.if (Position.value <= UpperIndex.value) & (UpperIndex.value < Position.value + entry.value):
+                Upper.value = entry.key
+
+            Position.value += entry.value
+
+        self.updatePrice((Lower.value + Upper.value) / 2, Round.value)
+
+    @sp.entry_point
+    def changeMinContributors(self,params):
+
+        sp.set_type(params, sp.TRecord(count = sp.TNat))
+
+        sp.verify(sp.sender == self.data.owner, message="Only Admin will update Contributor")
+        sp.verify(params.count > 0, message = "At least one contributor has to report")
+
+        self.data.minContributors = params.count
 
     @sp.entry_point
     def ValidatorOperation(self,params):
@@ -47,44 +105,128 @@ class USDOracle(sp.Contract):
             sp.verify(self.data.keysset.contains(params.contributor), message = "Address is not present as contributor")
             self.data.keysset.remove(params.contributor)
         
-    @sp.entry_point
-    def SecuritiesPurchase(self,params):
+    @sp.onchain_view()
+    def getPrice(self):
+        sp.result(sp.record(price = self.data.USDPrice, timestamp = self.data.USDPriceTime, round = self.data.USDPriceRound))
 
-        sp.set_type(params, sp.TRecord(duration = sp.TNat , address = sp.TAddress))
+    def roundAt(self, time):
 
-        c = sp.contract(sp.TRecord(price = sp.TNat, duration = sp.TNat, address = sp.TAddress), self.data.securities, entry_point = "OraclePurchaseSecurity").open_some( message = "Call to purchased PUT Option contract failed")
+        # Rounds are fed in time order, so a binary search over PriceHistory finds the last round fed at or before
+        # time, however many rounds were fed since; a time before the first feed finds the first round
+        Low = sp.local('Low', sp.nat(1))
+        High = sp.local('High', self.data.USDPriceRound)
 
-        mydata = sp.record(price = self.data.USDPrice,duration = params.duration, address = params.address)
+        sp.while Low.value < High.value:
 
-        sp.transfer(mydata, sp.mutez(0), c)
+            Mid = sp.local('Mid', (Low.value + High.value + 1) / 2)
 
-    @sp.entry_point
-    def SecuritiesExercise(self,params):
+            sp.if self.data.PriceHistory[Mid.value].timestamp <= time:
+                Low.value = Mid.value
+            sp.else:
+                High.value = sp.as_nat(Mid.value - 1)
 
-        sp.set_type(params, sp.TRecord(owner = sp.TAddress))
-        
-        c = sp.contract(sp.TRecord(price = sp.TNat, owner = sp.TAddress), self.data.securities, entry_point = "OracleExerciseSecurity").open_some( message = " call to exercised security on PUT contract failed")
+        return Low.value
+
+    @sp.onchain_view()
+    def getPriceAt(self, time):
+
+        # Price live at a past time, its round, the time it was fed at and the price-time accumulator at that time;
+        # a time before the first feed reads the first round as of its feed, whose timestamp is then later than time
+        sp.set_type(time, sp.TTimestamp)
+
+        sp.verify(self.data.USDPriceRound > 0, message = "Unknown price round")
+        sp.verify(time <= sp.now, message = "No price at a future time")
 
-        mydata = sp.record(price = self.data.USDPrice,owner = params.owner)
+        RoundId = sp.local('RoundId', self.roundAt(time))
+        Round = sp.local('Round', self.data.PriceHistory[RoundId.value])
+        Since = sp.local('Since', Round.value.timestamp)
 
-        sp.transfer(mydata, sp.mutez(0), c)
+        sp.if time > Since.value:
+            Since.value = time
+
+        sp.result(sp.record(price = Round.value.price, round = RoundId.value, timestamp = Round.value.timestamp, cumulative = Round.value.cumulative + Round.value.price * sp.as_nat(Since.value - Round.value.timestamp)))
+
+    @sp.onchain_view()
+    def getRound(self, round):
+        sp.set_type(round, sp.TNat)
+
+        sp.verify(self.data.PriceHistory.contains(round), message = "Unknown price round")
+        sp.result(self.data.PriceHistory[round])
+
+    @sp.onchain_view()
+    def getTWAP(self, window):
+
+        # Time-weighted average price over the last `window` seconds, or since the first feed if that is later
+        sp.set_type(window, sp.TNat)
+
+        sp.verify(self.data.USDPriceRound > 0, message = "Unknown price round")
+
+        StartTime = sp.local('StartTime', sp.now.add_seconds(-sp.to_int(window)))
+
+        sp.if self.data.PriceHistory[1].timestamp > StartTime.value:
+            StartTime.value = self.data.PriceHistory[1].timestamp
+
+        # Accumulator at the start of the window: the start round's checkpoint plus its price since then
+        Start = sp.local('Start', self.data.PriceHistory[self.roundAt(StartTime.value)])
+        StartCumulative = sp.local('StartCumulative', Start.value.cumulative + Start.value.price * sp.as_nat(StartTime.value - Start.value.timestamp))
+        Elapsed = sp.local('Elapsed', sp.as_nat(sp.now - StartTime.value))
+
+        sp.if Elapsed.value == 0:
+            sp.result(self.data.USDPrice)
+        sp.else:
+            Cumulative = sp.local('Cumulative', self.data.cumulativePrice + self.data.USDPrice * sp.as_nat(sp.now - self.data.USDPriceTime))
+            sp.result(sp.as_nat(Cumulative.value - StartCumulative.value) / Elapsed.value)
 
 
 # AMM-based CALL Options
+# Admin, keeper and settlement entry points are lazy: only purchase, exercise, transfer, mint and burn sit in the main script
 
 class Securities(sp.Contract):
 
-    def __init__(self,admin):
+    def __init__(self,admin,oracle,token):
 
             self.init(
-            CallOption = sp.big_map(),
+            CallOption = sp.big_map(tkey = sp.TPair(sp.TAddress, sp.TNat), tvalue = sp.TRecord(strikePrice = sp.TNat, options = sp.TNat, expiry = sp.TTimestamp, duration = sp.TNat, premium = sp.TNat)),
+            PositionCount = sp.big_map(tkey = sp.TAddress, tvalue = sp.TNat),
+            ExpiryIndex = sp.big_map(tkey = sp.TPair(sp.TNat, sp.TNat), tvalue = sp.TPair(sp.TAddress, sp.TNat)),
+            ExpiryCursor = sp.big_map(tkey = sp.TNat, tvalue = sp.TRecord(head = sp.TNat, tail = sp.TNat)),
             totalSupply = sp.nat(0),
             LockedSupply = sp.nat(0),
             adminAccount = sp.nat(0),
             tokenMinted = sp.nat(0),
             WithdrawFund = sp.nat(0),
-            InterestRate={1:1,7:3,14:5,21:7},
+            poolValue = sp.nat(0),
+            freeLiquidity = sp.nat(0),
+            withdrawableLiquidity = sp.nat(0),
+            utilization = sp.nat(0),
+            sharePrice = sp.nat(1000000),
+            OpenInterest = sp.map({1:0,7:0,14:0,21:0}, tkey = sp.TNat, tvalue = sp.TNat),
+            SeriesOpenInterest = sp.nat(0),
+            PremiumSurface = sp.big_map({sp.pair(duration, bucket): rate*10000 for duration, rate in [(1,1),(7,3),(14,5),(21,7)] for bucket in range(10, 41)}, tkey = sp.TPair(sp.TNat, sp.TNat), tvalue = sp.TNat),
+            moneynessStep = sp.nat(500),
             administrator = admin,
+            oracle = oracle,
+            token = token,
+            maxPriceAge = sp.nat(3600),
+            twapWindow = sp.nat(0),
+            european = False,
+            ExpirySnapshot = sp.big_map(tkey = sp.TNat, tvalue = sp.TNat),
+            Payouts = sp.big_map(tkey = sp.TAddress, tvalue = sp.TNat),
+            PayoutsOutstanding = sp.nat(0),
+            strikeStep = sp.nat(10),
+            nextSeriesId = sp.nat(0),
+            Series = sp.big_map(tkey = sp.TNat, tvalue = sp.TRecord(strikePrice = sp.TNat, expiry = sp.TTimestamp, outstanding = sp.TNat, locked = sp.TNat, premium = sp.TNat, reward = sp.TNat, settled = sp.TBool, payout = sp.TNat)),
+            SeriesIds = sp.big_map(tkey = sp.TPair(sp.TNat, sp.TNat), tvalue = sp.TNat),
+            SeriesLedger = sp.big_map(tkey = sp.TPair(sp.TAddress, sp.TNat), tvalue = sp.TNat),
+            epochMode = False,
+            epochLength = sp.nat(86400),
+            epochStart = sp.timestamp(0),
+            DepositQueue = sp.big_map(tkey = sp.TNat, tvalue = sp.TRecord(address = sp.TAddress, amount = sp.TNat)),
+            WithdrawQueue = sp.big_map(tkey = sp.TNat, tvalue = sp.TRecord(address = sp.TAddress, amount = sp.TNat)),
+            DepositCursor = sp.record(head = sp.nat(0), tail = sp.nat(0)),
+            WithdrawCursor = sp.record(head = sp.nat(0), tail = sp.nat(0)),
+            EpochSettlement = sp.record(active = False, poolValue = sp.nat(0), tokenSupply = sp.nat(0), freeAmount = sp.nat(0), depositEnd = sp.nat(0), withdrawEnd = sp.nat(0)),
+            SeriesOperators = sp.big_map(tkey = sp.TRecord(owner = sp.TAddress, operator = sp.TAddress, token_id = sp.TNat).layout(("owner", ("operator", "token_id"))), tvalue = sp.TUnit),
             paused = False
             )
 
@@ -95,124 +237,685 @@ class Securities(sp.Contract):
         sp.verify(sp.amount >= sp.mutez(0))
         self.data.totalSupply += sp.fst(sp.ediv(sp.amount , sp.mutez(1)).open_some( message = "unable to convert transfer amount to nat value"))
 
-    @sp.entry_point
+        self.emitPool()
+
+    @sp.entry_point(lazify = True)
     def delegate(self, baker):
     
         sp.verify(sp.sender == self.data.administrator, message = "Sender is not authorized to change vault's baker")
         sp.set_delegate(baker)
 
+    def registerCallOption(self, owner, price, duration, order, amount):
+
+        Durations = sp.set([1,7,14,21])
+
+        sp.verify(Durations.contains(duration), message = "Invalid Duration for CALL Options contract")
+
+        # Positions are keyed by (owner, position id) so an owner can hold any number of CALL Options
+        PositionId = sp.local('PositionId', self.data.PositionCount.get(owner, sp.nat(0)))
+        self.data.PositionCount[owner] = PositionId.value + 1
+
+        Deadline = sp.now.add_days(sp.to_int(duration))
+        self.data.CallOption[sp.pair(owner, PositionId.value)] = sp.record(strikePrice = price, options = order, expiry = Deadline, duration = duration, premium = amount)
+        self.data.OpenInterest[duration] += order
+
+        # Index the position in the next slot of its expiry day so expired positions can be swept in bulk;
+        # the day's cursor holds the first slot not swept yet (head) and the next free slot (tail)
+        Day = sp.local('Day', self.expiryDay(Deadline))
+
+        sp.if ~self.data.ExpiryCursor.contains(Day.value):
+            self.data.ExpiryCursor[Day.value] = sp.record(head = sp.nat(0), tail = sp.nat(0))
+
+        Slot = sp.local('Slot', self.data.ExpiryCursor[Day.value].tail)
+        self.data.ExpiryIndex[sp.pair(Day.value, Slot.value)] = sp.pair(owner, PositionId.value)
+        self.data.ExpiryCursor[Day.value].tail = Slot.value + 1
+
+        return sp.pair(owner, PositionId.value)
+
+    # The keeper reward of a position is always options * 1000
+    def rewardOf(self, position):
+        return position.options * 1000
+
+    # Events: "pool" snapshots the pool totals at the end of every entry point that moves them; position,
+    # series and payout events carry the key they are about and, for balances, the balance after the change
+    #
+    # The same point refreshes the pool snapshot the views read and the entry points price with: pool value
+    # (NAV), free liquidity, utilization in basis points and NAV per wXTZ share scaled by 10^6
+    #
+    # freeLiquidity is what new positions can lock (totalSupply - LockedSupply); withdrawableLiquidity is what
+    # ContractWriterBurn pays out, which also counts the premiums and rewards parked in WithdrawFund
+    def emitPool(self):
+        self.data.poolValue = self.data.totalSupply + self.data.WithdrawFund
+        self.data.freeLiquidity = abs(self.data.totalSupply - self.data.LockedSupply)
+        self.data.withdrawableLiquidity = abs(self.data.poolValue - self.data.LockedSupply)
+
+        sp.if self.data.totalSupply > 0:
+            self.data.utilization = self.data.LockedSupply * 10000 / self.data.totalSupply
+        sp.else:
+            self.data.utilization = 0
+
+        sp.if self.data.tokenMinted > 0:
+            self.data.sharePrice = self.data.poolValue * 1000000 / self.data.tokenMinted
+        sp.else:
+            self.data.sharePrice = 1000000
+
+        sp.emit(sp.record(totalSupply = self.data.totalSupply, LockedSupply = self.data.LockedSupply, WithdrawFund = self.data.WithdrawFund, tokenMinted = self.data.tokenMinted, adminAccount = self.data.adminAccount), tag = "pool", with_type = True)
+
+    # PayoutsOutstanding is every mutez owed to holders and withdrawers: Payouts balances and the payout of settled
+    # series not claimed yet. It stays in the contract balance but is no longer pool capital. Nothing is recorded
+    # for a 0 credit, so every Payouts entry can be withdrawn
+    def creditPayout(self, owner, amount):
+        sp.if amount > 0:
+            self.data.Payouts[owner] = self.data.Payouts.get(owner, sp.nat(0)) + amount
+            self.data.PayoutsOutstanding += amount
+            sp.emit(sp.record(owner = owner, balance = self.data.Payouts[owner]), tag = "payout", with_type = True)
+
+    def expiryDay(self, expiry):
+
+        return sp.as_nat(expiry - sp.timestamp(0)) / 86400
+
+    def reduceOpenInterest(self, key):
+
+        # The expiry slot of a closed position stays until SweepExpired reaches it and drops it, since position
+        # keys are never reused; the position leaves the open interest of the duration it was bought for
+        OpenDuration = sp.local('OpenDuration', self.data.CallOption[key].duration)
+        self.data.OpenInterest[OpenDuration.value] = abs(self.data.OpenInterest[OpenDuration.value] - self.data.CallOption[key].options)
+
+    def releaseCallOption(self, key, RewardTotal):
+
+        # Unlocks the collateral of an expired position and credits its premium to the pool
+        Position = sp.local('Position', self.data.CallOption[key])
+        TotalAmount = sp.local('TotalAmount',Position.value.options*1000000)
+
+        self.data.LockedSupply = abs(self.data.LockedSupply - TotalAmount.value)
+        self.data.WithdrawFund += Position.value.premium
+
+        RewardTotal.value += self.rewardOf(Position.value)
+
+        sp.emit(sp.record(owner = sp.fst(key), id = sp.snd(key), reward = self.rewardOf(Position.value)), tag = "expire", with_type = True)
+
+        self.reduceOpenInterest(key)
+        del self.data.CallOption[key]
+
+    # Premium surface: mutez per option keyed by (duration, moneyness bucket), where moneyness is strike / price
+    # in basis points and a bucket spans moneynessStep of them; the premium is interpolated linearly between
+    # the bucket of the strike and the next one
+    def surfacePremium(self, price, duration, strike):
+
+        Moneyness = sp.local('Moneyness', strike * 10000 / price)
+        Bucket = sp.local('Bucket', sp.pair(duration, Moneyness.value / self.data.moneynessStep))
+        Offset = sp.local('Offset', Moneyness.value % self.data.moneynessStep)
+
+        # One big_map read per bucket, failing on a bucket outside the surface
+        SurfacePremium = sp.local('SurfacePremium', self.data.PremiumSurface.get_opt(Bucket.value).open_some(message = "Strike is outside of the premium surface"))
+
+        sp.if Offset.value > 0:
+
+            NextBucket = sp.local('NextBucket', sp.pair(duration, sp.snd(Bucket.value) + 1))
+            NextPremium = sp.local('NextPremium', self.data.PremiumSurface.get_opt(NextBucket.value).open_some(message = "Strike is outside of the premium surface"))
+
+            sp.if NextPremium.value >= SurfacePremium.value:
+                SurfacePremium.value += sp.as_nat(NextPremium.value - SurfacePremium.value) * Offset.value / self.data.moneynessStep
+            sp.else:
+                SurfacePremium.value = sp.as_nat(SurfacePremium.value - sp.as_nat(SurfacePremium.value - NextPremium.value) * Offset.value / self.data.moneynessStep)
+
+        return SurfacePremium.value
+
+    def chargeCallOption(self, price, duration, strike, order, paid, Premium):
+
+        sp.verify(self.data.totalSupply > self.data.LockedSupply, message = "All Funds are locked up in existing CALL Options")
+
+        TotalAmount = sp.local('TotalAmount',order*abs(1000000))
+
+        PremiumTotal = sp.local('PremiumTotal',order*self.surfacePremium(price, duration, strike))
+
+        Premium.value = PremiumTotal.value
+
+        PremiumTotal.value += order*abs(10000)
+
+        self.data.adminAccount += order*9*1000
+
+        sp.verify(self.data.freeLiquidity >= TotalAmount.value, message = "Insufficient Funds to cover up Order Amount")
+        sp.verify(paid  >= PremiumTotal.value, message= "Premium is underpaid for the CALL Option contract")
+
+        self.data.LockedSupply = self.data.LockedSupply + TotalAmount.value
+        self.data.freeLiquidity = sp.as_nat(self.data.freeLiquidity - TotalAmount.value)
+
+        sp.verify(self.data.LockedSupply*10 <= self.data.totalSupply*9, message="Options utilizes more than 90 percent of the pool's funds.")
+
+    def priceCallOption(self, price, duration, key):
+
+        Premium = sp.local('Premium', sp.nat(0))
+        Position = sp.local('Position', self.data.CallOption[key])
+        self.chargeCallOption(price, duration, Position.value.strikePrice, Position.value.options, Position.value.premium, Premium)
+
+        # The paid amount held in premium is replaced by the premium charged
+        self.data.CallOption[key].premium = Premium.value
+
+        sp.emit(sp.record(owner = sp.fst(key), id = sp.snd(key), strike = Position.value.strikePrice, options = Position.value.options, expiry = Position.value.expiry, premium = Premium.value), tag = "purchase", with_type = True)
+
+    def fetchPrice(self):
+
+        # Synchronous read of the Oracle's XTZ/USD price through its on-chain view
+        Oracle = sp.local('Oracle', sp.view("getPrice", self.data.oracle, sp.unit, t = sp.TRecord(price = sp.TNat, timestamp = sp.TTimestamp, round = sp.TNat)).open_some(message = "Oracle price view failed"))
+
+        sp.verify(sp.now - Oracle.value.timestamp <= sp.to_int(self.data.maxPriceAge), message = "Oracle price is stale")
+
+        return Oracle.value
+
+    def settlementPrice(self):
+
+        # Spot price, or the Oracle TWAP over the last twapWindow seconds when a window is set
+        Settlement = sp.local('Settlement', self.fetchPrice())
+        SettlementPrice = sp.local('SettlementPrice', Settlement.value.price)
+
+        sp.if self.data.twapWindow > 0:
+            SettlementPrice.value = sp.view("getTWAP", self.data.oracle, self.data.twapWindow, t = sp.TNat).open_some(message = "Oracle TWAP view failed")
+
+        return SettlementPrice.value
+
     @sp.entry_point
     def PurchaseCallOption(self,params):
 
         sp.set_type(params, sp.TRecord(price = sp.TNat, duration = sp.TNat, order = sp.TNat, amount = sp.TNat ))
 
         sp.verify(sp.amount == sp.mutez(params.amount))
-        sp.verify(~self.data.CallOption.contains(sp.sender), message = "CALL Options are already registered in owner's name ")
         sp.verify(~self.data.paused, message = "Contract isn't accepting new Orders")
 
-        duration = sp.set([1,7,14,21])
-
-        sp.verify(duration.contains(params.duration), message = "Invalid Duration for CALL Options contract")
-        
-        Deadline = sp.now.add_days(sp.to_int(params.duration))
-        self.data.CallOption[sp.sender] = sp.record(strikePrice = params.price, options = params.order, expiry = Deadline,reward = sp.nat(0),premium = params.amount)
+        Key = sp.local('Key', self.registerCallOption(sp.sender, params.price, params.duration, params.order, params.amount))
 
-        # Call Oracle to Fetch Price (Adress and Duration)
-        call = sp.contract(sp.TRecord(duration = sp.TNat , address = sp.TAddress), sp.address("KT1TeegbL5HrPqHivCq7Cg4Ph4y1TciFEHTm"), entry_point = "SecuritiesPurchase").open_some(message = "Oracle Call failed")
-        calldata = sp.record(duration = params.duration , address = sp.sender)
-        sp.transfer(calldata, sp.mutez(0), call)
+        Price = sp.local('Price', self.fetchPrice().price)
+        self.priceCallOption(Price.value, params.duration, Key.value)
 
+        self.emitPool()
 
     @sp.entry_point
-    def OraclePurchaseSecurity(self,params):
-        
-        sp.set_type(params, sp.TRecord(price = sp.TNat, duration = sp.TNat, address = sp.TAddress ))
+    def PurchaseCallOptionBatch(self,params):
 
-        sp.verify(sp.sender == sp.address("KT1TeegbL5HrPqHivCq7Cg4Ph4y1TciFEHTm"), message = "Sender isn't Oracle Contract")
-        
-        sp.verify(self.data.totalSupply > self.data.LockedSupply, message = "All Funds are locked up in existing CALL Options")
+        sp.set_type(params, sp.TRecord(orders = sp.TList(sp.TRecord(price = sp.TNat, duration = sp.TNat, order = sp.TNat, amount = sp.TNat))))
 
-        TotalAvailable = sp.local('TotalAvailable', abs(self.data.totalSupply - self.data.LockedSupply))
-        TotalAmount = sp.local('TotalAmount',self.data.CallOption[params.address].options*abs(1000000))
-        
-        PremiumTotal = sp.local('PremiumTotal',self.data.CallOption[params.address].options*10000*self.data.InterestRate[params.duration])
+        sp.verify(~self.data.paused, message = "Contract isn't accepting new Orders")
 
-        PremiumTotal.value += (PremiumTotal.value*abs(params.price - self.data.CallOption[params.address].strikePrice))/(params.price)
-        
-        PaidAmount = sp.local('PaidAmount', self.data.CallOption[params.address].premium)
+        # Single Oracle read prices every order of the batch
+        Price = sp.local('Price', self.fetchPrice().price)
+        PaidTotal = sp.local('PaidTotal', sp.nat(0))
 
-        self.data.CallOption[params.address].premium = PremiumTotal.value
+        sp.for entry in params.orders:
 
-        PremiumTotal.value += self.data.CallOption[params.address].options*abs(10000)
+            Key = sp.local('Key', self.registerCallOption(sp.sender, entry.price, entry.duration, entry.order, entry.amount))
+            self.priceCallOption(Price.value, entry.duration, Key.value)
 
-        self.data.adminAccount += self.data.CallOption[params.address].options*9*1000
-        self.data.CallOption[params.address].reward = self.data.CallOption[params.address].options*1000
+            PaidTotal.value += entry.amount
 
-        sp.verify(TotalAvailable.value >= TotalAmount.value, message = "Insufficient Funds to cover up Order Amount")
-        sp.verify(PaidAmount.value  >= PremiumTotal.value, message= "Premium is underpaid for the CALL Option contract")
+        sp.verify(sp.amount == sp.mutez(PaidTotal.value), message = "Transfer amount doesn't match total premium of the orders")
 
-        self.data.LockedSupply = self.data.LockedSupply + TotalAmount.value
+        self.emitPool()
 
-        sp.verify(self.data.LockedSupply*10 <= self.data.totalSupply*9, message="Options utilizes more than 90 percent of the pool's funds.")
-        
-        
+    def exerciseCallOption(self, key, price, ProfitTotal):
+
+        Position = sp.local('Position', self.data.CallOption[key])
+        TotalAmount = sp.local('TotalAmount',Position.value.options*abs(1000000))
+
+        AmountLeft = sp.local('Amount',Position.value.strikePrice*1000000*Position.value.options)
+        AmountLeft.value = AmountLeft.value/price
+
+        self.data.WithdrawFund += Position.value.premium
+        self.data.WithdrawFund += self.rewardOf(Position.value)
+
+        self.data.LockedSupply = abs(self.data.LockedSupply - TotalAmount.value)
+        self.data.totalSupply = abs(self.data.totalSupply - abs(TotalAmount.value - AmountLeft.value))
+
+        ProfitTotal.value += abs(TotalAmount.value - AmountLeft.value)
+
+        sp.emit(sp.record(owner = sp.fst(key), id = sp.snd(key), price = price, payout = abs(TotalAmount.value - AmountLeft.value)), tag = "exercise", with_type = True)
+
+        self.reduceOpenInterest(key)
+        del self.data.CallOption[key]
+
+    def expiryPrice(self, time):
+
+        # Price of the Oracle's history at time, so a settlement called late settles as if called at time: the
+        # price live then, or the TWAP over the twapWindow seconds before it when a window is set. If no price
+        # was fed within maxPriceAge before time, the first price fed after it is used once there is one
+        AtExpiry = sp.local('AtExpiry', sp.view("getPriceAt", self.data.oracle, time, t = sp.TRecord(price = sp.TNat, round = sp.TNat, timestamp = sp.TTimestamp, cumulative = sp.TNat)).open_some(message = "Oracle price view failed"))
+        ExpiryPrice = sp.local('ExpiryPrice', AtExpiry.value.price)
+
+        sp.if time - AtExpiry.value.timestamp > sp.to_int(self.data.maxPriceAge):
+
+            NextRound = sp.local('NextRound', sp.view("getRound", self.data.oracle, AtExpiry.value.round + 1, t = sp.TRecord(timestamp = sp.TTimestamp, cumulative = sp.TNat, price = sp.TNat)).open_some(message = "Oracle price is stale"))
+            ExpiryPrice.value = NextRound.value.price
+
+        sp.else:
+
+            sp.if self.data.twapWindow > 0:
+
+                # The window starts at the first feed if that is later, as getTWAP's does
+                StartTime = sp.local('StartTime', time.add_seconds(-sp.to_int(self.data.twapWindow)))
+                WindowStart = sp.local('WindowStart', sp.view("getPriceAt", self.data.oracle, StartTime.value, t = sp.TRecord(price = sp.TNat, round = sp.TNat, timestamp = sp.TTimestamp, cumulative = sp.TNat)).open_some(message = "Oracle price view failed"))
+
+                sp.if WindowStart.value.timestamp > StartTime.value:
+                    StartTime.value = WindowStart.value.timestamp
+
+                sp.if time > StartTime.value:
+                    ExpiryPrice.value = sp.as_nat(AtExpiry.value.cumulative - WindowStart.value.cumulative) / sp.as_nat(time - StartTime.value)
+
+        return ExpiryPrice.value
+
+    def expirySnapshot(self, day):
+
+        # The first settlement after an expiry day has ended fixes the cohort's price at the end of that day
+        sp.if ~self.data.ExpirySnapshot.contains(day):
+
+            DayEnd = sp.local('DayEnd', sp.timestamp(0).add_days(sp.to_int(day + 1)))
+            sp.verify(sp.now >= DayEnd.value, message = "Expiry day hasn't ended yet")
+            self.data.ExpirySnapshot[day] = self.expiryPrice(DayEnd.value)
+
+        return self.data.ExpirySnapshot[day]
+
+    def settleCallOption(self, key, price, RewardTotal):
+
+        # In-the-money payouts are credited to the holder's Payouts balance instead of being sent
+        sp.if self.data.CallOption[key].strikePrice < price:
+
+            Payout = sp.local('Payout', sp.nat(0))
+            self.exerciseCallOption(key, price, Payout)
+
+            self.creditPayout(sp.fst(key), Payout.value)
+
+        sp.else:
+            self.releaseCallOption(key, RewardTotal)
+
+    def closeExpiredCallOption(self, key, RewardTotal):
+
+        sp.if self.data.european:
+
+            Snapshot = sp.local('Snapshot', self.expirySnapshot(self.expiryDay(self.data.CallOption[key].expiry)))
+            self.settleCallOption(key, Snapshot.value, RewardTotal)
+
+        sp.else:
+            self.releaseCallOption(key, RewardTotal)
 
     @sp.entry_point
     def ExerciseCallOption(self,params):
 
-        sp.verify(self.data.CallOption.contains(sp.sender), message = "Sender has not purchased Call Option")
-        sp.verify(sp.now <= self.data.CallOption[sp.sender].expiry, message = "PUT Options have already expired")
+        sp.set_type(params, sp.TRecord(id = sp.TNat))
+
+        Key = sp.local('Key', sp.pair(sp.sender, params.id))
+
+        sp.verify(~self.data.european, message = "CALL Options settle at expiry")
+        sp.verify(self.data.CallOption.contains(Key.value), message = "Sender has not purchased Call Option")
+        sp.verify(sp.now <= self.data.CallOption[Key.value].expiry, message = "PUT Options have already expired")
+
+        Price = sp.local('Price', self.settlementPrice())
+
+        sp.verify(self.data.CallOption[Key.value].strikePrice < Price.value, message = "Current Price is less than or equal to Strike Price")
+
+        ProfitValue = sp.local('ProfitValue', sp.nat(0))
+        self.exerciseCallOption(Key.value, Price.value, ProfitValue)
+        self.emitPool()
+
+        sp.send(sp.sender,sp.mutez(ProfitValue.value))
+
+    @sp.entry_point(lazify = True)
+    def FreeSecurity(self,params):
+
+        sp.set_type(params, sp.TRecord(address = sp.TAddress, id = sp.TNat))
+
+        Key = sp.local('Key', sp.pair(params.address, params.id))
+
+        sp.verify(self.data.CallOption.contains(Key.value), message = "Order with such address does not exist.")
+
+        sp.if sp.now > self.data.CallOption[Key.value].expiry :
+
+            TransferAmount = sp.local("TransferAmount", sp.nat(0))
+            self.closeExpiredCallOption(Key.value, TransferAmount)
+            self.emitPool()
+
+            # Settled in-the-money positions earn no reward, and a 0 mutez transfer would fail the call
+            sp.if TransferAmount.value > 0:
+                sp.send(sp.sender,sp.mutez(TransferAmount.value))
+
+    @sp.entry_point(lazify = True)
+    def SweepExpired(self,params):
+
+        sp.set_type(params, sp.TRecord(day = sp.TNat, limit = sp.TNat))
+
+        sp.verify(self.data.ExpiryCursor.contains(params.day), message = "No CALL Options expire on that day")
+
+        # Walks at most `limit` slots of the day from its head and stops at the first position still running;
+        # slots of positions already exercised, freed or settled are dropped on the way
+        Steps = sp.local('Steps', sp.nat(0))
+        Scanning = sp.local('Scanning', True)
+        TransferAmount = sp.local("TransferAmount", sp.nat(0))
+
+        sp.while Scanning.value & (Steps.value < params.limit):
+
+            SweepHead = sp.local('SweepHead', self.data.ExpiryCursor[params.day].head)
+
+            sp.if SweepHead.value < self.data.ExpiryCursor[params.day].tail:
+
+                SweepKey = sp.local('SweepKey', self.data.ExpiryIndex[sp.pair(params.day, SweepHead.value)])
+
+                sp.if self.data.CallOption.contains(SweepKey.value):
+
+                    sp.if sp.now > self.data.CallOption[SweepKey.value].expiry:
+                        self.closeExpiredCallOption(SweepKey.value, TransferAmount)
+                    sp.else:
+                        Scanning.value = False
+
+                sp.if Scanning.value:
+
+                    del self.data.ExpiryIndex[sp.pair(params.day, SweepHead.value)]
+                    self.data.ExpiryCursor[params.day].head = SweepHead.value + 1
+                    Steps.value += 1
+
+            sp.else:
+                Scanning.value = False
+
+        sp.verify(Steps.value > 0, message = "No expired CALL Options to free")
+
+        sp.if self.data.ExpiryCursor[params.day].head == self.data.ExpiryCursor[params.day].tail:
+            del self.data.ExpiryCursor[params.day]
+
+        self.emitPool()
+
+        # Keeper reward for every freed position is paid out as one transfer, if the walk freed any
+        sp.if TransferAmount.value > 0:
+            sp.send(sp.sender,sp.mutez(TransferAmount.value))
+
+    @sp.entry_point(lazify = True)
+    def SettleExpiry(self,params):
+
+        sp.set_type(params, sp.TRecord(day = sp.TNat))
+
+        sp.verify(self.data.european, message = "CALL Options are exercised individually")
+        sp.verify(~self.data.ExpirySnapshot.contains(params.day), message = "Expiry day is already settled")
+
+        self.expirySnapshot(params.day)
+
+    @sp.entry_point(lazify = True)
+    def ClaimSettlement(self,params):
 
-        # Call Oracle to Fetch Price 
-        call = sp.contract(sp.TRecord(owner = sp.TAddress),sp.address("KT1TeegbL5HrPqHivCq7Cg4Ph4y1TciFEHTm"), entry_point = "SecuritiesExercise").open_some(message = "Oracle Call failed")
-        calldata = sp.record(owner = sp.sender)
-        sp.transfer(calldata, sp.mutez(0), call)
+        # Holders claim their own positions, keepers claim any number of positions in bulk
+        sp.set_type(params, sp.TRecord(positions = sp.TList(sp.TPair(sp.TAddress, sp.TNat))))
+
+        sp.verify(self.data.european, message = "CALL Options are exercised individually")
+
+        TransferAmount = sp.local("TransferAmount", sp.nat(0))
+
+        sp.for key in params.positions:
+
+            sp.verify(self.data.CallOption.contains(key), message = "Order with such address does not exist.")
+            sp.verify(sp.now > self.data.CallOption[key].expiry, message = "CALL Option hasn't expired yet")
+
+            self.closeExpiredCallOption(key, TransferAmount)
+
+        self.emitPool()
+
+        sp.if TransferAmount.value > 0:
+            sp.send(sp.sender,sp.mutez(TransferAmount.value))
+
+    @sp.entry_point(lazify = True)
+    def WithdrawPayout(self,params):
+
+        sp.verify(self.data.Payouts.contains(sp.sender), message = "No payout owed to sender")
+
+        PaymentAmount = sp.local('PaymentAmount', self.data.Payouts[sp.sender])
+        del self.data.Payouts[sp.sender]
+
+        self.data.PayoutsOutstanding = sp.as_nat(self.data.PayoutsOutstanding - PaymentAmount.value)
+
+        sp.emit(sp.record(owner = sp.sender, balance = sp.nat(0)), tag = "payout", with_type = True)
+
+        sp.if PaymentAmount.value > 0:
+            sp.send(sp.sender,sp.mutez(PaymentAmount.value))
+
+    # Option series: fungible CALL Options sharing a strike bucket and an expiry day, held in an FA2-style ledger
 
     @sp.entry_point
-    def OracleExerciseSecurity(self,params):
-        
-        sp.set_type(params, sp.TRecord(price = sp.TNat, owner = sp.TAddress))
+    def PurchaseSeries(self,params):
 
-        sp.verify(sp.sender == sp.address("KT1TeegbL5HrPqHivCq7Cg4Ph4y1TciFEHTm"), message = "Sender isn't Oracle Contract")
-        sp.verify(self.data.CallOption[params.owner].strikePrice < params.price, message = "Current Price is less than or equal to Strike Price")
+        sp.set_type(params, sp.TRecord(price = sp.TNat, duration = sp.TNat, order = sp.TNat, amount = sp.TNat ))
 
-        sp.if self.data.CallOption[params.owner].strikePrice < params.price:
-            
-            TotalAmount = sp.local('TotalAmount',self.data.CallOption[params.owner].options*abs(1000000))
-            
-            AmountLeft = sp.local('Amount',self.data.CallOption[params.owner].strikePrice*1000000*self.data.CallOption[params.owner].options)
-            AmountLeft.value = AmountLeft.value/params.price
+        sp.verify(sp.amount == sp.mutez(params.amount))
+        sp.verify(~self.data.paused, message = "Contract isn't accepting new Orders")
 
-            self.data.WithdrawFund += self.data.CallOption[params.owner].premium
-            self.data.WithdrawFund += self.data.CallOption[params.owner].reward
+        Durations = sp.set([1,7,14,21])
 
-            self.data.LockedSupply = abs(self.data.LockedSupply - TotalAmount.value)
-            self.data.totalSupply = abs(self.data.totalSupply - abs(TotalAmount.value - AmountLeft.value)) 
-            
-            ProfitValue = sp.local('ProfitValue',abs(TotalAmount.value - AmountLeft.value))
-            
-            sp.send(params.owner,sp.mutez(ProfitValue.value))
+        sp.verify(Durations.contains(params.duration), message = "Invalid Duration for CALL Options contract")
+
+        # A series expires at the end of the last whole day before now + duration, so no holder gets more exercise
+        # time than the duration the premium is priced for
+        Strike = sp.local('Strike', (params.price / self.data.strikeStep) * self.data.strikeStep)
+        Day = sp.local('Day', sp.as_nat(self.expiryDay(sp.now.add_days(sp.to_int(params.duration))) - 1))
+
+        # which leaves no exercise time to an order sent in the last second of a day
+        sp.verify(sp.timestamp(0).add_seconds(sp.to_int((Day.value + 1) * 86400) - 1) > sp.now, message = "Series expires before the order is settled")
+
+        sp.if ~self.data.SeriesIds.contains(sp.pair(Strike.value, Day.value)):
+
+            self.data.SeriesIds[sp.pair(Strike.value, Day.value)] = self.data.nextSeriesId
+            self.data.Series[self.data.nextSeriesId] = sp.record(strikePrice = Strike.value, expiry = sp.timestamp(0).add_seconds(sp.to_int((Day.value + 1) * 86400) - 1), outstanding = sp.nat(0), locked = sp.nat(0), premium = sp.nat(0), reward = sp.nat(0), settled = False, payout = sp.nat(0))
+            self.data.nextSeriesId += 1
+
+        TokenId = sp.local('TokenId', self.data.SeriesIds[sp.pair(Strike.value, Day.value)])
+
+        Price = sp.local('Price', self.fetchPrice().price)
+        Premium = sp.local('Premium', sp.nat(0))
+        self.chargeCallOption(Price.value, params.duration, Strike.value, params.order, params.amount, Premium)
+
+        self.data.Series[TokenId.value].outstanding += params.order
+        self.data.Series[TokenId.value].locked += params.order*1000000
+        self.data.Series[TokenId.value].premium += Premium.value
+        self.data.Series[TokenId.value].reward += params.order*1000
+        self.data.SeriesOpenInterest += params.order
+
+        self.creditSeries(sp.sender, TokenId.value, params.order)
+
+        self.emitSeries(TokenId.value)
+        self.emitPool()
+
+    def emitSeries(self, token_id):
+        Series = self.data.Series[token_id]
+        sp.emit(sp.record(token_id = token_id, strikePrice = Series.strikePrice, expiry = Series.expiry, outstanding = Series.outstanding, settled = Series.settled, payout = Series.payout), tag = "series", with_type = True)
+
+    def creditSeries(self, owner, token_id, amount):
+
+        self.data.SeriesLedger[sp.pair(owner, token_id)] = self.data.SeriesLedger.get(sp.pair(owner, token_id), sp.nat(0)) + amount
+        sp.emit(sp.record(owner = owner, token_id = token_id, balance = self.data.SeriesLedger[sp.pair(owner, token_id)]), tag = "series_balance", with_type = True)
+
+    def debitSeries(self, owner, token_id, amount):
+
+        Balance = sp.local('Balance', self.data.SeriesLedger.get(sp.pair(owner, token_id), sp.nat(0)))
+        sp.verify(Balance.value >= amount, message = "FA2_INSUFFICIENT_BALANCE")
+
+        sp.if Balance.value == amount:
+            del self.data.SeriesLedger[sp.pair(owner, token_id)]
+        sp.else:
+            self.data.SeriesLedger[sp.pair(owner, token_id)] = sp.as_nat(Balance.value - amount)
+
+        sp.emit(sp.record(owner = owner, token_id = token_id, balance = sp.as_nat(Balance.value - amount)), tag = "series_balance", with_type = True)
 
-            del self.data.CallOption[params.owner]
-    
     @sp.entry_point
-    def FreeSecurity(self,params):
+    def ExerciseSeries(self,params):
 
-        sp.set_type(params, sp.TRecord(address = sp.TAddress))
+        sp.set_type(params, sp.TRecord(token_id = sp.TNat, amount = sp.TNat))
 
-        sp.verify(self.data.CallOption.contains(params.address), message = "Order with such address does not exist.")
-        
-        sp.if sp.now > self.data.CallOption[params.address].expiry :
-        
-            TotalAmount = sp.local('TotalAmount',self.data.CallOption[params.address].options*1000000)
-    
-            self.data.LockedSupply = abs(self.data.LockedSupply - TotalAmount.value)
-            self.data.WithdrawFund += self.data.CallOption[params.address].premium
+        sp.verify(~self.data.european, message = "CALL Options settle at expiry")
+        sp.verify(params.amount > 0, message = "Exercised amount has to be positive")
+        sp.verify(self.data.Series.contains(params.token_id), message = "FA2_TOKEN_UNDEFINED")
+        sp.verify(sp.now <= self.data.Series[params.token_id].expiry, message = "PUT Options have already expired")
+
+        Price = sp.local('Price', self.settlementPrice())
+
+        sp.verify(self.data.Series[params.token_id].strikePrice < Price.value, message = "Current Price is less than or equal to Strike Price")
+
+        self.debitSeries(sp.sender, params.token_id, params.amount)
+
+        TotalAmount = sp.local('TotalAmount',params.amount*abs(1000000))
+
+        AmountLeft = sp.local('Amount',self.data.Series[params.token_id].strikePrice*1000000*params.amount)
+        AmountLeft.value = AmountLeft.value/Price.value
+
+        # Exercised share of the series' premium and keeper reward goes to the pool
+        Outstanding = sp.local('Outstanding', self.data.Series[params.token_id].outstanding)
+        PremiumShare = sp.local('PremiumShare', self.data.Series[params.token_id].premium*params.amount/Outstanding.value)
+        RewardShare = sp.local('RewardShare', self.data.Series[params.token_id].reward*params.amount/Outstanding.value)
+
+        self.data.WithdrawFund += PremiumShare.value + RewardShare.value
+
+        self.data.Series[params.token_id].premium = sp.as_nat(self.data.Series[params.token_id].premium - PremiumShare.value)
+        self.data.Series[params.token_id].reward = sp.as_nat(self.data.Series[params.token_id].reward - RewardShare.value)
+        self.data.Series[params.token_id].outstanding = sp.as_nat(Outstanding.value - params.amount)
+        self.data.SeriesOpenInterest = sp.as_nat(self.data.SeriesOpenInterest - params.amount)
+        self.data.Series[params.token_id].locked = sp.as_nat(self.data.Series[params.token_id].locked - TotalAmount.value)
+
+        self.data.LockedSupply = abs(self.data.LockedSupply - TotalAmount.value)
+        self.data.totalSupply = abs(self.data.totalSupply - abs(TotalAmount.value - AmountLeft.value))
+
+        ProfitValue = sp.local('ProfitValue',abs(TotalAmount.value - AmountLeft.value))
+
+        self.emitSeries(params.token_id)
+        self.emitPool()
+
+        sp.send(sp.sender,sp.mutez(ProfitValue.value))
+
+    @sp.entry_point(lazify = True)
+    def FreeSeries(self,params):
+
+        # Settles a whole series after expiry at a cost independent of the number of holders
+        sp.set_type(params, sp.TRecord(token_id = sp.TNat))
+
+        sp.verify(self.data.Series.contains(params.token_id), message = "FA2_TOKEN_UNDEFINED")
+        sp.verify(~self.data.Series[params.token_id].settled, message = "Series is already settled")
+        sp.verify(sp.now > self.data.Series[params.token_id].expiry, message = "Series hasn't expired yet")
 
-            TransferAmount = sp.local("TransferAmount",self.data.CallOption[params.address].reward)
+        Series = sp.local('Series', self.data.Series[params.token_id])
+
+        self.data.LockedSupply = abs(self.data.LockedSupply - Series.value.locked)
+        self.data.SeriesOpenInterest = sp.as_nat(self.data.SeriesOpenInterest - Series.value.outstanding)
+        self.data.WithdrawFund += Series.value.premium
+
+        TransferAmount = sp.local("TransferAmount", Series.value.reward)
+
+        sp.if self.data.european:
+
+            Snapshot = sp.local('Snapshot', self.expirySnapshot(self.expiryDay(Series.value.expiry)))
+
+            sp.if Series.value.strikePrice < Snapshot.value:
+
+                # Holders claim outstanding * payout from the pool; the keeper reward stays in the pool as on exercise
+                self.data.Series[params.token_id].payout = abs(1000000 - (Series.value.strikePrice*1000000)/Snapshot.value)
+                self.data.totalSupply = abs(self.data.totalSupply - Series.value.outstanding*self.data.Series[params.token_id].payout)
+                self.data.PayoutsOutstanding += Series.value.outstanding*self.data.Series[params.token_id].payout
+
+                self.data.WithdrawFund += TransferAmount.value
+                TransferAmount.value = 0
+
+        self.data.Series[params.token_id].settled = True
+        self.data.Series[params.token_id].locked = 0
+        self.data.Series[params.token_id].premium = 0
+        self.data.Series[params.token_id].reward = 0
+
+        self.emitSeries(params.token_id)
+        self.emitPool()
+
+        sp.if TransferAmount.value > 0:
             sp.send(sp.sender,sp.mutez(TransferAmount.value))
 
-            del self.data.CallOption[params.address]
+    @sp.entry_point(lazify = True)
+    def ClaimSeries(self,params):
+
+        sp.set_type(params, sp.TRecord(token_id = sp.TNat))
+
+        sp.verify(self.data.Series.contains(params.token_id), message = "FA2_TOKEN_UNDEFINED")
+        sp.verify(self.data.Series[params.token_id].settled, message = "Series isn't settled yet")
+
+        Claimed = sp.local('Claimed', self.data.SeriesLedger.get(sp.pair(sp.sender, params.token_id), sp.nat(0)))
+        sp.verify(Claimed.value > 0, message = "FA2_INSUFFICIENT_BALANCE")
+
+        self.debitSeries(sp.sender, params.token_id, Claimed.value)
+
+        self.data.Series[params.token_id].outstanding = sp.as_nat(self.data.Series[params.token_id].outstanding - Claimed.value)
+
+        sp.if self.data.Series[params.token_id].payout > 0:
+
+            # The claim was set aside in PayoutsOutstanding when the series settled
+            self.data.PayoutsOutstanding = sp.as_nat(self.data.PayoutsOutstanding - Claimed.value*self.data.Series[params.token_id].payout)
+            self.creditPayout(sp.sender, Claimed.value*self.data.Series[params.token_id].payout)
+
+        self.emitSeries(params.token_id)
+
+    @sp.entry_point
+    def transferSeries(self,params):
+
+        sp.set_type(params, sp.TList(sp.TRecord(from_ = sp.TAddress, txs = sp.TList(sp.TRecord(to_ = sp.TAddress, token_id = sp.TNat, amount = sp.TNat).layout(("to_", ("token_id", "amount"))))).layout(("from_", "txs"))))
+
+        sp.for transfer in params:
+            sp.for tx in transfer.txs:
+
+                sp.verify(self.data.Series.contains(tx.token_id), message = "FA2_TOKEN_UNDEFINED")
+                sp.verify((transfer.from_ == sp.sender) | self.data.SeriesOperators.contains(sp.record(owner = transfer.from_, operator = sp.sender, token_id = tx.token_id)), message = "FA2_NOT_OPERATOR")
+
+                sp.if tx.amount > 0:
+
+                    self.debitSeries(transfer.from_, tx.token_id, tx.amount)
+                    self.creditSeries(tx.to_, tx.token_id, tx.amount)
+
+    @sp.entry_point(lazify = True)
+    def update_series_operators(self,params):
+
+        sp.set_type(params, sp.TList(sp.TVariant(add_operator = sp.TRecord(owner = sp.TAddress, operator = sp.TAddress, token_id = sp.TNat).layout(("owner", ("operator", "token_id"))), remove_operator = sp.TRecord(owner = sp.TAddress, operator = sp.TAddress, token_id = sp.TNat).layout(("owner", ("operator", "token_id"))))))
+
+        sp.for update in params:
+            with update.match_cases() as arg:
+
+                with arg.match("add_operator") as upd:
+                    sp.verify(upd.owner == sp.sender, message = "FA2_NOT_OWNER")
+                    self.data.SeriesOperators[sp.record(owner = upd.owner, operator = upd.operator, token_id = upd.token_id)] = sp.unit
+
+                with arg.match("remove_operator") as upd:
+                    sp.verify(upd.owner == sp.sender, message = "FA2_NOT_OWNER")
+                    del self.data.SeriesOperators[sp.record(owner = upd.owner, operator = upd.operator, token_id = upd.token_id)]
+
+    @sp.onchain_view()
+    def getSeriesBalance(self, params):
+        sp.set_type(params, sp.TRecord(owner = sp.TAddress, token_id = sp.TNat))
+        sp.result(self.data.SeriesLedger.get(sp.pair(params.owner, params.token_id), sp.nat(0)))
+
+    # Pool views read the snapshot refreshed with every "pool" event, so frontends price shares and orders in one call
+
+    @sp.onchain_view()
+    def getPoolSnapshot(self):
+        sp.result(sp.record(poolValue = self.data.poolValue, freeLiquidity = self.data.freeLiquidity, withdrawableLiquidity = self.data.withdrawableLiquidity, utilization = self.data.utilization, sharePrice = self.data.sharePrice, LockedSupply = self.data.LockedSupply, tokenMinted = self.data.tokenMinted, seriesOpenInterest = self.data.SeriesOpenInterest))
+
+    # Per-duration open interest of single positions; series are fungible across durations and counted
+    # together in the snapshot's seriesOpenInterest until they are exercised or settled
+
+    @sp.onchain_view()
+    def getOpenInterest(self, duration):
+        sp.set_type(duration, sp.TNat)
+        sp.result(self.data.OpenInterest.get(duration, sp.nat(0)))
+
+    @sp.onchain_view()
+    def getQuote(self, params):
+        sp.set_type(params, sp.TRecord(strike = sp.TNat, duration = sp.TNat, order = sp.TNat))
+
+        # Premium charged at the current Oracle price and the amount to send with PurchaseCallOption
+        QuotePremium = sp.local('QuotePremium', params.order * self.surfacePremium(self.fetchPrice().price, params.duration, params.strike))
+        sp.result(sp.record(premium = QuotePremium.value, total = QuotePremium.value + params.order*10000))
+
+    def withdrawFromPool(self, amount):
+
+        # Integrate Withdrawl Fund into Withdraw 
+        sp.if self.data.WithdrawFund >= amount:
+            self.data.WithdrawFund = abs(self.data.WithdrawFund - amount)
+
+        sp.else: 
+
+            AmountLeft = sp.local('AmountLeft',abs(amount - self.data.WithdrawFund))
+            self.data.totalSupply = abs(self.data.totalSupply - AmountLeft.value)
+            self.data.WithdrawFund = 0 
 
     @sp.entry_point 
     def ContractWriterMint(self,params):
@@ -220,6 +923,7 @@ class Securities(sp.Contract):
         sp.set_type(params, sp.TRecord(amount = sp.TNat))
 
         sp.verify(sp.amount == sp.mutez(params.amount))
+        sp.verify(~self.data.epochMode, message = "Deposits are queued in epoch mode")
 
         MintAmount = sp.local('MintAmount',sp.nat(0))
 
@@ -231,12 +935,14 @@ class Securities(sp.Contract):
         sp.else:  
 
             MintAmount.value = params.amount * self.data.tokenMinted
-            MintAmount.value = MintAmount.value/(self.data.totalSupply + self.data.WithdrawFund)
+            MintAmount.value = MintAmount.value/self.data.poolValue
             self.data.tokenMinted += MintAmount.value
 
         self.data.totalSupply = sp.fst(sp.ediv(sp.balance , sp.mutez(1)).open_some( message = "unable to convert balance to nat value"))
+        self.data.totalSupply = sp.as_nat(self.data.totalSupply - self.data.PayoutsOutstanding)
+        self.emitPool()
 
-        mint = sp.contract(sp.TRecord(value = sp.TNat , address = sp.TAddress), sp.address("KT19qoEwvhrH7XnFkbhJnKCr33ywomStTt2g"), entry_point = "mint").open_some(message = "minting wDAL call failed")
+        mint = sp.contract(sp.TRecord(value = sp.TNat , address = sp.TAddress), self.data.token, entry_point = "mint").open_some(message = "minting wDAL call failed")
         mintdata = sp.record(value = MintAmount.value , address = sp.sender)
         sp.transfer(mintdata, sp.mutez(0), mint)
         
@@ -246,30 +952,24 @@ class Securities(sp.Contract):
         
         sp.set_type(params, sp.TRecord(amount = sp.TNat))
 
+        sp.verify(~self.data.epochMode, message = "Withdrawals are queued in epoch mode")
         sp.verify(self.data.tokenMinted >= params.amount, message = "Burn Amount is greater than Total Tokens minted")
         
-        TransferAmount = sp.local('TransferAmount',params.amount*(self.data.totalSupply + self.data.WithdrawFund))
+        TransferAmount = sp.local('TransferAmount',params.amount*self.data.poolValue)
         TransferAmount.value = TransferAmount.value/self.data.tokenMinted
 
-        FreeAmount = sp.local('FreeAmount',abs((self.data.totalSupply + self.data.WithdrawFund) - self.data.LockedSupply))
+        FreeAmount = sp.local('FreeAmount',self.data.withdrawableLiquidity)
         
         sp.if FreeAmount.value >= TransferAmount.value:
 
             self.data.tokenMinted = abs(self.data.tokenMinted - params.amount)
 
-            # Integrate Withdrawl Fund into Withdraw 
-            sp.if self.data.WithdrawFund >= TransferAmount.value:
-                self.data.WithdrawFund = abs(self.data.WithdrawFund - TransferAmount.value)
-
-            sp.else: 
-
-                AmountLeft = sp.local('AmountLeft',abs(TransferAmount.value - self.data.WithdrawFund))
-                self.data.totalSupply = abs(self.data.totalSupply - AmountLeft.value)
-                self.data.WithdrawFund = 0 
+            self.withdrawFromPool(TransferAmount.value)
+            self.emitPool()
             
             # Add Burn Token Call First 
 
-            burn = sp.contract(sp.TRecord(value = sp.TNat , address = sp.TAddress), sp.address("KT19qoEwvhrH7XnFkbhJnKCr33ywomStTt2g"), entry_point = "burn").open_some(message = "burning wDAL call failed")
+            burn = sp.contract(sp.TRecord(value = sp.TNat , address = sp.TAddress), self.data.token, entry_point = "burn").open_some(message = "burning wDAL call failed")
             burndata = sp.record(value = params.amount , address = sp.sender)
             sp.transfer(burndata, sp.mutez(0), burn)
 
@@ -277,24 +977,189 @@ class Securities(sp.Contract):
             sp.send(sp.sender,sp.mutez(TransferAmount.value))
             
 
-    @sp.entry_point
+    # Epoch mode: deposits and withdrawal requests are queued and filled together at one share price per epoch.
+    # Both queues are FIFOs of requests keyed by position, with the first unsettled request (head) and the next
+    # free position (tail) in their cursor
+
+    @sp.entry_point(lazify = True)
+    def QueueDeposit(self,params):
+
+        sp.set_type(params, sp.TRecord(amount = sp.TNat))
+
+        sp.verify(self.data.epochMode, message = "Deposits are minted directly outside epoch mode")
+        sp.verify(params.amount > 0, message = "Queued amount has to be positive")
+        sp.verify(sp.amount == sp.mutez(params.amount))
+
+        self.data.DepositQueue[self.data.DepositCursor.tail] = sp.record(address = sp.sender, amount = params.amount)
+        self.data.DepositCursor.tail += 1
+
+    @sp.entry_point(lazify = True)
+    def QueueWithdraw(self,params):
+
+        sp.set_type(params, sp.TRecord(amount = sp.TNat))
+
+        sp.verify(self.data.epochMode, message = "Withdrawals are burned directly outside epoch mode")
+        sp.verify(params.amount > 0, message = "Queued amount has to be positive")
+
+        self.data.WithdrawQueue[self.data.WithdrawCursor.tail] = sp.record(address = sp.sender, amount = params.amount)
+        self.data.WithdrawCursor.tail += 1
+
+        # wXTZ is held by the contract until the request is filled; requires an approval for this contract
+        transfer = sp.contract(sp.TRecord(from_ = sp.TAddress, to_ = sp.TAddress, value = sp.TNat).layout(("from_", ("to_", "value"))), self.data.token, entry_point = "transfer").open_some(message = "transfer wDAL call failed")
+        sp.transfer(sp.record(from_ = sp.sender, to_ = sp.self_address, value = params.amount), sp.mutez(0), transfer)
+
+    @sp.entry_point(lazify = True)
+    def SettleEpoch(self,params):
+
+        sp.set_type(params, sp.TRecord(limit = sp.TNat))
+
+        sp.verify(self.data.epochMode, message = "Epochs are only settled in epoch mode")
+
+        # The first call after an epoch has ended fixes the share price, the free liquidity and the requests queued
+        # so far; every call then settles at most `limit` of them, withdrawals first, until both queues reach
+        # those ends. Requests queued in the meantime wait for the next epoch
+        sp.if ~self.data.EpochSettlement.active:
+
+            sp.verify(sp.now >= self.data.epochStart.add_seconds(sp.to_int(self.data.epochLength)), message = "Epoch hasn't ended yet")
+            self.data.EpochSettlement = sp.record(active = True, poolValue = self.data.poolValue, tokenSupply = self.data.tokenMinted, freeAmount = self.data.withdrawableLiquidity, depositEnd = self.data.DepositCursor.tail, withdrawEnd = self.data.WithdrawCursor.tail)
+
+        PoolValue = sp.local('PoolValue', self.data.EpochSettlement.poolValue)
+        TokenSupply = sp.local('TokenSupply', self.data.EpochSettlement.tokenSupply)
+
+        Steps = sp.local('Steps', sp.nat(0))
+        BurnTotal = sp.local('BurnTotal', sp.nat(0))
+        PaidTotal = sp.local('PaidTotal', sp.nat(0))
+
+        sp.while (Steps.value < params.limit) & (self.data.WithdrawCursor.head < self.data.EpochSettlement.withdrawEnd):
+
+            RequestId = sp.local('RequestId', self.data.WithdrawCursor.head)
+            Request = sp.local('Request', self.data.WithdrawQueue[RequestId.value])
+
+            Tokens = sp.local('Tokens', Request.value.amount)
+            TransferAmount = sp.local('TransferAmount', Tokens.value*PoolValue.value/TokenSupply.value)
+
+            # Partial fill up to the free liquidity left
+            sp.if TransferAmount.value > self.data.EpochSettlement.freeAmount:
+                Tokens.value = self.data.EpochSettlement.freeAmount*TokenSupply.value/PoolValue.value
+                TransferAmount.value = Tokens.value*PoolValue.value/TokenSupply.value
+
+            sp.if Tokens.value > 0:
+
+                self.data.EpochSettlement.freeAmount = sp.as_nat(self.data.EpochSettlement.freeAmount - TransferAmount.value)
+                BurnTotal.value += Tokens.value
+                PaidTotal.value += TransferAmount.value
+
+                self.creditPayout(Request.value.address, TransferAmount.value)
+
+            sp.if Tokens.value == Request.value.amount:
+
+                del self.data.WithdrawQueue[RequestId.value]
+                self.data.WithdrawCursor.head = RequestId.value + 1
+
+            sp.else:
+
+                # The remainder heads the queue for the next epoch, and this epoch has no liquidity left for the rest
+                self.data.WithdrawQueue[RequestId.value].amount = sp.as_nat(Request.value.amount - Tokens.value)
+                self.data.EpochSettlement.withdrawEnd = RequestId.value
+
+            Steps.value += 1
+
+        Mints = sp.local('Mints', sp.list(t = sp.TRecord(address = sp.TAddress, value = sp.TNat)))
+        DepositTotal = sp.local('DepositTotal', sp.nat(0))
+
+        sp.while (Steps.value < params.limit) & (self.data.DepositCursor.head < self.data.EpochSettlement.depositEnd):
+
+            DepositId = sp.local('DepositId', self.data.DepositCursor.head)
+            Deposit = sp.local('Deposit', self.data.DepositQueue[DepositId.value])
+
+            MintAmount = sp.local('MintAmount', Deposit.value.amount)
+
+            sp.if TokenSupply.value > 0:
+                MintAmount.value = Deposit.value.amount*TokenSupply.value/PoolValue.value
+
+            Mints.value.push(sp.record(address = Deposit.value.address, value = MintAmount.value))
+            self.data.tokenMinted += MintAmount.value
+            DepositTotal.value += Deposit.value.amount
+
+            del self.data.DepositQueue[DepositId.value]
+            self.data.DepositCursor.head = DepositId.value + 1
+
+            Steps.value += 1
+
+        self.data.tokenMinted = sp.as_nat(self.data.tokenMinted - BurnTotal.value)
+        self.withdrawFromPool(PaidTotal.value)
+        self.data.totalSupply += DepositTotal.value
+
+        # The epoch is over once both queues have reached the ends fixed by the first call
+        sp.if (self.data.WithdrawCursor.head == self.data.EpochSettlement.withdrawEnd) & (self.data.DepositCursor.head == self.data.EpochSettlement.depositEnd):
+
+            self.data.EpochSettlement.active = False
+            self.data.epochStart = sp.now
+
+        self.emitPool()
+
+        # One mint for every deposit settled by this call and one burn of the filled withdrawals held by this contract
+        sp.if sp.len(Mints.value) > 0:
+            mint = sp.contract(sp.TList(sp.TRecord(address = sp.TAddress, value = sp.TNat)), self.data.token, entry_point = "mintBatch").open_some(message = "minting wDAL call failed")
+            sp.transfer(Mints.value, sp.mutez(0), mint)
+
+        sp.if BurnTotal.value > 0:
+            burn = sp.contract(sp.TRecord(value = sp.TNat , address = sp.TAddress), self.data.token, entry_point = "burn").open_some(message = "burning wDAL call failed")
+            sp.transfer(sp.record(value = BurnTotal.value, address = sp.self_address), sp.mutez(0), burn)
+
+    @sp.entry_point(lazify = True)
+    def UpdateEpochMode(self,params):
+        sp.set_type(params, sp.TRecord(enabled = sp.TBool, length = sp.TNat))
+
+        sp.verify(sp.sender == self.data.administrator, message = "User not authorized to Change Epoch Mode")
+        sp.verify(~self.data.EpochSettlement.active & (self.data.DepositCursor.head == self.data.DepositCursor.tail) & (self.data.WithdrawCursor.head == self.data.WithdrawCursor.tail), message = "Queued requests have to be settled first")
+
+        self.data.epochMode = params.enabled
+        self.data.epochLength = params.length
+        self.data.epochStart = sp.now
+
+    @sp.entry_point(lazify = True)
     def ChangeState(self,params):
 
         sp.verify(sp.sender == self.data.administrator, message = "User not authorized to Change State of contract")
         self.data.paused = ~self.data.paused
     
-    @sp.entry_point
-    def UpdatePremium(self,params):
-        sp.set_type(params, sp.TRecord(one = sp.TNat, two = sp.TNat, three = sp.TNat,four = sp.TNat ))
+    @sp.entry_point(lazify = True)
+    def ChangeSettlementMode(self,params):
+
+        sp.verify(sp.sender == self.data.administrator, message = "User not authorized to Change Settlement Mode")
+        self.data.european = ~self.data.european
+
+    @sp.entry_point(lazify = True)
+    def UpdatePriceAge(self,params):
+        sp.set_type(params, sp.TRecord(age = sp.TNat))
+
+        sp.verify(sp.sender == self.data.administrator, message = "User not authorized to Update Price Age")
+
+        self.data.maxPriceAge = params.age
+
+    @sp.entry_point(lazify = True)
+    def UpdateSettlementWindow(self,params):
+        sp.set_type(params, sp.TRecord(seconds = sp.TNat))
+
+        sp.verify(sp.sender == self.data.administrator, message = "User not authorized to Update Settlement Window")
+
+        self.data.twapWindow = params.seconds
+
+    @sp.entry_point(lazify = True)
+    def UpdatePremiumSurface(self,params):
+        sp.set_type(params, sp.TList(sp.TRecord(duration = sp.TNat, bucket = sp.TNat, premium = sp.TNat)))
 
         sp.verify(sp.sender == self.data.administrator, message = "User not authorized to Update Premiums")
-        
-        self.data.InterestRate[1] = params.one
-        self.data.InterestRate[7] = params.two 
-        self.data.InterestRate[14] = params.three
-        self.data.InterestRate[21] = params.four
 
-    @sp.entry_point
+        # Bulk upload of surface points computed off-chain (see simulator/surface.py); a zero premium removes the point
+        sp.for point in params:
+            sp.if point.premium == 0:
+                del self.data.PremiumSurface[sp.pair(point.duration, point.bucket)]
+            sp.else:
+                self.data.PremiumSurface[sp.pair(point.duration, point.bucket)] = point.premium
+
+    @sp.entry_point(lazify = True)
     def AdminWithdraw(self,params):
         
         sp.verify(sp.sender == self.data.administrator , message = "User not authorized to withdraw admin funds.")
@@ -305,7 +1170,28 @@ class Securities(sp.Contract):
         sp.send(self.data.administrator,sp.mutez(PaymentAmount.value))
         self.data.adminAccount = 0
 
+        self.emitPool()
+
 if "templates" not in __name__:
+
+    wXTZ = sp.io.import_script_from_url("file:wXTZ.py")
+
+    def deploy(scenario, admin):
+
+        # Oracle, wXTZ and Securities wired together as on chain: Securities reads the Oracle's views and mints wXTZ
+        oracle = USDOracle(admin)
+        scenario += oracle
+
+        token = wXTZ.FA12(admin)
+        scenario += token
+
+        options = Securities(admin, oracle.address, token.address)
+        scenario += options
+
+        scenario += token.ValidatorOperation(address = options.address, Operation = 1).run(sender = admin)
+
+        return oracle, token, options
+
     @sp.add_test(name = "Call Options Contract")
     def test():
 
@@ -320,15 +1206,9 @@ if "templates" not in __name__:
 
         scenario.h1("Contract")
 
-        oracle  = USDOracle(sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF"))
-        scenario += oracle 
-  
-        options = Securities(sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF"))
-        scenario += options
+        oracle, token, options = deploy(scenario, sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF"))
         
         scenario += oracle.feedData(price=400).run(sender=sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF"))
-        
-        scenario += oracle.changeSecurities(address=options.address).run(sender=sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF"))
 
         scenario += options.ContractWriterMint(amount=2000000).run(sender=alice, amount = sp.tez(2))
         # scenario += options.ContractWriterBurn(amount=1000000).run(sender=alice)
@@ -339,5 +1219,482 @@ if "templates" not in __name__:
         
         scenario += oracle.feedData(price=600).run(sender=sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF"))
         
-        scenario += options.ExerciseCallOption().run(sender = bob)
-        # scenario += oracle.SecuritiesExercise(owner = bob.address).run(sender = bob )
\ No newline at end of file
+        scenario += options.ExerciseCallOption(id = 0).run(sender = bob)
+        # scenario += oracle.SecuritiesExercise(owner = bob.address).run(sender = bob )
+
+    @sp.add_test(name = "Batch Purchase")
+    def test():
+
+        scenario = sp.test_scenario()
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        writer = sp.test_account("Writer")
+        desk = sp.test_account("Desk")
+
+        scenario.h1("Batch Purchase")
+
+        oracle, token, options = deploy(scenario, admin)
+
+        scenario += oracle.feedData(price=400).run(sender=admin)
+
+        scenario += options.ContractWriterMint(amount=1000000000).run(sender=writer, amount = sp.tez(1000))
+
+        # Every order of a batch is recorded as its own position; the gas per order at these sizes comes from
+        # the options load of benchmarks/gas_report.py, the scenario interpreter doesn't report gas
+        total = 0
+        for size in [1, 10, 50]:
+
+            scenario.h2("Batch of %d orders" % size)
+
+            orders = [sp.record(price = 400, duration = 7, order = 1, amount = 50000) for i in range(size)]
+
+            scenario += options.PurchaseCallOptionBatch(orders = orders).run(sender = desk, amount = sp.mutez(50000 * size))
+
+            total += size
+            scenario.verify(options.data.PositionCount[desk.address] == total)
+            scenario.verify(options.data.LockedSupply == total * 1000000)
+
+    @sp.add_test(name = "Positions per Holder")
+    def test():
+
+        scenario = sp.test_scenario()
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        writer = sp.test_account("Writer")
+        desk = sp.test_account("Desk")
+
+        scenario.h1("Positions per Holder")
+
+        oracle, token, options = deploy(scenario, admin)
+
+        scenario += oracle.feedData(price=400).run(sender=admin)
+        scenario += options.ContractWriterMint(amount=1000000000).run(sender=writer, amount = sp.tez(1000))
+
+        # The 1st and the 100th purchase from the same address each write one CallOption entry under their own
+        # (owner, id) key; the gas of both is measured by the positions load of benchmarks/gas_report.py, the
+        # scenario interpreter doesn't report gas
+        for i in range(100):
+
+            if i in [0, 99]:
+                scenario.h2("Purchase %d" % (i + 1))
+
+            scenario += options.PurchaseCallOption(price = 400, duration = 7, order = 1, amount = 50000).run(sender = desk, amount = sp.mutez(50000))
+
+            if i in [0, 99]:
+                scenario.verify(options.data.PositionCount[desk.address] == i + 1)
+                scenario.verify(options.data.CallOption.contains(sp.pair(desk.address, i)))
+
+        scenario.h2("Exercise a specific position")
+        scenario += oracle.feedData(price=600).run(sender=admin)
+        scenario += options.ExerciseCallOption(id = 42).run(sender = desk)
+        scenario.verify(~options.data.CallOption.contains(sp.pair(desk.address, 42)))
+        scenario.verify(options.data.CallOption.contains(sp.pair(desk.address, 41)) & options.data.CallOption.contains(sp.pair(desk.address, 43)))
+
+    @sp.add_test(name = "Sweep Expired")
+    def test():
+
+        scenario = sp.test_scenario()
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        writer = sp.test_account("Writer")
+        desk = sp.test_account("Desk")
+        keeper = sp.test_account("Keeper")
+
+        scenario.h1("Sweep Expired")
+
+        oracle, token, options = deploy(scenario, admin)
+
+        scenario += oracle.feedData(price=400).run(sender=admin)
+        scenario += options.ContractWriterMint(amount=1000000000).run(sender=writer, amount = sp.tez(1000))
+
+        orders = [sp.record(price = 400, duration = 1, order = 1, amount = 50000) for i in range(10)]
+        scenario += options.PurchaseCallOptionBatch(orders = orders).run(sender = desk, amount = sp.mutez(500000), now = sp.timestamp(0))
+        scenario += options.PurchaseCallOption(price = 400, duration = 7, order = 1, amount = 50000).run(sender = desk, amount = sp.mutez(50000), now = sp.timestamp(0))
+
+        scenario.h2("Nothing has expired yet")
+        scenario += options.SweepExpired(day = 1, limit = 10).run(sender = keeper, now = sp.timestamp(0), valid = False)
+
+        scenario.h2("Sweep the 1-day cohort in two calls")
+        scenario += options.FreeSecurity(address = desk.address, id = 0).run(sender = keeper, now = sp.timestamp(2 * 86400))
+        scenario += options.SweepExpired(day = 1, limit = 6).run(sender = keeper, now = sp.timestamp(2 * 86400))
+        scenario.verify(options.data.LockedSupply == 5000000)
+        scenario.verify(options.data.ExpiryCursor[1].head == 6)
+
+        scenario += options.SweepExpired(day = 1, limit = 6).run(sender = keeper, now = sp.timestamp(2 * 86400))
+        scenario.verify(~options.data.ExpiryCursor.contains(1))
+        scenario.verify(~options.data.ExpiryIndex.contains(sp.pair(1, 9)))
+        scenario.verify(options.data.LockedSupply == 1000000)
+        scenario.verify(options.data.ExpiryCursor[7].tail == 1)
+
+        scenario.h2("A day whose positions were all exercised is still swept")
+        scenario += oracle.feedData(price=400).run(sender=admin, now = sp.timestamp(2 * 86400))
+        scenario += options.PurchaseCallOptionBatch(orders = orders[:3]).run(sender = desk, amount = sp.mutez(150000), now = sp.timestamp(2 * 86400))
+        scenario += oracle.feedData(price=600).run(sender=admin, now = sp.timestamp(3 * 86400))
+        for i in range(11, 14):
+            scenario += options.ExerciseCallOption(id = i).run(sender = desk, now = sp.timestamp(3 * 86400))
+
+        scenario += options.SweepExpired(day = 3, limit = 10).run(sender = keeper, now = sp.timestamp(4 * 86400))
+        scenario.verify(~options.data.ExpiryCursor.contains(3))
+
+    @sp.add_test(name = "Oracle Aggregation")
+    def test():
+
+        scenario = sp.test_scenario()
+
+        admin = sp.test_account("Admin")
+        reporters = [sp.test_account("Reporter_%d" % i) for i in range(4)]
+        buyer = sp.test_account("Buyer")
+        writer = sp.test_account("Writer")
+
+        scenario.h1("Oracle Aggregation")
+
+        oracle, token, options = deploy(scenario, admin.address)
+
+        for reporter in reporters:
+            scenario += oracle.addDataContributor(contributor = reporter.address, Operation = 1).run(sender = admin)
+
+        scenario += oracle.changeMinContributors(count = 3).run(sender = admin)
+
+        def reports(round, prices):
+            return [sp.record(key = reporter.public_key, price = price, signature = sp.make_signature(reporter.secret_key, sp.pack(sp.record(oracle = oracle.address, round = round, price = price)), message_format = "Raw")) for reporter, price in zip(reporters, prices)]
+
+        scenario.h2("Median of an odd number of reports")
+        scenario += oracle.feedDataBatch(reports = reports(1, [420, 400, 10000])).run(sender = admin, now = sp.timestamp(0))
+        scenario.verify(oracle.data.USDPrice == 420)
+        scenario.verify(oracle.data.USDPriceRound == 1)
+
+        scenario.h2("Median of an even number of reports")
+        scenario += oracle.feedDataBatch(reports = reports(2, [400, 410, 430, 0])).run(sender = admin, now = sp.timestamp(60))
+        scenario.verify(oracle.data.USDPrice == 405)
+
+        scenario.h2("Rejected reports")
+        scenario += oracle.feedData(price = 10000).run(sender = reporters[0], now = sp.timestamp(120), valid = False)
+        scenario += oracle.feedDataBatch(reports = reports(2, [400, 410, 430])).run(sender = admin, now = sp.timestamp(120), valid = False)
+        scenario += oracle.feedDataBatch(reports = reports(3, [400, 410])).run(sender = admin, now = sp.timestamp(120), valid = False)
+
+        scenario.h2("Stale price")
+        scenario += options.ContractWriterMint(amount=100000000).run(sender = writer, amount = sp.tez(100), now = sp.timestamp(60))
+        scenario += options.PurchaseCallOption(price = 400, duration = 1, order = 1, amount = 50000).run(sender = buyer, amount = sp.mutez(50000), now = sp.timestamp(600))
+        scenario += options.PurchaseCallOption(price = 400, duration = 1, order = 1, amount = 50000).run(sender = buyer, amount = sp.mutez(50000), now = sp.timestamp(60 + 3601), valid = False)
+
+    @sp.add_test(name = "TWAP Settlement")
+    def test():
+
+        scenario = sp.test_scenario()
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        writer = sp.test_account("Writer")
+        buyer = sp.test_account("Buyer")
+
+        scenario.h1("TWAP Settlement")
+
+        oracle, token, options = deploy(scenario, admin)
+
+        scenario += options.UpdateSettlementWindow(seconds = 300).run(sender = admin)
+
+        scenario += oracle.feedData(price=400).run(sender=admin, now = sp.timestamp(0))
+        scenario += options.ContractWriterMint(amount=100000000).run(sender = writer, amount = sp.tez(100), now = sp.timestamp(0))
+        scenario += options.PurchaseCallOption(price = 400, duration = 1, order = 1, amount = 50000).run(sender = buyer, amount = sp.mutez(50000), now = sp.timestamp(0))
+
+        scenario += oracle.feedData(price=500).run(sender=admin, now = sp.timestamp(100))
+        scenario += oracle.feedData(price=700).run(sender=admin, now = sp.timestamp(200))
+        scenario.verify(oracle.getTWAP(300) == 450)
+
+        scenario.h2("A burst of feeds doesn't shorten the window")
+        for t in range(290, 300):
+            scenario += oracle.feedData(price=700).run(sender=admin, now = sp.timestamp(t))
+
+        # History reads the price live at a past time and the accumulator there
+        scenario.verify(oracle.getPriceAt(sp.timestamp(250)).price == 700)
+        scenario.verify(oracle.getPriceAt(sp.timestamp(250)).round == 3)
+        scenario.verify(oracle.getPriceAt(sp.timestamp(250)).cumulative == 400 * 100 + 500 * 100 + 700 * 50)
+
+        scenario.h2("Exercise settles at the 300s TWAP of 533 rather than the 700 spot")
+        scenario += options.ExerciseCallOption(id = 0).run(sender = buyer, now = sp.timestamp(300))
+        scenario.verify(options.data.totalSupply == 100000000 - (1000000 - 400 * 1000000 // 533))
+        scenario.verify(options.data.LockedSupply == 0)
+
+    @sp.add_test(name = "European Settlement")
+    def test():
+
+        scenario = sp.test_scenario()
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        writer = sp.test_account("Writer")
+        keeper = sp.test_account("Keeper")
+        buyers = [sp.test_account("Buyer_%d" % i) for i in range(3)]
+
+        scenario.h1("European Settlement")
+
+        oracle, token, options = deploy(scenario, admin)
+
+        scenario += options.ChangeSettlementMode().run(sender = admin)
+
+        scenario += oracle.feedData(price=400).run(sender=admin, now = sp.timestamp(0))
+        scenario += options.ContractWriterMint(amount=100000000).run(sender = writer, amount = sp.tez(100), now = sp.timestamp(0))
+
+        for buyer, strike in zip(buyers, [380, 450, 520]):
+            scenario += options.PurchaseCallOption(price = strike, duration = 1, order = 1, amount = 50000).run(sender = buyer, amount = sp.mutez(50000), now = sp.timestamp(0))
+
+        scenario += oracle.feedData(price=500).run(sender=admin, now = sp.timestamp(86400))
+        scenario += options.ExerciseCallOption(id = 0).run(sender = buyers[0], now = sp.timestamp(86400), valid = False)
+
+        scenario.h2("Snapshot can only be taken once the expiry day is over")
+        scenario += options.SettleExpiry(day = 1).run(sender = keeper, now = sp.timestamp(86400 + 10), valid = False)
+
+        scenario += oracle.feedData(price=480).run(sender=admin, now = sp.timestamp(2 * 86400))
+        scenario += options.SettleExpiry(day = 1).run(sender = keeper, now = sp.timestamp(2 * 86400))
+        scenario.verify(options.data.ExpirySnapshot[1] == 480)
+
+        scenario.h2("Keeper claims the whole cohort")
+        scenario += oracle.feedData(price=900).run(sender=admin, now = sp.timestamp(2 * 86400 + 60))
+        scenario += options.ClaimSettlement(positions = [sp.pair(buyer.address, 0) for buyer in buyers]).run(sender = keeper, now = sp.timestamp(2 * 86400 + 60))
+
+        scenario.verify(options.data.Payouts[buyers[0].address] == 1000000 - 380 * 1000000 // 480)
+        scenario.verify(options.data.Payouts[buyers[1].address] == 1000000 - 450 * 1000000 // 480)
+        scenario.verify(~options.data.Payouts.contains(buyers[2].address))
+        scenario.verify(options.data.LockedSupply == 0)
+
+        scenario.verify(options.data.PayoutsOutstanding == options.data.Payouts[buyers[0].address] + options.data.Payouts[buyers[1].address])
+
+        scenario.h2("Holders pull their payouts")
+        scenario += options.WithdrawPayout().run(sender = buyers[0])
+        scenario += options.WithdrawPayout().run(sender = buyers[0], valid = False)
+        scenario.verify(options.data.PayoutsOutstanding == options.data.Payouts[buyers[1].address])
+
+        scenario.h2("Unclaimed payouts are not pool capital")
+        scenario += options.ContractWriterMint(amount=1000000).run(sender = writer, amount = sp.tez(1))
+        scenario.verify(options.data.totalSupply == sp.utils.mutez_to_nat(options.balance) - options.data.PayoutsOutstanding)
+
+        scenario += options.WithdrawPayout().run(sender = buyers[1])
+        scenario.verify(options.data.PayoutsOutstanding == 0)
+
+        scenario.h2("Freeing and sweeping settled positions pays no reward")
+        scenario += options.SweepExpired(day = 1, limit = 10).run(sender = keeper, now = sp.timestamp(2 * 86400 + 120))
+        scenario.verify(~options.data.ExpiryCursor.contains(1))
+
+        scenario += options.PurchaseCallOption(price = 900, duration = 1, order = 1, amount = 50000).run(sender = buyers[0], amount = sp.mutez(50000), now = sp.timestamp(2 * 86400 + 60))
+        scenario += oracle.feedData(price=950).run(sender=admin, now = sp.timestamp(4 * 86400))
+        scenario += options.FreeSecurity(address = buyers[0].address, id = 1).run(sender = keeper, now = sp.timestamp(4 * 86400))
+        scenario.verify(options.data.Payouts[buyers[0].address] == 1000000 - 900 * 1000000 // 950)
+
+        scenario.h2("A late settlement uses the price at the end of the expiry day")
+        scenario += options.PurchaseCallOption(price = 950, duration = 1, order = 1, amount = 50000).run(sender = buyers[1], amount = sp.mutez(50000), now = sp.timestamp(4 * 86400))
+        scenario += oracle.feedData(price=1000).run(sender=admin, now = sp.timestamp(6 * 86400 - 600))
+        scenario += oracle.feedData(price=2000).run(sender=admin, now = sp.timestamp(6 * 86400 + 7200))
+        scenario += options.SettleExpiry(day = 5).run(sender = keeper, now = sp.timestamp(7 * 86400))
+        scenario.verify(options.data.ExpirySnapshot[5] == 1000)
+
+        scenario.h2("Without a price near the end of the day, the next price fed settles")
+        scenario += options.PurchaseCallOption(price = 2000, duration = 1, order = 1, amount = 50000).run(sender = buyers[2], amount = sp.mutez(50000), now = sp.timestamp(6 * 86400 + 7200))
+        scenario += options.SettleExpiry(day = 7).run(sender = keeper, now = sp.timestamp(8 * 86400 + 10), valid = False)
+        scenario += oracle.feedData(price=2100).run(sender=admin, now = sp.timestamp(9 * 86400))
+        scenario += options.SettleExpiry(day = 7).run(sender = keeper, now = sp.timestamp(9 * 86400 + 10))
+        scenario.verify(options.data.ExpirySnapshot[7] == 2100)
+
+    @sp.add_test(name = "Option Series")
+    def test():
+
+        scenario = sp.test_scenario()
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        writer = sp.test_account("Writer")
+        alice = sp.test_account("Alice")
+        bob = sp.test_account("Bob")
+        keeper = sp.test_account("Keeper")
+
+        scenario.h1("Option Series")
+
+        oracle, token, options = deploy(scenario, admin)
+
+        scenario += oracle.feedData(price=400).run(sender=admin, now = sp.timestamp(0))
+        scenario += options.ContractWriterMint(amount=100000000).run(sender = writer, amount = sp.tez(100), now = sp.timestamp(0))
+
+        scenario.h2("Orders with the same strike bucket and expiry day share one series")
+        scenario += options.PurchaseSeries(price = 404, duration = 7, order = 3, amount = 150000).run(sender = alice, amount = sp.mutez(150000), now = sp.timestamp(0))
+        scenario += options.PurchaseSeries(price = 409, duration = 7, order = 2, amount = 100000).run(sender = bob, amount = sp.mutez(100000), now = sp.timestamp(3600))
+        scenario.verify(options.data.nextSeriesId == 1)
+        scenario.verify(options.data.Series[0].outstanding == 5)
+        scenario.verify(options.data.Series[0].strikePrice == 400)
+
+        scenario.h2("A 1-day order in the last second of a day would expire at once")
+        scenario += oracle.feedData(price=400).run(sender=admin, now = sp.timestamp(86400 - 1))
+        scenario += options.PurchaseSeries(price = 400, duration = 1, order = 1, amount = 50000).run(sender = alice, amount = sp.mutez(50000), now = sp.timestamp(86400 - 1), valid = False)
+        scenario.verify(options.data.nextSeriesId == 1)
+
+        scenario.h2("Series positions trade without touching the pool")
+        scenario += options.transferSeries([sp.record(from_ = alice.address, txs = [sp.record(to_ = bob.address, token_id = 0, amount = 1)])]).run(sender = alice)
+        scenario += options.transferSeries([sp.record(from_ = alice.address, txs = [sp.record(to_ = bob.address, token_id = 0, amount = 1)])]).run(sender = bob, valid = False)
+        scenario.verify(options.data.SeriesLedger[sp.pair(bob.address, 0)] == 3)
+
+        scenario.h2("Exercise part of a balance")
+        scenario += oracle.feedData(price=500).run(sender=admin, now = sp.timestamp(86400))
+        scenario += options.ExerciseSeries(token_id = 0, amount = 0).run(sender = bob, now = sp.timestamp(86400), valid = False)
+        scenario += options.ExerciseSeries(token_id = 0, amount = 2).run(sender = bob, now = sp.timestamp(86400))
+        scenario.verify(options.data.Series[0].outstanding == 3)
+        scenario.verify(options.data.LockedSupply == 3000000)
+
+        scenario.h2("Free the series after expiry")
+        # 7-day orders of day 0 expire at the end of day 6, not later than 7 days after the purchase
+        scenario.verify(options.data.Series[0].expiry == sp.timestamp(7 * 86400 - 1))
+        scenario += options.FreeSeries(token_id = 0).run(sender = keeper, now = sp.timestamp(7 * 86400 - 1), valid = False)
+        scenario += options.FreeSeries(token_id = 0).run(sender = keeper, now = sp.timestamp(9 * 86400))
+        scenario.verify(options.data.LockedSupply == 0)
+
+        scenario += options.ClaimSeries(token_id = 0).run(sender = alice, now = sp.timestamp(9 * 86400))
+        scenario.verify(~options.data.SeriesLedger.contains(sp.pair(alice.address, 0)))
+        scenario.verify(~options.data.Payouts.contains(alice.address))
+        scenario.verify(options.data.Series[0].outstanding == 1)
+
+        scenario.h2("European series are claimed by their holders")
+        scenario += options.ChangeSettlementMode().run(sender = admin)
+        scenario += oracle.feedData(price=500).run(sender=admin, now = sp.timestamp(9 * 86400))
+        scenario += options.PurchaseSeries(price = 500, duration = 1, order = 2, amount = 50000).run(sender = alice, amount = sp.mutez(50000), now = sp.timestamp(9 * 86400))
+        scenario += options.PurchaseSeries(price = 500, duration = 1, order = 1, amount = 50000).run(sender = bob, amount = sp.mutez(50000), now = sp.timestamp(9 * 86400))
+        scenario += options.ClaimSeries(token_id = 1).run(sender = alice, now = sp.timestamp(9 * 86400), valid = False)
+
+        scenario += oracle.feedData(price=600).run(sender=admin, now = sp.timestamp(10 * 86400))
+        scenario += options.FreeSeries(token_id = 1).run(sender = keeper, now = sp.timestamp(10 * 86400))
+        scenario.verify(options.data.Series[1].payout == 1000000 - 500 * 1000000 // 600)
+
+        scenario += options.ClaimSeries(token_id = 1).run(sender = alice, now = sp.timestamp(10 * 86400))
+        scenario += options.ClaimSeries(token_id = 1).run(sender = alice, now = sp.timestamp(10 * 86400), valid = False)
+        scenario += options.ClaimSeries(token_id = 1).run(sender = bob, now = sp.timestamp(10 * 86400))
+        scenario.verify(options.data.Payouts[alice.address] == 2 * (1000000 - 500 * 1000000 // 600))
+        scenario.verify(options.data.Series[1].outstanding == 0)
+
+        scenario += options.WithdrawPayout().run(sender = alice)
+        scenario += options.WithdrawPayout().run(sender = bob)
+        scenario.verify(options.data.PayoutsOutstanding == 0)
+
+    @sp.add_test(name = "Epoch Queue")
+    def test():
+
+        scenario = sp.test_scenario()
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        alice = sp.test_account("Alice")
+        bob = sp.test_account("Bob")
+        carol = sp.test_account("Carol")
+        buyer = sp.test_account("Buyer")
+
+        scenario.h1("Epoch Queue")
+
+        oracle, token, options = deploy(scenario, admin)
+
+        scenario += token.ModifyLockup(duration = 0).run(sender = admin)
+        scenario += options.UpdateEpochMode(enabled = True, length = 86400).run(sender = admin, now = sp.timestamp(0))
+        scenario += options.ContractWriterMint(amount = 1000000).run(sender = alice, amount = sp.tez(1), valid = False)
+
+        scenario.h2("First epoch: deposits only")
+        scenario += options.QueueDeposit(amount = 0).run(sender = alice, amount = sp.mutez(0), now = sp.timestamp(10), valid = False)
+        scenario += options.QueueDeposit(amount = 10000000).run(sender = alice, amount = sp.tez(10), now = sp.timestamp(10))
+        scenario += options.QueueDeposit(amount = 5000000).run(sender = bob, amount = sp.tez(5), now = sp.timestamp(20))
+        scenario += options.SettleEpoch(limit = 10).run(sender = bob, now = sp.timestamp(100), valid = False)
+
+        scenario.h2("Settled one request per call")
+        scenario += options.SettleEpoch(limit = 1).run(sender = bob, now = sp.timestamp(86400))
+        scenario.verify(options.data.tokenMinted == 10000000)
+        scenario.verify(options.data.EpochSettlement.active)
+
+        # Queued after the epoch's requests were fixed, so it waits for the next epoch
+        scenario += options.QueueDeposit(amount = 1000000).run(sender = carol, amount = sp.tez(1), now = sp.timestamp(86400 + 1))
+        scenario += options.SettleEpoch(limit = 1).run(sender = bob, now = sp.timestamp(86400 + 2))
+        scenario.verify(options.data.tokenMinted == 15000000)
+        scenario.verify(options.data.totalSupply == 15000000)
+        scenario.verify(~options.data.EpochSettlement.active)
+        scenario.verify(options.data.DepositQueue[2].address == carol.address)
+
+        scenario.h2("Second epoch: a withdrawal larger than free liquidity is partially filled")
+        scenario += oracle.feedData(price=400).run(sender = admin, now = sp.timestamp(86400))
+        scenario += options.PurchaseCallOption(price = 400, duration = 21, order = 12, amount = 1000000).run(sender = buyer, amount = sp.mutez(1000000), now = sp.timestamp(86400))
+
+        # Queued wXTZ is moved to Securities, which needs it unlocked and approved
+        scenario += token.unlockFunds(address = alice.address).run(sender = alice, now = sp.timestamp(86400 + 5))
+        scenario += token.approve(spender = options.address, value = 5000000).run(sender = alice, now = sp.timestamp(86400 + 5))
+        scenario += options.QueueWithdraw(amount = 0).run(sender = alice, now = sp.timestamp(86400 + 10), valid = False)
+        scenario += options.QueueWithdraw(amount = 5000000).run(sender = alice, now = sp.timestamp(86400 + 10))
+        scenario += options.UpdateEpochMode(enabled = False, length = 0).run(sender = admin, now = sp.timestamp(86400 + 10), valid = False)
+
+        scenario += options.SettleEpoch(limit = 10).run(sender = alice, now = sp.timestamp(2 * 86400 + 2))
+        scenario.verify(options.data.Payouts[alice.address] == 3000000)
+        scenario.verify(options.data.WithdrawCursor.head == 0)
+        scenario.verify(options.data.WithdrawQueue[0].amount == 2000000)
+        scenario.verify(options.data.DepositCursor.head == 3)
+        scenario.verify(~options.data.EpochSettlement.active)
+
+    @sp.add_test(name = "Premium Surface")
+    def test():
+
+        scenario = sp.test_scenario()
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        writer = sp.test_account("Writer")
+        desk = sp.test_account("Desk")
+
+        scenario.h1("Premium Surface")
+
+        oracle, token, options = deploy(scenario, admin)
+
+        scenario += oracle.feedData(price=400).run(sender=admin)
+        scenario += options.ContractWriterMint(amount=1000000000).run(sender=writer, amount = sp.tez(1000))
+
+        # 7-day premiums at 100 and 105 percent moneyness; the 110 percent bucket is removed
+        surface = [sp.record(duration = 7, bucket = 20, premium = 60000), sp.record(duration = 7, bucket = 21, premium = 40000), sp.record(duration = 7, bucket = 22, premium = 0)]
+        scenario += options.UpdatePremiumSurface(surface).run(sender = desk, valid = False)
+        scenario += options.UpdatePremiumSurface(surface).run(sender = admin)
+        scenario.verify(~options.data.PremiumSurface.contains(sp.pair(7, 22)))
+
+        scenario.h2("Strike between two buckets")
+        scenario += options.PurchaseCallOption(price = 410, duration = 7, order = 2, amount = 200000).run(sender = desk, amount = sp.mutez(200000))
+        scenario.verify(options.data.CallOption[sp.pair(desk.address, 0)].premium == 100000)
+
+        scenario.h2("Strikes outside the surface")
+        scenario += options.PurchaseCallOption(price = 440, duration = 7, order = 1, amount = 200000).run(sender = desk, amount = sp.mutez(200000), valid = False)
+        scenario += options.PurchaseCallOption(price = 100, duration = 7, order = 1, amount = 200000).run(sender = desk, amount = sp.mutez(200000), valid = False)
+
+    @sp.add_test(name = "Pool Snapshot")
+    def test():
+
+        scenario = sp.test_scenario()
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        writer = sp.test_account("Writer")
+        desk = sp.test_account("Desk")
+
+        scenario.h1("Pool Snapshot")
+
+        oracle, token, options = deploy(scenario, admin)
+
+        scenario += oracle.feedData(price=400).run(sender=admin)
+        scenario += options.ContractWriterMint(amount=1000000000).run(sender=writer, amount = sp.tez(1000))
+        scenario.verify(options.getPoolSnapshot().sharePrice == 1000000)
+
+        scenario.h2("Open position")
+        scenario += options.PurchaseCallOption(price = 400, duration = 7, order = 100, amount = 4000000).run(sender = desk, amount = sp.mutez(4000000))
+        scenario.verify(options.getPoolSnapshot().freeLiquidity == 900000000)
+        scenario.verify(options.getPoolSnapshot().withdrawableLiquidity == 900000000)
+        scenario.verify(options.getPoolSnapshot().utilization == 1000)
+        scenario.verify(options.getOpenInterest(7) == 100)
+        scenario.verify(options.getQuote(sp.record(strike = 400, duration = 7, order = 2)).total == 80000)
+
+        scenario.h2("Exercised position")
+        scenario += oracle.feedData(price=600).run(sender=admin)
+        scenario += options.ExerciseCallOption(id = 0).run(sender = desk)
+        scenario.verify(options.getOpenInterest(7) == 0)
+        scenario.verify(options.data.poolValue == options.data.totalSupply + options.data.WithdrawFund)
+        scenario.verify(options.getPoolSnapshot().sharePrice == 969766)
+        scenario.verify(options.getPoolSnapshot().utilization == 0)
+        scenario.verify(options.getPoolSnapshot().freeLiquidity == options.data.totalSupply)
+        scenario.verify(options.getPoolSnapshot().withdrawableLiquidity == options.data.poolValue)
+        scenario.verify(options.data.WithdrawFund > 0)
+
+        scenario.h2("Series open interest")
+        scenario += options.PurchaseSeries(price = 600, duration = 7, order = 10, amount = 400000).run(sender = desk, amount = sp.mutez(400000))
+        scenario.verify(options.getPoolSnapshot().seriesOpenInterest == 10)
+        scenario.verify(options.getOpenInterest(7) == 0)
+        scenario += options.FreeSeries(token_id = 0).run(sender = desk, now = sp.timestamp(8*86400))
+        scenario.verify(options.getPoolSnapshot().seriesOpenInterest == 0)
+
+    sp.add_compilation_target("USDOracle", USDOracle(sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")))
+    sp.add_compilation_target("Securities", Securities(sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF"), sp.address("KT1TeegbL5HrPqHivCq7Cg4Ph4y1TciFEHTm"), sp.address("KT19qoEwvhrH7XnFkbhJnKCr33ywomStTt2g")))
@@ -0,0 +1,106 @@
+# Compiles the SmartPy compilation targets of a contract file to Michelson
+#
+# Compiled targets are cached under CALLOPTIONS_CACHE by the hash of the file, the local files it imports
+# and the SmartPy CLI, so every revision is compiled once however many benchmarks and scenario runs use it.
+
+import glob
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+SMARTPY = os.environ.get("SMARTPY_CLI", os.path.expanduser("~/smartpy-cli/SmartPy.sh"))
+
+CACHE = os.environ.get("CALLOPTIONS_CACHE", os.path.expanduser("~/.cache/calloptions"))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FILE_IMPORT = re.compile(r'import_script_from_url\("file:([^"]+)"\)')
+PACKAGE_IMPORT = re.compile(r"^from (\w+)\.(\w+) import", re.M)
+
+
+def read(path, rev = None):
+    if rev:
+        return subprocess.run(["git", "show", "%s:%s" % (rev, path)], cwd = ROOT, check = True, capture_output = True, text = True).stdout
+    with open(os.path.join(ROOT, path)) as f:
+        return f.read()
+
+
+def sources(source, rev = None):
+    # {path: text} of a file and the local files it pulls in: SmartPy file: imports and modules of the repo's packages
+    found = {}
+    queue = [source]
+
+    while queue:
+        path = queue.pop()
+        if path in found:
+            continue
+        try:
+            found[path] = read(path, rev)
+        except (OSError, subprocess.CalledProcessError):
+            if path == source:
+                raise
+            continue
+        queue.extend(FILE_IMPORT.findall(found[path]))
+        queue.extend(os.path.join(package, module + ".py") for package, module in PACKAGE_IMPORT.findall(found[path]))
+
+    return found
+
+
+def source_hash(source, rev = None):
+    digest = hashlib.sha256()
+    digest.update(os.path.realpath(SMARTPY).encode())
+    if os.path.exists(SMARTPY):
+        digest.update(str(os.stat(os.path.realpath(SMARTPY)).st_mtime).encode())
+    for path, text in sorted(sources(source, rev).items()):
+        digest.update(path.encode())
+        digest.update(text.encode())
+    return digest.hexdigest()[:16]
+
+
+def checkout(source, rev):
+    # the contract file and its local imports as of a git revision, to benchmark an older layout against the working tree
+    directory = tempfile.mkdtemp(prefix = "calloptions-%s-" % rev)
+    for path, text in sources(source, rev).items():
+        os.makedirs(os.path.dirname(os.path.join(directory, path)), exist_ok = True)
+        with open(os.path.join(directory, path), "w") as f:
+            f.write(text)
+    return directory
+
+
+def load(out_dir):
+    targets = {}
+    for code_path in glob.glob(os.path.join(out_dir, "*", "*_contract.tz")):
+        name = os.path.basename(os.path.dirname(code_path))
+        with open(code_path) as f:
+            code = f.read()
+        with open(code_path.replace("_contract.tz", "_storage.tz")) as f:
+            storage = f.read()
+        targets[name] = (code, storage)
+    return targets
+
+
+def compile_targets(source, out_dir = None, rev = None, cache = True):
+    # returns {target name: (contract code, initial storage)}
+    cached = os.path.join(CACHE, "compile", "%s-%s" % (os.path.splitext(os.path.basename(source))[0], source_hash(source, rev)))
+    if cache and os.path.isdir(cached):
+        return load(cached)
+
+    out_dir = out_dir or tempfile.mkdtemp(prefix = "calloptions-compile-")
+    directory = checkout(source, rev) if rev else ROOT
+    subprocess.run([SMARTPY, "compile", os.path.join(directory, source), out_dir], cwd = directory, check = True, capture_output = True)
+
+    if cache:
+        # copied next to the cache entry and renamed into place, so concurrent compiles of one hash don't collide
+        os.makedirs(os.path.dirname(cached), exist_ok = True)
+        staging = tempfile.mkdtemp(prefix = "staging-", dir = os.path.dirname(cached))
+        shutil.copytree(out_dir, os.path.join(staging, "targets"))
+        try:
+            os.rename(os.path.join(staging, "targets"), cached)
+        except OSError:
+            pass
+        shutil.rmtree(staging, ignore_errors = True)
+
+    return load(out_dir)
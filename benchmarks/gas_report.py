@@ -0,0 +1,437 @@
+# Gas and storage benchmark for USDOracle, Securities and FA12
+#
+# Every load deploys the three contracts into a fresh octez mockup, drives them to the load size and
+# records, for each entry point call, the consumed gas, the storage size of the called contract and its
+# storage diff in bytes. Results are written as JSON so two revisions can be compared:
+#
+#   python -m benchmarks.gas_report run -o before.json
+#   python -m benchmarks.gas_report run -o after.json
+#   python -m benchmarks.gas_report compare before.json after.json
+#
+# --rev benchmarks the contracts as of a git revision, e.g. lazy entry points against the commit before them:
+#
+#   python -m benchmarks.gas_report run --rev <commit>~1 -o eager.json
+#   python -m benchmarks.gas_report run -o lazy.json
+#   python -m benchmarks.gas_report compare eager.json lazy.json
+#
+# The options load records a single PurchaseCallOption and a PurchaseCallOptionBatch of size orders; gas per
+# order at batch sizes 1, 10 and 50 is the batch row's consumed gas divided by its size.
+#
+# The token load records a single transfer and a transferBatch of size txs from one holder; gas per transfer
+# at batch sizes 1, 10 and 100 is the batch row's consumed gas divided by its size.
+#
+# The positions load records the 1st and the 100th PurchaseCallOption from one address, whose gas should match;
+# its paid_storage_diff per purchase is the byte cost of one CallOption entry, to compare storage layouts with --rev.
+#
+# The premiums load uploads that many points of a Black-Scholes surface with UpdatePremiumSurface, then
+# records a purchase at a strike on a bucket boundary and one interpolated between two buckets; with --rev
+# the same purchases measure the pricing it replaced.
+#
+# Origination rows hold the contract's full storage size, code and lazy entry points included.
+#
+# Expiry-dependent paths (FreeSecurity, SweepExpired, European settlement, series, epochs, matured unlocks)
+# move the mockup clock past the expiry with Mockup.advance. The lockups load mints one lockup bucket per
+# day under a 60-day lockup, so its sizes are the number of buckets the holder has pending.
+#
+# Calls that fail are recorded with their error.
+
+import argparse
+import json
+import subprocess
+import sys
+
+from benchmarks import michelson as m
+from benchmarks.compile import ROOT, compile_targets
+from benchmarks.mockup import CallFailed, Mockup
+from simulator.surface import generate, points
+
+# addresses the compilation targets are built with, replaced by the mockup's at origination; older
+# revisions hardcode ORACLE and TOKEN in the code rather than in the Securities storage
+ADMIN = "tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF"
+ORACLE = "KT1TeegbL5HrPqHivCq7Cg4Ph4y1TciFEHTm"
+TOKEN = "KT19qoEwvhrH7XnFkbhJnKCr33ywomStTt2g"
+
+LOADS = {
+    "pool": [10, 1000, 100000],
+    "options": [1, 10, 50],
+    "lockups": [1, 10, 60],
+    "approvals": [0, 10, 50],
+    "positions": [100],
+    "premiums": [0, 124],
+    "expiry": [1, 10, 100],
+    "settlement": [1, 10, 100],
+    "series": [1, 10, 100],
+    "epochs": [1, 10, 100],
+    "oracle": [1, 3, 10],
+    "token": [1, 10, 100],
+    "admin": [1],
+}
+
+DAY = 86400
+
+
+class Bench:
+
+    def __init__(self, targets, load):
+        self.targets = targets
+        self.load = load
+        self.results = []
+        self.sizes = {}
+        self.mockup = Mockup()
+
+    def record(self, contract, entrypoint, receipt = None, error = None):
+        row = dict(contract = contract, entrypoint = entrypoint, load = self.load)
+        if error is not None:
+            row["error"] = error
+        else:
+            previous = self.sizes.get(contract, 0)
+            self.sizes[contract] = receipt.storage_size
+            row.update(gas = receipt.gas, storage_size = receipt.storage_size, storage_diff = receipt.storage_size - previous, paid_storage_diff = receipt.paid_storage_diff)
+        self.results.append(row)
+
+    def deploy(self):
+        admin = self.mockup.address("bootstrap1")
+        addresses = {}
+
+        for name in ["USDOracle", "FA12", "Securities"]:
+            code, storage = [text.replace(ORACLE, addresses.get("USDOracle", ORACLE)).replace(TOKEN, addresses.get("FA12", TOKEN)) for text in self.targets[name]]
+            addresses[name], receipt = self.mockup.originate(name, code, storage.replace(ADMIN, admin))
+            self.record(name, "origination", receipt)
+
+        self.call("FA12", "ValidatorOperation", m.record(Operation = m.nat(1), address = m.address(addresses["Securities"])))
+        # revisions whose purchases still called back through the Oracle need it to know the Securities contract
+        if "%changeSecurities" in self.targets["USDOracle"][0]:
+            self.call("USDOracle", "changeSecurities", m.address(addresses["Securities"]))
+
+    def call(self, contract, entrypoint, arg, sender = "bootstrap1", amount = 0, measure = True):
+        try:
+            receipt = self.mockup.call(contract, entrypoint, arg, sender = sender, amount = m.tez(amount))
+        except CallFailed as e:
+            if measure:
+                self.record(contract, entrypoint, error = str(e).splitlines()[-1])
+            return None
+        if measure:
+            self.record(contract, entrypoint, receipt)
+        else:
+            self.sizes[contract] = receipt.storage_size
+        return receipt
+
+
+def purchase(amount = 50000, duration = 7, order = 1, price = 400):
+    return m.record(amount = m.nat(amount), duration = m.nat(duration), order = m.nat(order), price = m.nat(price))
+
+
+def start_of_day(bench):
+    # moves the clock to one hour into the next day, so positions bought now expire on a known day
+    bench.mockup.advance(DAY - bench.mockup.now() % DAY + 3600)
+    return bench.mockup.now() // DAY
+
+
+def load_pool(bench, size):
+    holder = bench.mockup.address("bootstrap2")
+
+    bench.call("FA12", "ModifyLockup", m.nat(0), measure = False)
+    bench.call("USDOracle", "feedData", m.nat(400))
+    bench.call("Securities", "ContractWriterMint", m.nat(size * 1000000), sender = "bootstrap2", amount = size * 1000000)
+    bench.call("Securities", "ContractWriterMint", m.nat(1000000), sender = "bootstrap3", amount = 1000000)
+
+    # the burnt wXTZ has to be unlocked, and unlockFunds only releases buckets older than the lockup
+    bench.mockup.advance(DAY)
+    bench.call("FA12", "unlockFunds", m.address(holder), sender = "bootstrap2", measure = False)
+    bench.call("Securities", "ContractWriterBurn", m.nat(1000), sender = "bootstrap2")
+
+
+def load_options(bench, size):
+    bench.call("USDOracle", "feedData", m.nat(400))
+    bench.call("Securities", "ContractWriterMint", m.nat(100000 * 1000000), sender = "bootstrap2", amount = 100000 * 1000000, measure = False)
+
+    for i in range(size):
+        bench.call("Securities", "PurchaseCallOption", purchase(), sender = "bootstrap3", amount = 50000, measure = i == size - 1)
+
+    bench.call("Securities", "PurchaseCallOptionBatch", m.seq([purchase()] * size), sender = "bootstrap4", amount = 50000 * size)
+
+    bench.call("USDOracle", "feedData", m.nat(600))
+    bench.call("Securities", "ExerciseCallOption", m.nat(0), sender = "bootstrap3")
+
+
+def load_positions(bench, size):
+    bench.call("USDOracle", "feedData", m.nat(400))
+    bench.call("Securities", "ContractWriterMint", m.nat(100000 * 1000000), sender = "bootstrap2", amount = 100000 * 1000000, measure = False)
+
+    for i in range(size):
+        bench.load = dict(positions = size, nth = i + 1)
+        bench.call("Securities", "PurchaseCallOption", purchase(), sender = "bootstrap3", amount = 50000, measure = i in (0, size - 1))
+
+
+def load_premiums(bench, size):
+    bench.call("USDOracle", "feedData", m.nat(400))
+    bench.call("Securities", "ContractWriterMint", m.nat(100000 * 1000000), sender = "bootstrap2", amount = 100000 * 1000000, measure = False)
+
+    if size:
+        surface = points(generate(0.8))[:size]
+        bench.call("Securities", "UpdatePremiumSurface", m.seq([m.record(bucket = m.nat(p["bucket"]), duration = m.nat(p["duration"]), premium = m.nat(p["premium"])) for p in surface]))
+
+    for strike in [400, 410]:
+        bench.load = dict(points = size, strike = strike)
+        bench.call("Securities", "PurchaseCallOption", purchase(amount = 200000, price = strike), sender = "bootstrap3", amount = 200000)
+
+
+def load_lockups(bench, size):
+    holder = bench.mockup.address("bootstrap2")
+
+    # mints of one day share a bucket, so every mint goes out on its own day and none matures during the load
+    bench.call("FA12", "ModifyLockup", m.nat(60), measure = False)
+
+    for i in range(size):
+        if i:
+            bench.mockup.advance(DAY)
+        bench.call("FA12", "mint", m.record(address = m.address(holder), value = m.nat(100)), measure = i == size - 1)
+
+    bench.mockup.advance(61 * DAY)
+    bench.call("FA12", "unlockFunds", m.address(holder), sender = "bootstrap2")
+
+
+def load_approvals(bench, size):
+    holder = bench.mockup.address("bootstrap2")
+    receiver = bench.mockup.address("bootstrap3")
+
+    bench.call("FA12", "ModifyLockup", m.nat(0), measure = False)
+    bench.call("FA12", "mint", m.record(address = m.address(holder), value = m.nat(100000)), measure = False)
+    bench.mockup.advance(DAY)
+    bench.call("FA12", "unlockFunds", m.address(holder), sender = "bootstrap2", measure = False)
+
+    for i in range(size):
+        spender = bench.mockup.address("spender%d" % i)
+        bench.call("FA12", "approve", m.layout(("spender", "value"), spender = m.address(spender), value = m.nat(10)), sender = "bootstrap2", measure = i == size - 1)
+
+    bench.call("FA12", "transfer", m.layout(("from_", ("to_", "value")), from_ = m.address(holder), to_ = m.address(receiver), value = m.nat(10)), sender = "bootstrap2")
+
+    txs = [m.layout(("to_", "value"), to_ = m.address(receiver), value = m.nat(10))] * 10
+    bench.call("FA12", "transferBatch", m.seq([m.layout(("from_", "txs"), from_ = m.address(holder), txs = m.seq(txs))]), sender = "bootstrap2")
+
+
+def load_expiry(bench, size):
+    holder = bench.mockup.address("bootstrap3")
+
+    bench.call("USDOracle", "feedData", m.nat(400))
+    bench.call("Securities", "ContractWriterMint", m.nat(100000 * 1000000), sender = "bootstrap2", amount = 100000 * 1000000, measure = False)
+
+    day = start_of_day(bench) + 1
+    bench.call("Securities", "PurchaseCallOptionBatch", m.seq([purchase(duration = 1)] * size), sender = "bootstrap3", amount = 50000 * size, measure = False)
+
+    # one position freed on its own, the rest of the cohort swept in one call
+    bench.mockup.advance(2 * DAY)
+    bench.call("Securities", "FreeSecurity", m.record(address = m.address(holder), id = m.nat(0)), sender = "bootstrap4")
+    bench.call("Securities", "SweepExpired", m.record(day = m.nat(day), limit = m.nat(size)), sender = "bootstrap4")
+
+
+def load_settlement(bench, size):
+    holder = bench.mockup.address("bootstrap3")
+
+    bench.call("USDOracle", "feedData", m.nat(400))
+    bench.call("Securities", "ContractWriterMint", m.nat(100000 * 1000000), sender = "bootstrap2", amount = 100000 * 1000000, measure = False)
+    bench.call("Securities", "ChangeSettlementMode", m.unit)
+
+    day = start_of_day(bench) + 1
+    bench.call("Securities", "PurchaseCallOptionBatch", m.seq([purchase(duration = 1, price = 380)] * size), sender = "bootstrap3", amount = 50000 * size, measure = False)
+
+    # the snapshot reads the price live at the end of the expiry day, so it is fed just before the day ends
+    bench.mockup.advance((day + 1) * DAY - 600 - bench.mockup.now())
+    bench.call("USDOracle", "feedData", m.nat(500), measure = False)
+    bench.mockup.advance(1200)
+    bench.call("Securities", "SettleExpiry", m.nat(day), sender = "bootstrap4")
+    bench.call("Securities", "ClaimSettlement", m.seq([m.pair(m.address(holder), m.nat(i)) for i in range(size)]), sender = "bootstrap4")
+    bench.call("Securities", "WithdrawPayout", m.unit, sender = "bootstrap3")
+
+
+def load_series(bench, size):
+    holder = bench.mockup.address("bootstrap3")
+    receiver = bench.mockup.address("bootstrap4")
+
+    bench.call("USDOracle", "feedData", m.nat(400))
+    bench.call("Securities", "ContractWriterMint", m.nat(100000 * 1000000), sender = "bootstrap2", amount = 100000 * 1000000, measure = False)
+    start_of_day(bench)
+
+    # every purchase lands in series 0: same strike bucket, same expiry day
+    for i in range(size):
+        bench.call("Securities", "PurchaseSeries", purchase(), sender = "bootstrap3", amount = 50000, measure = i == size - 1)
+
+    operator = m.layout(("owner", ("operator", "token_id")), owner = m.address(holder), operator = m.address(receiver), token_id = m.nat(0))
+    bench.call("Securities", "update_series_operators", m.seq([m.left(operator)]), sender = "bootstrap3")
+
+    txs = [m.layout(("to_", ("token_id", "amount")), to_ = m.address(receiver), token_id = m.nat(0), amount = m.nat(1))]
+    bench.call("Securities", "transferSeries", m.seq([m.layout(("from_", "txs"), from_ = m.address(holder), txs = m.seq(txs))]), sender = "bootstrap4")
+
+    bench.call("USDOracle", "feedData", m.nat(600), measure = False)
+    bench.call("Securities", "ExerciseSeries", m.record(amount = m.nat(1), token_id = m.nat(0)), sender = "bootstrap4")
+
+    bench.mockup.advance(9 * DAY)
+    bench.call("Securities", "FreeSeries", m.nat(0), sender = "bootstrap5")
+    bench.call("Securities", "ClaimSeries", m.nat(0), sender = "bootstrap3")
+
+
+def load_epochs(bench, size):
+    holder = bench.mockup.address("bootstrap2")
+    securities = bench.mockup.addresses["Securities"]
+
+    bench.call("FA12", "ModifyLockup", m.nat(0), measure = False)
+    bench.call("Securities", "UpdateEpochMode", m.record(enabled = m.boolean(True), length = m.nat(DAY)))
+
+    bench.load = dict(epochs = size, queue = "deposits")
+    for i in range(size):
+        bench.call("Securities", "QueueDeposit", m.nat(1000000), sender = "bootstrap2", amount = 1000000, measure = i == size - 1)
+
+    bench.mockup.advance(DAY)
+    bench.call("Securities", "SettleEpoch", m.nat(size), sender = "bootstrap4")
+
+    # the minted wXTZ is queued back for withdrawal once its lockup has passed
+    bench.load = dict(epochs = size, queue = "withdrawals")
+    bench.mockup.advance(DAY)
+    bench.call("FA12", "unlockFunds", m.address(holder), sender = "bootstrap2", measure = False)
+    bench.call("FA12", "approve", m.layout(("spender", "value"), spender = m.address(securities), value = m.nat(size * 1000000)), sender = "bootstrap2", measure = False)
+
+    for i in range(size):
+        bench.call("Securities", "QueueWithdraw", m.nat(1000000), sender = "bootstrap2", measure = i == size - 1)
+
+    bench.mockup.advance(DAY)
+    bench.call("Securities", "SettleEpoch", m.nat(size), sender = "bootstrap4")
+    bench.call("Securities", "WithdrawPayout", m.unit, sender = "bootstrap2")
+
+
+def load_oracle(bench, size):
+    oracle = bench.mockup.addresses["USDOracle"]
+    reporters = ["reporter%d" % i for i in range(size)]
+
+    for i, alias in enumerate(reporters):
+        bench.call("USDOracle", "addDataContributor", m.record(Operation = m.nat(1), contributor = m.address(bench.mockup.address(alias))), measure = i == size - 1)
+
+    bench.call("USDOracle", "changeMinContributors", m.nat(size))
+
+    # reports sign sp.pack(sp.record(oracle, round, price)) for the first round
+    reports = []
+    for i, alias in enumerate(reporters):
+        signed = m.record(oracle = m.address(oracle), price = m.nat(400 + i), round = m.nat(1))
+        signature = bench.mockup.sign(alias, signed, "pair address (pair nat nat)")
+        reports.append(m.record(key = m.string(bench.mockup.public_key(alias)), price = m.nat(400 + i), signature = m.string(signature)))
+
+    bench.call("USDOracle", "feedDataBatch", m.seq(reports))
+
+
+def load_token(bench, size):
+    holder = bench.mockup.address("bootstrap2")
+    admin = bench.mockup.address("bootstrap1")
+    receivers = [bench.mockup.address("receiver%d" % i) for i in range(size)]
+
+    bench.call("FA12", "ModifyLockup", m.nat(0), measure = False)
+    bench.call("FA12", "mintBatch", m.seq([m.record(address = m.address(receiver), value = m.nat(100)) for receiver in receivers]))
+
+    bench.call("FA12", "mint", m.record(address = m.address(holder), value = m.nat(100000)), measure = False)
+    bench.mockup.advance(DAY)
+    bench.call("FA12", "unlockFunds", m.address(holder), sender = "bootstrap2", measure = False)
+
+    bench.call("FA12", "transfer", m.layout(("from_", ("to_", "value")), from_ = m.address(holder), to_ = m.address(receivers[0]), value = m.nat(10)), sender = "bootstrap2")
+    txs = m.seq([m.layout(("to_", "value"), to_ = m.address(receiver), value = m.nat(10)) for receiver in receivers])
+    bench.call("FA12", "transferBatch", m.seq([m.layout(("from_", "txs"), from_ = m.address(holder), txs = txs)]), sender = "bootstrap2")
+
+    bench.call("FA12", "burn", m.record(address = m.address(holder), value = m.nat(100)))
+
+    bench.call("FA12", "setPause", m.boolean(True))
+    bench.call("FA12", "setPause", m.boolean(False), measure = False)
+    bench.call("FA12", "setAdministrator", m.address(admin))
+
+
+def load_admin(bench, size):
+    baker = bench.mockup.address("bootstrap5")
+
+    bench.call("USDOracle", "feedData", m.nat(400))
+    bench.call("Securities", "ContractWriterMint", m.nat(100000 * 1000000), sender = "bootstrap2", amount = 100000 * 1000000, measure = False)
+    bench.call("Securities", "default", m.unit, sender = "bootstrap3", amount = 1000000)
+    bench.call("Securities", "delegate", m.some(m.string(baker)))
+
+    bench.call("Securities", "UpdatePriceAge", m.nat(600))
+    bench.call("Securities", "UpdateSettlementWindow", m.nat(300))
+
+    bench.call("Securities", "ChangeState", m.unit)
+    bench.call("Securities", "ChangeState", m.unit, measure = False)
+
+    # a purchase leaves the admin fee to withdraw
+    bench.call("Securities", "PurchaseCallOption", purchase(), sender = "bootstrap3", amount = 50000, measure = False)
+    bench.call("Securities", "AdminWithdraw", m.unit)
+
+
+LOADERS = dict(pool = load_pool, options = load_options, lockups = load_lockups, approvals = load_approvals, positions = load_positions, premiums = load_premiums,
+               expiry = load_expiry, settlement = load_settlement, series = load_series, epochs = load_epochs, oracle = load_oracle, token = load_token, admin = load_admin)
+
+
+def revision(rev = None):
+    result = subprocess.run(["git", "rev-parse", "--short", rev or "HEAD"], cwd = ROOT, capture_output = True, text = True)
+    return result.stdout.strip() or None
+
+
+def run(quick = False, rev = None):
+    targets = dict(compile_targets("Call.py", rev = rev), **compile_targets("wXTZ.py", rev = rev))
+    results = []
+
+    for kind, sizes in LOADS.items():
+        for size in sizes[:1] if quick else sizes:
+            bench = Bench(targets, {kind: size})
+            bench.deploy()
+            LOADERS[kind](bench, size)
+            results.extend(bench.results)
+
+    return dict(revision = revision(rev), results = results)
+
+
+def key(row):
+    return (row["contract"], row["entrypoint"], json.dumps(row["load"], sort_keys = True))
+
+
+def compare(before, after, threshold):
+    # prints gas and storage deltas per (contract, entry point, load); returns the rows whose gas grew past threshold percent
+    old = dict((key(row), row) for row in before["results"] if "error" not in row)
+    regressions = []
+
+    for row in after["results"]:
+        previous = old.get(key(row))
+        if previous is None or "error" in row:
+            continue
+        delta = row["gas"] - previous["gas"]
+        percent = 100.0 * delta / previous["gas"] if previous["gas"] else 0.0
+        print("%-10s %-26s %-20s gas %10.3f -> %10.3f (%+.1f%%)  storage %+d bytes" % (row["contract"], row["entrypoint"], key(row)[2], previous["gas"], row["gas"], percent, row["storage_size"] - previous["storage_size"]))
+        if percent > threshold:
+            regressions.append(row)
+
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Gas and storage benchmarks for Call.py and wXTZ.py")
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("-o", "--output", default = "gas_report.json")
+    run_parser.add_argument("--quick", action = "store_true", help = "only the smallest size of every load")
+    run_parser.add_argument("--rev", help = "git revision of Call.py and wXTZ.py to benchmark instead of the working tree")
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type = float, default = 2.0, help = "gas increase in percent reported as a regression")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run(quick = args.quick, rev = args.rev)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 2)
+        return 0
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    return 1 if compare(before, after, args.threshold) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+# Michelson literals for entry point arguments, laid out the way SmartPy compiles them
+# records use SmartPy's default layout: fields sorted by name and split into a balanced tree
+
+def nat(value):
+    return str(value)
+
+def string(value):
+    return '"%s"' % value
+
+address = string
+
+unit = "Unit"
+
+def boolean(value):
+    return "True" if value else "False"
+
+def some(value):
+    return "(Some %s)" % value
+
+def left(value):
+    return "(Left %s)" % value
+
+def right(value):
+    return "(Right %s)" % value
+
+def pair(left, right):
+    return "(Pair %s %s)" % (left, right)
+
+def seq(items):
+    return "{ %s }" % " ; ".join(items)
+
+def tree(items):
+    if len(items) == 1:
+        return items[0]
+    half = len(items) // 2
+    return pair(tree(items[:half]), tree(items[half:]))
+
+def record(**fields):
+    return tree([fields[name] for name in sorted(fields)])
+
+def layout(shape, **fields):
+    # explicit .layout(...) of a record, e.g. layout(("from_", ("to_", "value")), ...)
+    if isinstance(shape, str):
+        return fields[shape]
+    return pair(layout(shape[0], **fields), layout(shape[1], **fields))
+
+def tez(mutez):
+    # octez-client takes transfer amounts in tez
+    return "%d.%06d" % divmod(mutez, 1000000)
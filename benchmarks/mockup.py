@@ -0,0 +1,118 @@
+# Thin wrapper around `octez-client --mode mockup` that originates contracts, sends calls
+# and parses the gas and storage figures out of the operation receipts
+
+import calendar
+import json
+import os
+import re
+import subprocess
+import tempfile
+import time
+
+CLIENT = os.environ.get("OCTEZ_CLIENT", "octez-client")
+
+BOOTSTRAP = ["bootstrap1", "bootstrap2", "bootstrap3", "bootstrap4", "bootstrap5"]
+
+GAS = re.compile(r"Consumed gas: ([0-9.]+)")
+STORAGE_SIZE = re.compile(r"Storage size: ([0-9]+) bytes")
+PAID_DIFF = re.compile(r"Paid storage size diff: ([0-9]+) bytes")
+ORIGINATED = re.compile(r"New contract (KT1[0-9A-Za-z]+) originated")
+PUBLIC_KEY = re.compile(r"Public Key: ([0-9A-Za-z]+)")
+PACKED = re.compile(r"Raw packed data: (0x[0-9a-f]+)")
+SIGNATURE = re.compile(r"Signature: ([0-9A-Za-z]+)")
+
+TIMESTAMP = "%Y-%m-%dT%H:%M:%S"
+
+
+class CallFailed(Exception):
+    pass
+
+
+class Receipt:
+
+    def __init__(self, output):
+        gas = [float(g) for g in GAS.findall(output)]
+        sizes = STORAGE_SIZE.findall(output)
+        paid = PAID_DIFF.findall(output)
+
+        # gas of the call including its internal operations; storage figures of the called contract
+        self.gas = round(sum(gas), 3)
+        self.storage_size = int(sizes[0]) if sizes else None
+        self.paid_storage_diff = int(paid[0]) if paid else 0
+
+
+class Mockup:
+
+    def __init__(self, base_dir = None):
+        self.base_dir = base_dir or tempfile.mkdtemp(prefix = "calloptions-bench-")
+        self.addresses = {}
+        self.client("create", "mockup")
+
+    def client(self, *args):
+        result = subprocess.run([CLIENT, "--mode", "mockup", "--base-dir", self.base_dir] + list(args), capture_output = True, text = True)
+        if result.returncode != 0:
+            raise CallFailed(result.stderr.strip() or result.stdout.strip())
+        return result.stdout
+
+    def address(self, alias):
+        # bootstrap accounts exist already, any other alias is generated on first use
+        if alias not in self.addresses:
+            if alias not in BOOTSTRAP:
+                self.client("gen", "keys", alias)
+            output = self.client("show", "address", alias)
+            self.addresses[alias] = re.search(r"Hash: (tz[0-9A-Za-z]+)", output).group(1)
+        return self.addresses[alias]
+
+    def originate(self, name, code, storage, sender = "bootstrap1"):
+        with tempfile.NamedTemporaryFile("w", suffix = ".tz", delete = False) as f:
+            f.write(code)
+        output = self.client("originate", "contract", name, "transferring", "0", "from", sender, "running", f.name, "--init", storage, "--burn-cap", "50", "--force")
+        os.unlink(f.name)
+        self.addresses[name] = ORIGINATED.search(output).group(1)
+        return self.addresses[name], Receipt(output)
+
+    def call(self, contract, entrypoint, arg, sender = "bootstrap1", amount = "0"):
+        output = self.client("transfer", amount, "from", sender, "to", contract, "--entrypoint", entrypoint, "--arg", arg, "--burn-cap", "50")
+        return Receipt(output)
+
+    def public_key(self, alias):
+        self.address(alias)
+        return PUBLIC_KEY.search(self.client("show", "address", alias)).group(1)
+
+    def sign(self, alias, value, type):
+        # signature by alias of the packed Michelson value, as sp.check_signature(key, signature, sp.pack(value)) expects
+        packed = PACKED.search(self.client("hash", "data", value, "of", "type", type)).group(1)
+        return SIGNATURE.search(self.client("sign", "bytes", packed, "for", alias)).group(1)
+
+    # Clock: the mockup applies every operation on top of the head block saved in mockup/context.json, so the
+    # NOW of a call follows that block's timestamp, and moving it moves the chain clock
+
+    def head(self):
+        path = os.path.join(self.base_dir, "mockup", "context.json")
+        with open(path) as f:
+            context = json.load(f)
+
+        def find(node):
+            if isinstance(node, dict):
+                if isinstance(node.get("shell_header"), dict) and "timestamp" in node["shell_header"]:
+                    return node["shell_header"]
+                for child in node.values():
+                    found = find(child)
+                    if found is not None:
+                        return found
+            return None
+
+        header = find(context)
+        if header is None:
+            raise CallFailed("no head block timestamp in %s" % path)
+        return path, context, header
+
+    def now(self):
+        path, context, header = self.head()
+        return calendar.timegm(time.strptime(header["timestamp"][:19], TIMESTAMP))
+
+    def advance(self, seconds):
+        path, context, header = self.head()
+        header["timestamp"] = time.strftime(TIMESTAMP, time.gmtime(self.now() + seconds)) + "Z"
+        with open(path, "w") as f:
+            json.dump(context, f)
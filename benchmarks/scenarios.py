@@ -0,0 +1,142 @@
+# Parallel, sharded runner for the SmartPy scenarios of Call.py, wXTZ.py and simulator/differential.py
+#
+#   python -m benchmarks.scenarios                       every scenario, one process per CPU
+#   python -m benchmarks.scenarios --shard 1/3 -j 4      the second of three CI shards, 4 processes
+#   python -m benchmarks.scenarios -k Epoch -o run.json  scenarios whose name contains Epoch, timings as JSON
+#
+# The compilation targets are compiled first, once per source hash (see benchmarks.compile), so a broken
+# contract fails before any scenario starts and the gas benchmarks reuse the same Michelson.
+#
+# Every scenario runs in its own SmartPy process on a copy of its file in which the @sp.add_test decorators
+# of the other scenarios are disabled, so the scenarios of one file run in parallel; the copy is run from the
+# repository root so file: imports resolve as usual. A passing scenario is cached under the hash of its file
+# and local imports and reported as cached until one of them changes; --no-cache runs everything.
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.compile import CACHE, ROOT, SMARTPY, compile_targets, read, source_hash
+
+FILES = ["Call.py", "wXTZ.py", os.path.join("simulator", "differential.py")]
+
+TARGETS = ["Call.py", "wXTZ.py"]
+
+TEST = re.compile(r'^(?P<indent>[ \t]*)@sp\.add_test\(name\s*=\s*"(?P<name>[^"]+)"[^\n]*\)[ \t]*$', re.M)
+
+
+def discover(files = FILES):
+    # [(file, scenario name)] in file order
+    return [(path, match.group("name")) for path in files for match in TEST.finditer(read(path))]
+
+
+def isolate(text, name):
+    # the file with every scenario but name turned into a plain function; line numbers are unchanged
+    return TEST.sub(lambda match: match.group(0) if match.group("name") == name else match.group("indent") + "@(lambda test: test)", text)
+
+
+def shard(scenarios, index, count):
+    return [scenario for i, scenario in enumerate(scenarios) if i % count == index]
+
+
+def marker(path, name):
+    key = hashlib.sha256(("%s\0%s\0%s" % (path, name, source_hash(path))).encode()).hexdigest()[:24]
+    return os.path.join(CACHE, "scenarios", key)
+
+
+def run_scenario(path, name, cache = True):
+    done = marker(path, name)
+    if cache and os.path.exists(done):
+        return dict(file = path, name = name, status = "cached", seconds = 0.0)
+
+    directory = tempfile.mkdtemp(prefix = "calloptions-scenario-")
+    script = os.path.join(directory, os.path.basename(path))
+    with open(script, "w") as f:
+        f.write(isolate(read(path), name))
+
+    started = time.perf_counter()
+    result = subprocess.run([SMARTPY, "test", script, os.path.join(directory, "output")], cwd = ROOT, capture_output = True, text = True)
+    seconds = round(time.perf_counter() - started, 3)
+
+    row = dict(file = path, name = name, status = "passed" if result.returncode == 0 else "failed", seconds = seconds)
+
+    if result.returncode == 0:
+        shutil.rmtree(directory, ignore_errors = True)
+        if cache:
+            os.makedirs(os.path.dirname(done), exist_ok = True)
+            open(done, "w").close()
+    else:
+        row["output"] = "\n".join((result.stdout + result.stderr).strip().splitlines()[-20:])
+        row["directory"] = directory
+
+    return row
+
+
+def compile_all(out_dir = None, cache = True):
+    # {target name: seconds spent compiling its file, 0 when cached}
+    timings = {}
+    for path in TARGETS:
+        started = time.perf_counter()
+        targets = compile_targets(path, cache = cache)
+        seconds = round(time.perf_counter() - started, 3)
+
+        for target, (code, storage) in targets.items():
+            timings[target] = seconds
+            if out_dir:
+                os.makedirs(os.path.join(out_dir, target), exist_ok = True)
+                with open(os.path.join(out_dir, target, "%s_contract.tz" % target), "w") as f:
+                    f.write(code)
+                with open(os.path.join(out_dir, target, "%s_storage.tz" % target), "w") as f:
+                    f.write(storage)
+    return timings
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Run the SmartPy scenarios in parallel")
+    parser.add_argument("-j", "--jobs", type = int, default = os.cpu_count(), help = "scenario processes run at once")
+    parser.add_argument("--shard", default = "0/1", help = "index/count: run every count-th scenario starting at index")
+    parser.add_argument("-k", dest = "keyword", help = "only scenarios whose name contains this")
+    parser.add_argument("--no-cache", action = "store_true", help = "recompile and rerun scenarios that passed before")
+    parser.add_argument("--compiled", help = "directory to write the compiled Michelson to")
+    parser.add_argument("-o", "--output", help = "JSON file for the per-scenario timings")
+    args = parser.parse_args(argv)
+
+    cache = not args.no_cache
+    index, count = [int(part) for part in args.shard.split("/")]
+
+    started = time.perf_counter()
+    compiled = compile_all(args.compiled, cache)
+
+    scenarios = [s for s in discover() if not args.keyword or args.keyword in s[1]]
+    scenarios = shard(scenarios, index, count)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers = args.jobs) as pool:
+        futures = [pool.submit(run_scenario, path, name, cache) for path, name in scenarios]
+        rows = [future.result() for future in futures]
+
+    wall = round(time.perf_counter() - started, 3)
+
+    for row in sorted(rows, key = lambda row: -row["seconds"]):
+        print("%-8s %8.2fs  %-30s %s" % (row["status"], row["seconds"], row["name"], row["file"]))
+        if row["status"] == "failed":
+            print("    " + row["output"].replace("\n", "\n    "))
+            print("    output kept in %s" % row["directory"])
+    print("%d scenarios, %d failed, %.2fs wall, %.2fs in scenarios" % (len(rows), sum(row["status"] == "failed" for row in rows), wall, sum(row["seconds"] for row in rows)))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(dict(compiled = compiled, scenarios = rows, wall = wall, shard = args.shard), f, indent = 2)
+
+    return 1 if any(row["status"] == "failed" for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
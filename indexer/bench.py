@@ -0,0 +1,120 @@
+# Replay benchmark: indexes a synthetic stream of contract events from a JSONL file
+#
+#   python -m indexer.bench --events 1000000
+#
+# The stream is written lazily to a temporary replay file and indexed from it; peak RSS is sampled after
+# writing and after indexing, so its growth shows whether memory stays bounded by the commit batch rather
+# than by the number of events.
+
+import argparse
+import collections
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from indexer.sources import replay, write_replay
+from indexer.store import Indexer
+
+HOLDERS = 2000
+OPEN = 10000
+
+
+def synthetic(count, seed = 0):
+    # purchases and pool snapshots, exercises and expiries of open positions, Oracle
+    # rounds and wXTZ mints, transfers and unlocks, in contract event order
+    rng = random.Random(seed)
+    opened = collections.deque()
+    counts = collections.Counter()
+    pool = dict(totalSupply = 10 ** 12, LockedSupply = 0, WithdrawFund = 0, tokenMinted = 10 ** 12, adminAccount = 0)
+    price, round, now = 400, 0, 0
+    seq = 0
+
+    def event(contract, tag, **payload):
+        return dict(seq = seq, contract = contract, tag = tag, payload = payload)
+
+    while seq < count:
+        seq += 1
+        now += 30
+        kind = rng.random()
+        holder = "tz1holder%04d" % rng.randrange(HOLDERS)
+
+        # past OPEN open positions a purchase becomes a close, so the generator's own state stays bounded
+        if 0.05 <= kind < 0.45 and len(opened) >= OPEN:
+            kind = 0.5
+
+        if kind < 0.05:
+            round += 1
+            price = max(1, price + rng.randint(-5, 5))
+            yield event("USDOracle", "price", price = price, timestamp = now, round = round)
+        elif kind < 0.45 or not opened:
+            options = rng.randint(1, 10)
+            key = (holder, counts[holder])
+            counts[holder] += 1
+            opened.append((key, options))
+            pool["LockedSupply"] += options * 1000000
+            yield event("Securities", "purchase", owner = key[0], id = key[1], strike = price + rng.randint(-50, 50), options = options, expiry = now + 86400 * rng.choice([1, 7, 14, 21]), premium = options * 30000)
+        elif kind < 0.70:
+            (owner, id), options = opened.popleft() if rng.random() < 0.5 else opened.pop()
+            pool["LockedSupply"] -= options * 1000000
+            if rng.random() < 0.3:
+                yield event("Securities", "exercise", owner = owner, id = id, price = price, payout = options * 100000)
+            else:
+                yield event("Securities", "expire", owner = owner, id = id, reward = options * 1000)
+        elif kind < 0.85:
+            pool["totalSupply"] += rng.randint(0, 10 ** 6)
+            pool["WithdrawFund"] += rng.randint(0, 10 ** 5)
+            yield event("Securities", "pool", **pool)
+        elif kind < 0.93:
+            yield event("FA12", "mint", address = holder, value = rng.randint(1, 10 ** 6))
+        elif kind < 0.98:
+            yield event("FA12", "transfer", from_ = holder, to_ = "tz1holder%04d" % rng.randrange(HOLDERS), value = rng.randint(1, 1000))
+        else:
+            yield event("FA12", "unlock", address = holder, amount = rng.randint(1, 1000))
+
+
+def peak_rss():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Replay a synthetic event stream into the SQLite indexer")
+    parser.add_argument("--events", type = int, default = 1000000)
+    parser.add_argument("--commit-every", type = int, default = 10000)
+    parser.add_argument("--dir", help = "directory for the replay file and the database, a temporary one by default")
+    args = parser.parse_args(argv)
+
+    directory = args.dir or tempfile.mkdtemp(prefix = "calloptions-indexer-")
+    path = os.path.join(directory, "events.jsonl")
+    database = os.path.join(directory, "index.sqlite")
+
+    started = time.perf_counter()
+    write_replay(synthetic(args.events), path)
+    written = time.perf_counter() - started
+    rss_written = peak_rss()
+
+    indexer = Indexer(database, commit_every = args.commit_every)
+    started = time.perf_counter()
+    applied = indexer.index(replay(path))
+    elapsed = time.perf_counter() - started
+
+    print(dict(
+        events = applied,
+        write_seconds = round(written, 2),
+        index_seconds = round(elapsed, 2),
+        events_per_second = round(applied / elapsed),
+        peak_rss_kb_after_write = rss_written,
+        peak_rss_kb_after_index = peak_rss(),
+        open_options = sum(indexer.open_interest().values()),
+        share_price = round(indexer.share_price(), 6),
+        database_bytes = os.path.getsize(database),
+    ))
+    indexer.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
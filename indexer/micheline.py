@@ -0,0 +1,156 @@
+# Reads Micheline as octez-client prints it and decodes event payloads against their type
+#
+# parse() turns text into nodes: ints, strings, lists for sequences and Prim(name, args, annots) for
+# everything else. decode() walks a value along its type and returns plain Python values; records, i.e. pair
+# types with %field annotations, become dicts keyed by field name whatever their tree layout.
+
+import datetime
+import re
+
+TOKEN = re.compile(r'\s*(?:(?P<open>[({])|(?P<close>[)}])|(?P<semi>;)|(?P<string>"(?:[^"\\]|\\.)*")|(?P<bytes>0x[0-9a-fA-F]*)|(?P<int>-?[0-9]+)|(?P<annot>[%@:][A-Za-z0-9_.%@]*)|(?P<prim>[A-Za-z_][A-Za-z0-9_]*))')
+
+
+class Prim:
+
+    __slots__ = ("name", "args", "annots")
+
+    def __init__(self, name, args = (), annots = ()):
+        self.name = name
+        self.args = list(args)
+        self.annots = list(annots)
+
+    def field(self):
+        for annot in self.annots:
+            if annot.startswith("%"):
+                return annot[1:]
+        return None
+
+    def __repr__(self):
+        return "Prim(%r, %r, %r)" % (self.name, self.args, self.annots)
+
+
+class Bytes(str):
+    pass
+
+
+def tokens(text):
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None:
+            raise ValueError("unexpected Micheline at %r" % text[position:position + 20])
+        position = match.end()
+        yield match.lastgroup, match.group(match.lastgroup)
+
+
+def parse(text):
+    stack = [[]]
+    closing = []
+
+    for kind, token in tokens(text):
+        if kind == "open":
+            stack.append([])
+            closing.append("}" if token == "{" else ")")
+        elif kind == "close":
+            if not closing or closing.pop() != token:
+                raise ValueError("unbalanced %r" % token)
+            items = stack.pop()
+            stack[-1].append([application(part) for part in split(items)] if token == "}" else application(items))
+        elif kind == "semi":
+            stack[-1].append(";")
+        elif kind == "string":
+            stack[-1].append(re.sub(r'\\(.)', r'\1', token[1:-1]))
+        elif kind == "bytes":
+            stack[-1].append(Bytes(token[2:]))
+        elif kind == "int":
+            stack[-1].append(int(token))
+        elif kind == "annot":
+            stack[-1].append(("annot", token))
+        else:
+            stack[-1].append(Prim(token))
+
+    if closing:
+        raise ValueError("unterminated Micheline")
+    return application(stack[0])
+
+
+def application(items):
+    # items between parentheses or at top level: a primitive applied to its arguments and annotations
+    if len(items) == 1:
+        return items[0]
+    head = items[0]
+    if not isinstance(head, Prim):
+        raise ValueError("expected a primitive, got %r" % (head,))
+    annots = [item[1] for item in items[1:] if isinstance(item, tuple)]
+    args = [item for item in items[1:] if not isinstance(item, tuple)]
+    return Prim(head.name, args, annots)
+
+
+def split(items):
+    part = []
+    for item in items:
+        if item == ";":
+            yield part
+            part = []
+        else:
+            part.append(item)
+    if part:
+        yield part
+
+
+def comb(node):
+    # right comb of an n-ary pair type or Pair value: (pair a b c) is (pair a (pair b c))
+    if len(node.args) <= 2:
+        return node.args
+    return [node.args[0], Prim(node.name, node.args[1:])]
+
+
+def timestamp(value):
+    if isinstance(value, int):
+        return value
+    moment = datetime.datetime.strptime(value.replace("Z", "+0000"), "%Y-%m-%dT%H:%M:%S%z")
+    return int(moment.timestamp())
+
+
+def fields(type, value, record):
+    # merges the annotated leaves of a pair tree into record
+    left_type, right_type = comb(type)
+    if isinstance(value, list):
+        value = Prim("Pair", value)
+    left, right = comb(value)
+
+    for child_type, child in ((left_type, left), (right_type, right)):
+        name = child_type.field()
+        if name is None and child_type.name == "pair":
+            fields(child_type, child, record)
+        else:
+            record[name or str(len(record))] = decode(child_type, child)
+    return record
+
+
+def decode(type, value):
+    name = type.name
+
+    if name == "pair":
+        return fields(type, value, {})
+    if name in ("nat", "int", "mutez"):
+        return int(value)
+    if name == "timestamp":
+        return timestamp(value)
+    if name == "bool":
+        return value.name == "True"
+    if name == "unit":
+        return None
+    if name == "bytes":
+        return str(value)
+    if name == "option":
+        return None if value.name == "None" else decode(type.args[0], value.args[0])
+    if name == "or":
+        return {value.name: decode(type.args[0 if value.name == "Left" else 1], value.args[0])}
+    if name in ("list", "set"):
+        return [decode(type.args[0], item) for item in value]
+    if name in ("map", "big_map"):
+        return dict((decode(type.args[0], elt.args[0]), decode(type.args[1], elt.args[1])) for elt in value)
+    # address, string, key_hash, key, signature, chain_id: their string form
+    return value
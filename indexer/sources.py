@@ -0,0 +1,60 @@
+# Event sources for the indexer; every source is a generator, so nothing is held beyond the current event
+#
+# An event is a dict: seq (position in its stream), contract (name, or KT1 address until mapped),
+# tag and payload (decoded record).
+#
+#   replay(path)    JSONL replay file, one event per line, as written by write_replay()
+#   receipts(path)  octez-client operation receipts, e.g. the mockup output of contract calls; every
+#                   "Internal Event" block is decoded against the Micheline type printed with it, which is
+#                   there because the contracts emit with with_type = True
+
+import json
+import re
+
+from indexer.micheline import decode, parse
+
+FIELD = re.compile(r"^\s*(From|Type|Tag|Payload):\s*(.*)$")
+
+
+def replay(path):
+    with open(path) as f:
+        for seq, line in enumerate(f, 1):
+            if line.strip():
+                event = json.loads(line)
+                event.setdefault("seq", seq)
+                yield event
+
+
+def write_replay(events, path):
+    with open(path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event, separators = (",", ":")))
+            f.write("\n")
+
+
+def receipts(path):
+    seq = 0
+    block = None
+    field = None
+
+    with open(path) as f:
+        for line in f:
+            if "Internal Event:" in line:
+                block, field = {}, None
+                continue
+            if block is None:
+                continue
+
+            match = FIELD.match(line)
+            if match:
+                field = match.group(1)
+                block[field] = match.group(2)
+            elif "This event was" in line or not line.strip():
+                # backtracked or skipped events never changed any state
+                if "successfully applied" in line and "Payload" in block:
+                    seq += 1
+                    yield dict(seq = seq, contract = block["From"], tag = block["Tag"], payload = decode(parse(block["Type"]), parse(block["Payload"])))
+                block = None
+            elif field in ("Type", "Payload"):
+                # long expressions are wrapped over several indented lines
+                block[field] += " " + line.strip()
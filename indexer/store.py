@@ -0,0 +1,152 @@
+# SQLite materialization of the Securities, USDOracle and FA12 events
+#
+# Every event is applied to the tables as it arrives and the position reached in each stream is committed
+# together with the rows it produced, every `commit_every` events. Re-running index() over the same stream
+# resumes after the last committed event, so a replay can be interrupted and continued.
+#
+#   positions        every CALL Option, open or closed, with its exercise payout or keeper reward
+#   pool             the pool totals after every entry point that moved them, in event order
+#   prices           Oracle price per round
+#   balances         wXTZ balance and locked amount per holder
+#   allowances       wXTZ allowances
+#   series           option series, series_balances their ledger
+#   payouts          settled amounts owed to holders
+
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (owner TEXT, id INTEGER, strike INTEGER, options INTEGER, expiry INTEGER, premium INTEGER, status TEXT, price INTEGER, payout INTEGER, reward INTEGER, PRIMARY KEY (owner, id));
+CREATE INDEX IF NOT EXISTS positions_status_strike ON positions (status, strike);
+CREATE INDEX IF NOT EXISTS positions_status_expiry ON positions (status, expiry);
+CREATE TABLE IF NOT EXISTS pool (seq INTEGER PRIMARY KEY, totalSupply INTEGER, LockedSupply INTEGER, WithdrawFund INTEGER, tokenMinted INTEGER, adminAccount INTEGER);
+CREATE TABLE IF NOT EXISTS prices (round INTEGER PRIMARY KEY, price INTEGER, timestamp INTEGER);
+CREATE TABLE IF NOT EXISTS balances (address TEXT PRIMARY KEY, balance INTEGER, locked INTEGER);
+CREATE TABLE IF NOT EXISTS allowances (owner TEXT, spender TEXT, value INTEGER, PRIMARY KEY (owner, spender));
+CREATE TABLE IF NOT EXISTS series (token_id INTEGER PRIMARY KEY, strikePrice INTEGER, expiry INTEGER, outstanding INTEGER, settled INTEGER, payout INTEGER);
+CREATE TABLE IF NOT EXISTS series_balances (owner TEXT, token_id INTEGER, balance INTEGER, PRIMARY KEY (owner, token_id));
+CREATE TABLE IF NOT EXISTS payouts (owner TEXT PRIMARY KEY, balance INTEGER);
+CREATE TABLE IF NOT EXISTS streams (name TEXT PRIMARY KEY, seq INTEGER);
+"""
+
+
+class Indexer:
+
+    def __init__(self, path, contracts = None, commit_every = 10000):
+        # contracts maps KT1 addresses of receipt events to Securities, USDOracle or FA12
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.contracts = dict(contracts or {})
+        self.commit_every = commit_every
+
+    def close(self):
+        self.db.close()
+
+    def position(self, stream):
+        row = self.db.execute("SELECT seq FROM streams WHERE name = ?", (stream,)).fetchone()
+        return row[0] if row else 0
+
+    def checkpoint(self, stream, seq):
+        self.db.execute("INSERT INTO streams VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET seq = excluded.seq", (stream, seq))
+        self.db.commit()
+
+    def index(self, events, stream = "replay"):
+        # applies the events after the stream's committed position; returns how many were applied
+        last = self.position(stream)
+        applied = 0
+
+        for event in events:
+            if event["seq"] <= last:
+                continue
+
+            contract = self.contracts.get(event["contract"], event["contract"])
+            handler = getattr(self, "%s_%s" % (contract, event["tag"]), None)
+            if handler is not None:
+                handler(event["seq"], event["payload"])
+
+            last = event["seq"]
+            applied += 1
+            if applied % self.commit_every == 0:
+                self.checkpoint(stream, last)
+
+        self.checkpoint(stream, last)
+        return applied
+
+    # Handlers, named <contract>_<tag>
+
+    def USDOracle_price(self, seq, e):
+        self.db.execute("INSERT OR REPLACE INTO prices VALUES (?, ?, ?)", (e["round"], e["price"], e["timestamp"]))
+
+    def Securities_pool(self, seq, e):
+        self.db.execute("INSERT OR REPLACE INTO pool VALUES (?, ?, ?, ?, ?, ?)", (seq, e["totalSupply"], e["LockedSupply"], e["WithdrawFund"], e["tokenMinted"], e["adminAccount"]))
+
+    def Securities_purchase(self, seq, e):
+        self.db.execute("INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?, ?, ?, 'open', NULL, 0, 0)", (e["owner"], e["id"], e["strike"], e["options"], e["expiry"], e["premium"]))
+
+    def Securities_exercise(self, seq, e):
+        self.db.execute("UPDATE positions SET status = 'exercised', price = ?, payout = ? WHERE owner = ? AND id = ?", (e["price"], e["payout"], e["owner"], e["id"]))
+
+    def Securities_expire(self, seq, e):
+        self.db.execute("UPDATE positions SET status = 'expired', reward = ? WHERE owner = ? AND id = ?", (e["reward"], e["owner"], e["id"]))
+
+    def Securities_payout(self, seq, e):
+        self.upsert("payouts", ("owner",), e["owner"], balance = e["balance"])
+
+    def Securities_series(self, seq, e):
+        self.db.execute("INSERT OR REPLACE INTO series VALUES (?, ?, ?, ?, ?, ?)", (e["token_id"], e["strikePrice"], e["expiry"], e["outstanding"], int(e["settled"]), e["payout"]))
+
+    def Securities_series_balance(self, seq, e):
+        self.upsert("series_balances", ("owner", "token_id"), e["owner"], e["token_id"], balance = e["balance"])
+
+    def FA12_approval(self, seq, e):
+        self.upsert("allowances", ("owner", "spender"), e["owner"], e["spender"], value = e["value"])
+
+    def FA12_mint(self, seq, e):
+        self.move(e["address"], e["value"], e["value"])
+
+    def FA12_burn(self, seq, e):
+        self.move(e["address"], -e["value"], 0)
+
+    def FA12_transfer(self, seq, e):
+        self.move(e["from_"], -e["value"], 0)
+        self.move(e["to_"], e["value"], 0)
+
+    def FA12_unlock(self, seq, e):
+        self.move(e["address"], 0, -e["amount"])
+
+    def upsert(self, table, key, *values, **column):
+        # balance-like rows: the event carries the value after the change and a zero removes the row
+        (name, value), = column.items()
+        where = " AND ".join("%s = ?" % k for k in key)
+        if value:
+            self.db.execute("INSERT OR REPLACE INTO %s (%s, %s) VALUES (%s)" % (table, ", ".join(key), name, ", ".join("?" * (len(key) + 1))), values + (value,))
+        else:
+            self.db.execute("DELETE FROM %s WHERE %s" % (table, where), values)
+
+    def move(self, address, balance, locked):
+        self.db.execute("INSERT INTO balances VALUES (?, ?, ?) ON CONFLICT (address) DO UPDATE SET balance = balance + excluded.balance, locked = locked + excluded.locked", (address, balance, locked))
+
+    # Queries
+
+    def pool(self):
+        row = self.db.execute("SELECT totalSupply, LockedSupply, WithdrawFund, tokenMinted, adminAccount FROM pool ORDER BY seq DESC LIMIT 1").fetchone()
+        return dict(zip(("totalSupply", "LockedSupply", "WithdrawFund", "tokenMinted", "adminAccount"), row)) if row else None
+
+    def share_price(self):
+        # mutez of pool value per wXTZ, as ContractWriterMint and ContractWriterBurn price it
+        pool = self.pool()
+        if not pool or not pool["tokenMinted"]:
+            return 1.0
+        return (pool["totalSupply"] + pool["WithdrawFund"]) / float(pool["tokenMinted"])
+
+    def open_interest(self):
+        # {strike: options} over the open positions
+        return dict(self.db.execute("SELECT strike, SUM(options) FROM positions WHERE status = 'open' GROUP BY strike ORDER BY strike"))
+
+    def positions(self, owner, status = None):
+        query = "SELECT id, strike, options, expiry, premium, status, price, payout, reward FROM positions WHERE owner = ?"
+        args = (owner,)
+        if status is not None:
+            query += " AND status = ?"
+            args += (status,)
+        columns = ("id", "strike", "options", "expiry", "premium", "status", "price", "payout", "reward")
+        return [dict(zip(columns, row)) for row in self.db.execute(query + " ORDER BY id", args)]
@@ -0,0 +1,123 @@
+# Micheline decoding, receipt parsing and the SQLite store
+#
+#   python -m pytest indexer
+
+import pytest
+
+from indexer.micheline import decode, parse
+from indexer.sources import receipts, replay, write_replay
+from indexer.store import Indexer
+
+RECEIPT = """
+    Internal operations:
+      Internal Event:
+        From: KT1Securities
+        Type: (pair (pair (address %owner) (nat %id))
+                    (pair (nat %strike) (pair (nat %options) (pair (timestamp %expiry) (nat %premium)))))
+        Tag: purchase
+        Payload: (Pair (Pair "tz1holder" 3) 400 2 "2024-01-02T00:00:00Z" 60000)
+        This event was successfully applied
+      Internal Event:
+        From: KT1Token
+        Type: (pair (address %address) (nat %value))
+        Tag: mint
+        Payload: (Pair "tz1holder" 100)
+        This event was BACKTRACKED
+      Internal Event:
+        From: KT1Token
+        Type: (pair (address %address) (nat %value))
+        Tag: mint
+        Payload: (Pair "tz1holder" 250)
+        This event was successfully applied
+"""
+
+
+def mint(seq, value):
+    return dict(seq = seq, contract = "FA12", tag = "mint", payload = dict(address = "tz1holder", value = value))
+
+
+def test_decode_comb_record():
+    type = parse("(pair (nat %a) (nat %b) (address %c))")
+    assert decode(type, parse('(Pair 1 2 "tz1c")')) == dict(a = 1, b = 2, c = "tz1c")
+    assert decode(type, parse('(Pair 1 (Pair 2 "tz1c"))')) == dict(a = 1, b = 2, c = "tz1c")
+    assert decode(type, parse('{ 1 ; 2 ; "tz1c" }')) == dict(a = 1, b = 2, c = "tz1c")
+
+
+def test_decode_balanced_record():
+    # SmartPy's default layout splits the sorted fields into a balanced tree
+    type = parse("(pair (pair (nat %LockedSupply) (nat %WithdrawFund)) (pair (nat %adminAccount) (pair (nat %tokenMinted) (nat %totalSupply))))")
+    assert decode(type, parse("(Pair (Pair 1 2) 3 4 5)")) == dict(LockedSupply = 1, WithdrawFund = 2, adminAccount = 3, tokenMinted = 4, totalSupply = 5)
+
+
+def test_decode_nested_values():
+    type = parse("(pair (option %baker key_hash) (pair (or %side unit nat) (list %ids nat)))")
+    assert decode(type, parse('(Pair None (Right 7) { 1 ; 2 })')) == dict(baker = None, side = dict(Right = 7), ids = [1, 2])
+    assert decode(parse("timestamp"), parse('"1970-01-02T00:00:00Z"')) == 86400
+
+
+def test_receipts(tmp_path):
+    path = tmp_path / "receipts.txt"
+    path.write_text(RECEIPT)
+
+    events = list(receipts(str(path)))
+    assert [(event["seq"], event["contract"], event["tag"]) for event in events] == [(1, "KT1Securities", "purchase"), (2, "KT1Token", "mint")]
+    assert events[0]["payload"] == dict(owner = "tz1holder", id = 3, strike = 400, options = 2, expiry = 1704153600, premium = 60000)
+    assert events[1]["payload"] == dict(address = "tz1holder", value = 250)
+
+
+def test_index_receipts(tmp_path):
+    path = tmp_path / "receipts.txt"
+    path.write_text(RECEIPT)
+
+    indexer = Indexer(str(tmp_path / "index.sqlite"), contracts = dict(KT1Securities = "Securities", KT1Token = "FA12"))
+    assert indexer.index(receipts(str(path)), stream = "receipts") == 2
+    assert indexer.open_interest() == {400: 2}
+    assert indexer.db.execute("SELECT balance, locked FROM balances WHERE address = 'tz1holder'").fetchone() == (250, 250)
+
+
+def test_resume_after_checkpoint(tmp_path):
+    database = str(tmp_path / "index.sqlite")
+    replayed = str(tmp_path / "events.jsonl")
+    write_replay([mint(seq, 10) for seq in range(1, 8)], replayed)
+
+    def interrupted():
+        for event in replay(replayed):
+            if event["seq"] == 6:
+                raise KeyboardInterrupt
+            yield event
+
+    # events 1 to 4 are committed, event 5 is applied but rolled back with the connection
+    indexer = Indexer(database, commit_every = 2)
+    with pytest.raises(KeyboardInterrupt):
+        indexer.index(interrupted())
+    indexer.close()
+
+    indexer = Indexer(database, commit_every = 2)
+    assert indexer.position("replay") == 4
+    assert indexer.index(replay(replayed)) == 3
+    assert indexer.index(replay(replayed)) == 0
+    assert indexer.position("replay") == 7
+    assert indexer.db.execute("SELECT balance FROM balances WHERE address = 'tz1holder'").fetchone() == (70,)
+    indexer.close()
+
+
+def test_upsert_deletes_zero_balances(tmp_path):
+    indexer = Indexer(str(tmp_path / "index.sqlite"))
+    events = [
+        dict(seq = 1, contract = "FA12", tag = "approval", payload = dict(owner = "tz1owner", spender = "tz1spender", value = 5)),
+        dict(seq = 2, contract = "Securities", tag = "payout", payload = dict(owner = "tz1owner", balance = 300)),
+        dict(seq = 3, contract = "Securities", tag = "series_balance", payload = dict(owner = "tz1owner", token_id = 0, balance = 2)),
+    ]
+    indexer.index(events)
+    assert indexer.db.execute("SELECT value FROM allowances").fetchall() == [(5,)]
+    assert indexer.db.execute("SELECT balance FROM payouts").fetchall() == [(300,)]
+    assert indexer.db.execute("SELECT balance FROM series_balances").fetchall() == [(2,)]
+
+    indexer.index([
+        dict(seq = 4, contract = "FA12", tag = "approval", payload = dict(owner = "tz1owner", spender = "tz1spender", value = 0)),
+        dict(seq = 5, contract = "Securities", tag = "payout", payload = dict(owner = "tz1owner", balance = 0)),
+        dict(seq = 6, contract = "Securities", tag = "series_balance", payload = dict(owner = "tz1owner", token_id = 0, balance = 0)),
+    ])
+    for table in ("allowances", "payouts", "series_balances"):
+        assert indexer.db.execute("SELECT COUNT(*) FROM %s" % table).fetchone() == (0,)
+    indexer.close()
@@ -0,0 +1,96 @@
+# Keeper throughput against the sandbox with synthetic positions
+#
+#   python -m keeper.bench --positions 10000 --latency 0.002
+#
+# Seeds the sandbox with `positions` CALL Options spread over 1000 holders and the four durations, and one
+# FA12 lockup per holder. The keeper runs twice: just before the 1-day cohort expires, with a tenth of the
+# holders as its own accounts, to exercise their in-the-money positions; then after every position has
+# expired and every lockup has matured, to free and unlock everything. Each configuration is timed from
+# the first tick until a tick finds nothing left to do and reports actions and positions per second; the
+# bench exits with 1 if a configuration leaves positions open or has failed operations.
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from keeper.sandbox import Sandbox
+from keeper.service import Keeper
+from keeper.state import DAY, MUTEZ
+
+HOLDERS = 1000
+DURATIONS = [1, 7, 14, 21]
+
+
+def seed(positions, latency, european = False, seed = 0):
+    rng = random.Random(seed)
+    chain = Sandbox(latency = latency, liquidity = positions * 20 * MUTEZ, european = european)
+    holders = ["tz1holder%04d" % i for i in range(HOLDERS)]
+
+    chain.feed(400)
+    for i in range(positions):
+        chain.purchase(holders[i % HOLDERS], rng.randint(300, 500), rng.randint(1, 10), rng.choice(DURATIONS))
+    for holder in holders:
+        chain.mint(holder, 1000000)
+
+    return chain, holders
+
+
+async def drain(keeper, now):
+    actions = positions = failed = 0
+    while True:
+        report = await keeper.tick(now)
+        if not len(report):
+            return actions, positions, failed
+        actions += len(report)
+        positions += report.positions
+        failed += len(report.failed)
+
+
+async def measure(positions, parallelism, batch, latency, european = False):
+    chain, holders = seed(positions, latency, european)
+    keeper = Keeper(chain, "tz1keeper", accounts = holders[:HOLDERS // 10], parallelism = parallelism, batch = batch)
+    totals = [0, 0, 0]
+    started = time.perf_counter()
+
+    # the 1-day cohort half an hour before it expires, at a price that puts most strikes in the money
+    chain.advance(DAY - 1800)
+    chain.feed(480)
+    for i, value in enumerate(await drain(keeper, chain.now)):
+        totals[i] += value
+
+    # everything expired and every lockup matured
+    chain.advance(22 * DAY)
+    chain.feed(420)
+    for i, value in enumerate(await drain(keeper, chain.now)):
+        totals[i] += value
+
+    elapsed = time.perf_counter() - started
+    left = len(chain.contracts["Securities"].CallOption)
+    return dict(positions = positions, parallelism = parallelism, batch = batch, latency = latency, european = european, seconds = round(elapsed, 3), actions = totals[0], failed = totals[2], closed = totals[1], left = left, actions_per_second = round(totals[0] / elapsed, 1), positions_per_second = round(totals[1] / elapsed, 1))
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Keeper throughput against the in-process sandbox")
+    parser.add_argument("--positions", type = int, default = 10000)
+    parser.add_argument("--latency", type = float, default = 0.002, help = "seconds every storage read and call waits")
+    parser.add_argument("--parallelism", type = int, default = 32)
+    parser.add_argument("--batch", type = int, default = 50)
+    parser.add_argument("--european", action = "store_true")
+    args = parser.parse_args(argv)
+
+    # one operation per position and in flight at a time, then batched, then batched and pipelined
+    status = 0
+    for parallelism, batch in [(1, 1), (1, args.batch), (args.parallelism, args.batch)]:
+        result = asyncio.run(measure(args.positions, parallelism, batch, args.latency, args.european))
+        print(result)
+        # a configuration that leaves positions open or operations failed doesn't measure the keeper's throughput
+        if result["left"] or result["failed"]:
+            print("keeper left %d positions open with %d failed operations" % (result["left"], result["failed"]), file = sys.stderr)
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
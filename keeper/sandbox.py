@@ -0,0 +1,267 @@
+# In-process chain stand-in for the keeper
+#
+# Holds one storage model per contract and applies the keeper's entry point calls with the checks and the
+# integer arithmetic of Call.py and wXTZ.py. Every call waits `latency` seconds before it is applied, which
+# stands in for the time an operation spends being injected and included; calls are applied atomically, so
+# concurrent calls see each other's effects the way operations in one block do.
+#
+# Calls whose batch exceeds `max_batch` positions, or SweepExpired slots, fail as if they ran out of gas.
+
+import asyncio
+
+from keeper.state import DAY, MUTEZ, Lockup, OracleStorage, SecuritiesStorage, TokenStorage, call_option, expiry_day, pack_lockup
+from simulator import surface
+
+
+class Rejected(Exception):
+    pass
+
+
+def verify(condition, message):
+    if not condition:
+        raise Rejected(message)
+
+
+class Sandbox:
+
+    def __init__(self, now = 0, latency = 0.0, max_batch = 100, liquidity = 0, european = False):
+        self.now = now
+        self.latency = latency
+        self.max_batch = max_batch
+        self.contracts = dict(Securities = SecuritiesStorage(totalSupply = liquidity, european = european), USDOracle = OracleStorage(), FA12 = TokenStorage())
+        self.sent = {}
+        self.applied = 0
+        self.rejected = 0
+
+    async def storage(self, contract):
+        await asyncio.sleep(self.latency)
+        return self.contracts[contract]
+
+    async def call(self, contract, entrypoint, params, sender):
+        await asyncio.sleep(self.latency)
+        try:
+            getattr(self, "%s_%s" % (contract, entrypoint))(params, sender)
+        except Rejected:
+            self.rejected += 1
+            raise
+        self.applied += 1
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def send(self, address, mutez):
+        # a 0 mutez transfer to an implicit account fails the operation on chain, so the entry points only send
+        # positive amounts, as Call.py does
+        verify(mutez > 0, "empty_transaction")
+        self.sent[address] = self.sent.get(address, 0) + mutez
+
+    # Setup: the entry points that put positions, prices and lockups on the chain, applied synchronously
+
+    def feed(self, price):
+        oracle = self.contracts["USDOracle"]
+        oracle.USDPrice = price
+        oracle.USDPriceTime = self.now
+        oracle.USDPriceRound += 1
+        oracle.PriceHistory[oracle.USDPriceRound] = (self.now, price)
+
+    def purchase(self, owner, strike, order, duration):
+        s = self.contracts["Securities"]
+        price = self.price()
+
+        unit = surface.premium(s.PremiumSurface, price, duration, strike, s.moneynessStep)
+        verify(unit is not None, "Strike is outside of the premium surface")
+        premium = order * unit
+
+        verify(s.totalSupply - s.LockedSupply >= order * MUTEZ, "Insufficient Funds to cover up Order Amount")
+        verify((s.LockedSupply + order * MUTEZ) * 10 <= s.totalSupply * 9, "Options utilizes more than 90 percent of the pool's funds.")
+
+        s.LockedSupply += order * MUTEZ
+        s.adminAccount += order * 9 * 1000
+
+        key = (owner, s.PositionCount.get(owner, 0))
+        s.PositionCount[owner] = key[1] + 1
+        expiry = self.now + duration * DAY
+        s.CallOption[key] = call_option(strike, order, expiry, duration, premium)
+        cursor = s.ExpiryCursor.setdefault(expiry_day(expiry), [0, 0])
+        s.ExpiryIndex[(expiry_day(expiry), cursor[1])] = key
+        cursor[1] += 1
+        return key
+
+    def mint(self, address, value):
+        t = self.contracts["FA12"]
+        balance = t.balances.setdefault(address, dict(balance = 0, locked = 0))
+
+        if address in t.LockedBalance:
+            self.release_matured(address)
+        else:
+            t.LockedBalance[address] = [0, 0]
+
+        head, tail = t.LockedBalance[address]
+        last = t.LockedEntries.get((address, tail - 1)) if head < tail else None
+
+        if last is not None and expiry_day(Lockup(last).time) == expiry_day(self.now):
+            t.LockedEntries[(address, tail - 1)] = pack_lockup(Lockup(last).amount + value, Lockup(last).time)
+        else:
+            t.LockedEntries[(address, tail)] = pack_lockup(value, self.now)
+            t.LockedBalance[address][1] = tail + 1
+
+        balance["balance"] += value
+        balance["locked"] += value
+        t.totalSupply += value
+
+    # Contract logic shared by the entry points
+
+    def price(self):
+        oracle = self.contracts["USDOracle"]
+        verify(self.now - oracle.USDPriceTime <= self.contracts["Securities"].maxPriceAge, "Oracle price is stale")
+        return oracle.USDPrice
+
+    def remove(self, key):
+        # the expiry slot stays until SweepExpired walks over it
+        del self.contracts["Securities"].CallOption[key]
+
+    def release(self, key):
+        s = self.contracts["Securities"]
+        position = s.position(key)
+        s.LockedSupply = abs(s.LockedSupply - position.options * MUTEZ)
+        s.WithdrawFund += position.premium
+        self.remove(key)
+        return position.reward
+
+    def exercise(self, key, price):
+        s = self.contracts["Securities"]
+        position = s.position(key)
+        total = position.options * MUTEZ
+        left = position.strike * MUTEZ * position.options // price
+
+        s.WithdrawFund += position.premium + position.reward
+        s.LockedSupply = abs(s.LockedSupply - total)
+        s.totalSupply = abs(s.totalSupply - abs(total - left))
+        self.remove(key)
+        return abs(total - left)
+
+    def snapshot(self, day):
+        s = self.contracts["Securities"]
+        if day not in s.ExpirySnapshot:
+            verify(self.now >= (day + 1) * DAY, "Expiry day hasn't ended yet")
+            price = self.contracts["USDOracle"].expiry_price((day + 1) * DAY, s.maxPriceAge)
+            verify(price is not None, "Oracle price is stale")
+            s.ExpirySnapshot[day] = price
+        return s.ExpirySnapshot[day]
+
+    def close_expired(self, key):
+        s = self.contracts["Securities"]
+        if not s.european:
+            return self.release(key)
+
+        price = self.snapshot(expiry_day(s.position(key).expiry))
+        if s.position(key).strike < price:
+            owner = key[0]
+            payout = self.exercise(key, price)
+            if payout:
+                s.Payouts[owner] = s.Payouts.get(owner, 0) + payout
+            return 0
+        return self.release(key)
+
+    def release_matured(self, address):
+        t = self.contracts["FA12"]
+        while t.matured(address, self.now):
+            head = t.LockedBalance[address][0]
+            t.balances[address]["locked"] = abs(t.balances[address]["locked"] - Lockup(t.LockedEntries.pop((address, head))).amount)
+            t.LockedBalance[address][0] = head + 1
+
+    # Entry points the keeper calls, named <contract>_<entry point>
+
+    def Securities_ExerciseCallOption(self, params, sender):
+        s = self.contracts["Securities"]
+        key = (sender, params["id"])
+
+        verify(not s.european, "CALL Options settle at expiry")
+        verify(key in s.CallOption, "Sender has not purchased Call Option")
+        verify(self.now <= s.position(key).expiry, "PUT Options have already expired")
+
+        price = self.price()
+        verify(s.position(key).strike < price, "Current Price is less than or equal to Strike Price")
+
+        self.send(sender, self.exercise(key, price))
+
+    def Securities_FreeSecurity(self, params, sender):
+        s = self.contracts["Securities"]
+        key = (params["address"], params["id"])
+
+        verify(key in s.CallOption, "Order with such address does not exist.")
+
+        if self.now > s.position(key).expiry:
+            reward = self.close_expired(key)
+            if reward:
+                self.send(sender, reward)
+
+    def Securities_SweepExpired(self, params, sender):
+        s = self.contracts["Securities"]
+
+        day = params["day"]
+
+        verify(day in s.ExpiryCursor, "No CALL Options expire on that day")
+        # the walk reads at most `limit` slots of the day, so the limit bounds its cost
+        verify(params["limit"] <= self.max_batch, "Gas limit exceeded")
+
+        walked = s.sweep(day, self.now, params["limit"])
+        verify(walked, "No expired CALL Options to free")
+
+        keys = [key for slot, key in walked if key is not None]
+        if s.european and keys:
+            self.snapshot(day)
+
+        reward = sum(self.close_expired(key) for key in keys)
+        for slot, key in walked:
+            del s.ExpiryIndex[(day, slot)]
+
+        cursor = s.ExpiryCursor[day]
+        cursor[0] = walked[-1][0] + 1
+        if cursor[0] == cursor[1]:
+            del s.ExpiryCursor[day]
+
+        if reward:
+            self.send(sender, reward)
+
+    def Securities_SettleExpiry(self, params, sender):
+        s = self.contracts["Securities"]
+
+        verify(s.european, "CALL Options are exercised individually")
+        verify(params["day"] not in s.ExpirySnapshot, "Expiry day is already settled")
+
+        self.snapshot(params["day"])
+
+    def Securities_ClaimSettlement(self, params, sender):
+        s = self.contracts["Securities"]
+
+        verify(s.european, "CALL Options are exercised individually")
+        verify(len(params["positions"]) <= self.max_batch, "Gas limit exceeded")
+
+        # checks every position before closing any, since a failed operation leaves the storage untouched
+        seen = set()
+        for key in params["positions"]:
+            verify(key in s.CallOption and key not in seen, "Order with such address does not exist.")
+            verify(self.now > s.position(key).expiry, "CALL Option hasn't expired yet")
+            seen.add(key)
+
+        for day in set(expiry_day(s.position(key).expiry) for key in seen):
+            self.snapshot(day)
+
+        reward = sum(self.close_expired(key) for key in params["positions"])
+        if reward:
+            self.send(sender, reward)
+
+    def Securities_WithdrawPayout(self, params, sender):
+        s = self.contracts["Securities"]
+
+        verify(sender in s.Payouts, "No payout owed to sender")
+        payout = s.Payouts.pop(sender)
+        if payout:
+            self.send(sender, payout)
+
+    def FA12_unlockFunds(self, params, sender):
+        t = self.contracts["FA12"]
+
+        verify(params["address"] in t.LockedBalance, "Address does not have funds LockedUp")
+        self.release_matured(params["address"])
@@ -0,0 +1,132 @@
+# Keeper: watches the Securities, USDOracle and FA12 storage and sends the calls that keep the pool moving
+#
+#   - expired CALL Options are freed in batches, SweepExpired per expiry day in the American mode and
+#     SettleExpiry then ClaimSettlement over explicit position lists in the European mode
+#   - positions held by the keeper's own accounts are exercised once they are in the money and within
+#     exercise_window seconds of expiry, and their European payouts are withdrawn
+#   - FA12 lockups whose head bucket has matured are released with unlockFunds
+#
+# A tick reads the three storages, plans every action and sends them with at most `parallelism` operations
+# in flight. SettleExpiry calls go out in a first stage since the claims of their day depend on them.
+# The chain is anything with the Sandbox interface: `await storage(contract)` and
+# `await call(contract, entrypoint, params, sender)` raising on a failed operation.
+
+import asyncio
+
+from keeper.state import DAY
+
+
+class Action:
+
+    __slots__ = ("contract", "entrypoint", "params", "sender", "positions", "error")
+
+    def __init__(self, contract, entrypoint, params, sender, positions = 0):
+        self.contract = contract
+        self.entrypoint = entrypoint
+        self.params = params
+        self.sender = sender
+        self.positions = positions
+        self.error = None
+
+    def __repr__(self):
+        return "%s.%s(%r)" % (self.contract, self.entrypoint, self.params)
+
+
+class Report:
+
+    def __init__(self, actions):
+        self.actions = actions
+        self.failed = [action for action in actions if action.error is not None]
+        self.positions = sum(action.positions for action in actions if action.error is None)
+
+    def __len__(self):
+        return len(self.actions)
+
+
+class Keeper:
+
+    def __init__(self, chain, sender, accounts = (), parallelism = 16, batch = 50, exercise_window = 3600):
+        self.chain = chain
+        self.sender = sender
+        self.accounts = set(accounts)
+        self.parallelism = parallelism
+        self.batch = batch
+        self.exercise_window = exercise_window
+
+    def plan(self, securities, oracle, token, now):
+        # returns (stage 1, stage 2) action lists for the storage as read at now
+        settle, actions = [], []
+        price_fresh = now - oracle.USDPriceTime <= securities.maxPriceAge
+
+        for day in sorted(securities.ExpiryCursor):
+            if not securities.european:
+                # every SweepExpired of the day walks the next `batch` slots, dropping those of closed positions
+                walked = securities.sweep(day, now)
+                for i in range(0, len(walked), self.batch):
+                    freed = sum(key is not None for slot, key in walked[i:i + self.batch])
+                    actions.append(Action("Securities", "SweepExpired", dict(day = day, limit = self.batch), self.sender, freed))
+                continue
+
+            expired = securities.expired(day, now)
+            if not expired:
+                continue
+
+            # a European cohort is claimable once its day has ended and the oracle has a price for its end
+            if now < (day + 1) * DAY:
+                continue
+            if day not in securities.ExpirySnapshot:
+                if oracle.expiry_price((day + 1) * DAY, securities.maxPriceAge) is None:
+                    continue
+                settle.append(Action("Securities", "SettleExpiry", dict(day = day), self.sender))
+
+            expired.sort()
+            for i in range(0, len(expired), self.batch):
+                chunk = expired[i:i + self.batch]
+                actions.append(Action("Securities", "ClaimSettlement", dict(positions = chunk), self.sender, len(chunk)))
+
+        if self.accounts and not securities.european and price_fresh:
+            for key in securities.CallOption:
+                if key[0] not in self.accounts:
+                    continue
+                position = securities.position(key)
+                if position.strike < oracle.USDPrice and now <= position.expiry <= now + self.exercise_window:
+                    actions.append(Action("Securities", "ExerciseCallOption", dict(id = key[1]), key[0], 1))
+
+        for account in sorted(self.accounts & set(securities.Payouts)):
+            actions.append(Action("Securities", "WithdrawPayout", None, account))
+
+        for address in token.LockedBalance:
+            if token.matured(address, now):
+                actions.append(Action("FA12", "unlockFunds", dict(address = address), self.sender))
+
+        return settle, actions
+
+    async def send(self, actions):
+        semaphore = asyncio.Semaphore(self.parallelism)
+
+        async def send(action):
+            async with semaphore:
+                try:
+                    await self.chain.call(action.contract, action.entrypoint, action.params, action.sender)
+                except Exception as e:
+                    action.error = str(e)
+
+        await asyncio.gather(*(send(action) for action in actions))
+
+    async def tick(self, now):
+        securities, oracle, token = await asyncio.gather(self.chain.storage("Securities"), self.chain.storage("USDOracle"), self.chain.storage("FA12"))
+        settle, actions = self.plan(securities, oracle, token, now)
+
+        await self.send(settle)
+        await self.send(actions)
+        return Report(settle + actions)
+
+    async def serve(self, clock, interval = 30, stop = None):
+        # runs a tick every interval seconds until stop is set; clock() returns the chain time
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            await self.tick(clock())
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,138 @@
+# Off-chain models of the Securities, USDOracle and FA12 storage the keeper reads
+#
+# Field names follow the contracts. CallOption values are the records of Call.py, which Position wraps;
+# LockedEntries values keep the packed nat layout of wXTZ.py, which Lockup decodes.
+
+from simulator.surface import flat
+
+DAY = 86400
+MUTEZ = 1000000
+MASK = (1 << 32) - 1
+
+
+def call_option(strike, options, expiry, duration, premium):
+    # expiry in seconds since the epoch
+    return dict(strikePrice = strike, options = options, expiry = expiry, duration = duration, premium = premium)
+
+
+def pack_lockup(amount, time):
+    # time of the bucket's first mint + amount * 2^32
+    return time | amount << 32
+
+
+def expiry_day(time):
+    return time // DAY
+
+
+class Position:
+
+    __slots__ = ("key", "strike", "options", "expiry", "duration", "premium")
+
+    def __init__(self, key, record):
+        self.key = key
+        self.strike = record["strikePrice"]
+        self.options = record["options"]
+        self.expiry = record["expiry"]
+        self.duration = record["duration"]
+        self.premium = record["premium"]
+
+    @property
+    def owner(self):
+        return self.key[0]
+
+    @property
+    def reward(self):
+        return self.options * 1000
+
+
+class Lockup:
+
+    __slots__ = ("amount", "time")
+
+    def __init__(self, packed):
+        self.amount = packed >> 32
+        self.time = packed & MASK
+
+
+class SecuritiesStorage:
+
+    def __init__(self, totalSupply = 0, european = False, maxPriceAge = 3600):
+        self.CallOption = {}
+        self.PositionCount = {}
+        self.ExpiryIndex = {}
+        self.ExpiryCursor = {}
+        self.totalSupply = totalSupply
+        self.LockedSupply = 0
+        self.adminAccount = 0
+        self.WithdrawFund = 0
+        self.PremiumSurface = flat()
+        self.moneynessStep = 500
+        self.maxPriceAge = maxPriceAge
+        self.european = european
+        self.ExpirySnapshot = {}
+        self.Payouts = {}
+        self.paused = False
+
+    def position(self, key):
+        return Position(key, self.CallOption[key])
+
+    def sweep(self, day, now, limit = None):
+        # (slot, key) pairs SweepExpired walks at now from the day's head, with key None for the slot of a
+        # position already closed; the walk stops at the first position still running
+        walked = []
+        head, tail = self.ExpiryCursor.get(day, (0, 0))
+        for slot in range(head, tail):
+            if len(walked) == limit:
+                break
+            key = self.ExpiryIndex[(day, slot)]
+            if key not in self.CallOption:
+                walked.append((slot, None))
+            elif now > self.CallOption[key]["expiry"]:
+                walked.append((slot, key))
+            else:
+                break
+        return walked
+
+    def expired(self, day, now):
+        # open positions of one expiry day that SweepExpired frees at now, in slot order
+        return [key for slot, key in self.sweep(day, now) if key is not None]
+
+
+class OracleStorage:
+
+    def __init__(self, USDPrice = 0, USDPriceTime = 0):
+        self.USDPrice = USDPrice
+        self.USDPriceTime = USDPriceTime
+        self.USDPriceRound = 0
+        self.PriceHistory = {}
+
+    def expiry_price(self, time, max_age):
+        # The price expiryPrice settles a cohort at without a TWAP window: the price live at time if it was fed
+        # at most max_age before it, else the first price fed after it; None while there is none
+        live = None
+        for round in sorted(self.PriceHistory):
+            fed, price = self.PriceHistory[round]
+            if fed <= time:
+                live = (fed, price)
+            elif live is not None and time - live[0] <= max_age:
+                break
+            else:
+                return price
+        if live is not None and time - live[0] <= max_age:
+            return live[1]
+        return None
+
+
+class TokenStorage:
+
+    def __init__(self, LockDuration = 14):
+        self.balances = {}
+        self.LockedBalance = {}
+        self.LockedEntries = {}
+        self.LockDuration = LockDuration
+        self.totalSupply = 0
+
+    def matured(self, address, now):
+        # whether unlockFunds would release at least the head bucket of address
+        head, tail = self.LockedBalance[address]
+        return head < tail and now > Lockup(self.LockedEntries[(address, head)]).time + self.LockDuration * DAY
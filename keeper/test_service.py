@@ -0,0 +1,170 @@
+# Keeper.plan against sandbox storages, and whole ticks against the sandbox
+#
+#   python -m pytest keeper
+
+import asyncio
+
+import pytest
+
+from keeper import bench
+from keeper.sandbox import Rejected, Sandbox
+from keeper.service import Keeper
+from keeper.state import DAY, MUTEZ
+
+
+def plan(chain, keeper):
+    return keeper.plan(chain.contracts["Securities"], chain.contracts["USDOracle"], chain.contracts["FA12"], chain.now)
+
+
+def entrypoints(actions):
+    return [action.entrypoint for action in actions]
+
+
+def test_exercise_window():
+    chain = Sandbox(liquidity = 1000 * MUTEZ)
+    chain.feed(400)
+    own = chain.purchase("tz1own", 380, 1, 1)
+    chain.purchase("tz1own", 500, 1, 1)
+    chain.purchase("tz1own", 380, 1, 7)
+    chain.purchase("tz1other", 380, 1, 1)
+    keeper = Keeper(chain, "tz1keeper", accounts = ["tz1own"], exercise_window = 3600)
+
+    # the 1-day cohort is two hours from expiry, outside the window
+    chain.advance(DAY - 7200)
+    chain.feed(480)
+    settle, actions = plan(chain, keeper)
+    assert settle == [] and actions == []
+
+    # only the keeper's own in-the-money position of the cohort, sent by its owner
+    chain.advance(3600)
+    chain.feed(480)
+    settle, actions = plan(chain, keeper)
+    assert [(action.entrypoint, action.params, action.sender) for action in actions] == [("ExerciseCallOption", dict(id = own[1]), "tz1own")]
+
+    report = asyncio.run(keeper.tick(chain.now))
+    assert not report.failed and report.positions == 1
+    assert own not in chain.contracts["Securities"].CallOption
+
+
+def test_american_sweep_chunks():
+    chain = Sandbox(liquidity = 1000 * MUTEZ)
+    chain.feed(400)
+    for i in range(5):
+        chain.purchase("tz1holder%d" % i, 400, 1, 1)
+    keeper = Keeper(chain, "tz1keeper", batch = 2)
+
+    chain.advance(DAY)
+    assert plan(chain, keeper) == ([], [])
+
+    chain.advance(1)
+    settle, actions = plan(chain, keeper)
+    assert settle == []
+    assert [(action.entrypoint, action.params, action.positions) for action in actions] == [("SweepExpired", dict(day = 1, limit = 2), 2)] * 2 + [("SweepExpired", dict(day = 1, limit = 2), 1)]
+
+    report = asyncio.run(keeper.tick(chain.now))
+    assert not report.failed and report.positions == 5
+    assert chain.contracts["Securities"].CallOption == {} and chain.contracts["Securities"].ExpiryCursor == {}
+
+
+def test_european_staging():
+    chain = Sandbox(liquidity = 1000 * MUTEZ, european = True)
+    chain.feed(400)
+    for i in range(5):
+        chain.purchase("tz1holder%d" % i, 380, 1, 1)
+    keeper = Keeper(chain, "tz1keeper", accounts = ["tz1holder0"], batch = 2)
+
+    # expired, but the settlement price is only fixed once the expiry day has ended
+    chain.advance(DAY + 1)
+    chain.feed(480)
+    assert plan(chain, keeper) == ([], [])
+
+    chain.advance(DAY)
+    chain.feed(480)
+    settle, actions = plan(chain, keeper)
+    assert [(action.entrypoint, action.params) for action in settle] == [("SettleExpiry", dict(day = 1))]
+    assert entrypoints(actions) == ["ClaimSettlement"] * 3
+    assert [len(action.params["positions"]) for action in actions] == [2, 2, 1]
+
+    report = asyncio.run(keeper.tick(chain.now))
+    assert not report.failed and report.positions == 5
+    assert chain.contracts["Securities"].ExpirySnapshot == {1: 480}
+
+    # the payouts of the keeper's own accounts are withdrawn on the next tick
+    settle, actions = plan(chain, keeper)
+    assert [(action.entrypoint, action.sender) for action in actions] == [("WithdrawPayout", "tz1holder0")]
+
+
+def test_stale_price():
+    chain = Sandbox(liquidity = 1000 * MUTEZ, european = True)
+    chain.feed(400)
+    chain.purchase("tz1own", 380, 1, 1)
+    keeper = Keeper(chain, "tz1keeper")
+
+    # no SettleExpiry, hence no claims, until a price is fed near the end of the day or after it
+    chain.advance(2 * DAY)
+    assert plan(chain, keeper) == ([], [])
+
+    chain.feed(480)
+    settle, actions = plan(chain, keeper)
+    assert entrypoints(settle) == ["SettleExpiry"] and entrypoints(actions) == ["ClaimSettlement"]
+
+    chain = Sandbox(liquidity = 1000 * MUTEZ)
+    chain.feed(400)
+    chain.purchase("tz1own", 380, 1, 1)
+    keeper = Keeper(chain, "tz1keeper", accounts = ["tz1own"])
+
+    # nor exercises
+    chain.advance(DAY - 1800)
+    assert plan(chain, keeper) == ([], [])
+
+
+def test_late_settlement():
+    chain = Sandbox(liquidity = 1000 * MUTEZ, european = True)
+    chain.feed(400)
+    chain.purchase("tz1own", 380, 1, 1)
+    keeper = Keeper(chain, "tz1keeper")
+
+    # a settlement a day late still reads the price at the end of the expiry day
+    chain.advance(2 * DAY - 600)
+    chain.feed(450)
+    chain.advance(3600)
+    chain.feed(900)
+    chain.advance(DAY)
+    report = asyncio.run(keeper.tick(chain.now))
+    assert not report.failed and chain.contracts["Securities"].ExpirySnapshot == {1: 450}
+
+
+def test_bench_drains():
+    for european in [False, True]:
+        result = asyncio.run(bench.measure(300, 8, 50, 0.0, european))
+        assert result["failed"] == 0 and result["left"] == 0
+
+
+def test_sweep_exercised_day():
+    chain = Sandbox(liquidity = 1000 * MUTEZ)
+    chain.feed(400)
+    for i in range(3):
+        chain.purchase("tz1own", 380, 1, 1)
+    keeper = Keeper(chain, "tz1keeper", accounts = ["tz1own"])
+
+    chain.advance(DAY - 1800)
+    chain.feed(480)
+    report = asyncio.run(keeper.tick(chain.now))
+    assert entrypoints(report.actions) == ["ExerciseCallOption"] * 3 and not report.failed
+
+    # every slot of the day belongs to an exercised position: the sweep frees nothing, pays nothing and
+    # still moves the cursor past the day
+    chain.advance(3600)
+    settle, actions = plan(chain, keeper)
+    assert [(action.entrypoint, action.positions) for action in actions] == [("SweepExpired", 0)]
+
+    report = asyncio.run(keeper.tick(chain.now))
+    assert not report.failed
+    assert chain.contracts["Securities"].ExpiryCursor == {} and "tz1keeper" not in chain.sent
+    assert plan(chain, keeper) == ([], [])
+
+
+def test_empty_transaction():
+    chain = Sandbox()
+    with pytest.raises(Rejected):
+        chain.send("tz1keeper", 0)
@@ -0,0 +1,117 @@
+# Differential scenario: replays one order flow through the Securities contract and through the
+# vectorized PoolModel and checks that the pool totals agree after every step.
+# Run from the repository root: SmartPy.sh test simulator/differential.py <output>
+
+import os
+import sys
+
+import smartpy as sp
+
+sys.path.insert(0, os.getcwd())
+
+from simulator.pool import DAY, PoolModel
+from simulator.surface import generate, points
+
+Call = sp.io.import_script_from_url("file:Call.py")
+wXTZ = sp.io.import_script_from_url("file:wXTZ.py")
+
+if "templates" not in __name__:
+    @sp.add_test(name = "Pool Model Differential")
+    def test():
+
+        scenario = sp.test_scenario()
+        scenario.h1("Pool Model Differential")
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        alice = sp.test_account("Alice")
+        bob = sp.test_account("Bob")
+        keeper = sp.test_account("Keeper")
+
+        oracle = Call.USDOracle(admin)
+        scenario += oracle
+
+        token = wXTZ.FA12(admin)
+        scenario += token
+
+        options = Call.Securities(admin, oracle.address, token.address)
+        scenario += options
+
+        # Without a lockup minted wXTZ can be burned as soon as it is unlocked
+        scenario += token.ValidatorOperation(address = options.address, Operation = 1).run(sender = admin)
+        scenario += token.ModifyLockup(duration = 0).run(sender = admin)
+
+        model = PoolModel(paths = 1, capacity = 8)
+
+        def check():
+            for field in ["totalSupply", "LockedSupply", "WithdrawFund", "tokenMinted", "adminAccount"]:
+                scenario.verify(getattr(options.data, field) == int(getattr(model, field)[0]))
+            # the snapshot the pool views read
+            scenario.verify(options.data.poolValue == int(model.totalSupply[0] + model.WithdrawFund[0]))
+            scenario.verify(options.data.freeLiquidity == int(abs(model.totalSupply[0] - model.LockedSupply[0])))
+            scenario.verify(options.data.withdrawableLiquidity == int(abs(model.totalSupply[0] + model.WithdrawFund[0] - model.LockedSupply[0])))
+
+        def feed(price, now):
+            nonlocal scenario
+            scenario += oracle.feedData(price = price).run(sender = admin, now = sp.timestamp(now))
+
+        def mint(account, amount, now):
+            nonlocal scenario
+            scenario += options.ContractWriterMint(amount = amount).run(sender = account, amount = sp.mutez(amount), now = sp.timestamp(now))
+            model.mint(amount)
+            check()
+
+        def purchase(slot, account, price, strike, order, duration, now):
+            nonlocal scenario
+            _, required = model.quote(price, strike, order, duration)
+            paid = int(required) + 1000
+            accepted, _ = model.purchase(slot, now, price, strike, order, duration, paid)
+            scenario += options.PurchaseCallOption(price = strike, duration = duration, order = order, amount = paid).run(sender = account, amount = sp.mutez(paid), now = sp.timestamp(now), valid = bool(accepted[0]))
+            check()
+
+        def exercise(slot, account, id, price, now):
+            nonlocal scenario
+            paid = model.exercise(slot, now, price)
+            scenario += options.ExerciseCallOption(id = id).run(sender = account, now = sp.timestamp(now), valid = bool(paid[0] > 0))
+            check()
+
+        def burn(account, tokens, now):
+            nonlocal scenario
+            model.burn(tokens)
+            scenario += token.unlockFunds(address = account.address).run(sender = account, now = sp.timestamp(now))
+            scenario += options.ContractWriterBurn(amount = tokens).run(sender = account, now = sp.timestamp(now))
+            check()
+
+        feed(400, 0)
+        mint(alice, 20000000, 0)
+        mint(bob, 7000000, 0)
+
+        scenario.h2("Black-Scholes premium surface")
+        surface = generate(0.8, markup = 1.2)
+        scenario += options.UpdatePremiumSurface([sp.record(**point) for point in points(surface)]).run(sender = admin)
+        model.surface = surface
+
+        purchase(0, bob, 400, 380, 3, 1, 0)
+        purchase(1, bob, 400, 550, 5, 7, 0)
+        purchase(2, alice, 400, 400, 7, 14, 0)
+
+        scenario.h2("Utilization cap")
+        purchase(3, alice, 400, 400, 10, 21, 0)
+
+        scenario.h2("Strike outside the surface")
+        purchase(4, bob, 400, 900, 1, 7, 0)
+
+        feed(520, DAY // 2)
+        exercise(0, bob, 0, 520, DAY // 2)
+        exercise(1, bob, 1, 520, DAY // 2)
+
+        mint(alice, 3000000, DAY)
+        burn(bob, 2000000, DAY)
+
+        scenario.h2("Sweep the 7-day cohort")
+        scenario += options.SweepExpired(day = 7, limit = 10).run(sender = keeper, now = sp.timestamp(8 * DAY))
+        model.free(1, 8 * DAY)
+        check()
+
+        feed(610, 9 * DAY)
+        exercise(2, alice, 0, 610, 9 * DAY)
+        burn(alice, 5000000, 9 * DAY)
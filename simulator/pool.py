@@ -0,0 +1,245 @@
+# Vectorized reference model of the Securities pool
+#
+# Mirrors the integer arithmetic of the Securities entry points (nat truncation, abs() of differences,
+# the premium surface lookup and interpolation and the 90 percent utilization cap) over many independent pools at once.
+# Every field is an int64 array with one entry per path; every operation takes a boolean mask of the paths
+# it applies to and, like a failed Michelson operation, leaves the paths whose checks fail untouched.
+
+import numpy as np
+
+from simulator import surface as premium_surface
+
+MUTEZ = 1000000
+DAY = 86400
+INT64_MAX = np.iinfo(np.int64).max
+
+
+def muldiv(a, b, c):
+    # exact a * b // c in int64; the paths whose product of balances and token supplies would overflow int64 are
+    # computed with Python integers, and a quotient that doesn't fit in int64 raises OverflowError
+    a, b, c = np.broadcast_arrays(*[np.asarray(v, dtype = np.int64) for v in (a, b, c)])
+    wide = np.abs(a) > INT64_MAX // np.maximum(np.abs(b), 1)
+
+    result = np.zeros(a.shape, dtype = np.int64)
+    result[~wide] = a[~wide] * b[~wide] // c[~wide]
+    if wide.any():
+        result[wide] = np.array([int(x) * int(y) // int(z) for x, y, z in zip(a[wide], b[wide], c[wide])], dtype = np.int64)
+    return result
+
+
+def dense(surface):
+    # the premium surface as a (duration, bucket) table with -1 where it has no point, indexed per path by quote()
+    table = np.full((max(duration for duration, bucket in surface) + 1, max(bucket for duration, bucket in surface) + 2), -1, dtype = np.int64)
+    for (duration, bucket), value in surface.items():
+        table[duration, bucket] = value
+    return table
+
+
+class PoolModel:
+
+    def __init__(self, paths, capacity, surface = None):
+        self.paths = paths
+        self.surface = dict(surface or premium_surface.flat())
+
+        zeros = lambda: np.zeros(paths, dtype = np.int64)
+
+        self.totalSupply = zeros()
+        self.LockedSupply = zeros()
+        self.adminAccount = zeros()
+        self.tokenMinted = zeros()
+        self.WithdrawFund = zeros()
+        self.balance = zeros()
+
+        # one position slot per path and order, as in CallOption
+        shape = (paths, capacity)
+        self.strike = np.zeros(shape, dtype = np.int64)
+        self.options = np.zeros(shape, dtype = np.int64)
+        self.premium = np.zeros(shape, dtype = np.int64)
+        self.reward = np.zeros(shape, dtype = np.int64)
+        self.expiry = np.zeros(shape, dtype = np.int64)
+        self.open = np.zeros(shape, dtype = bool)
+
+    def mask(self, mask):
+        return np.ones(self.paths, dtype = bool) if mask is None else np.asarray(mask, dtype = bool)
+
+    def mint(self, amount, mask = None):
+        # ContractWriterMint; returns the wXTZ minted on every path
+        mask = self.mask(mask)
+        amount = np.broadcast_to(np.asarray(amount, dtype = np.int64), (self.paths,))
+
+        first = self.tokenMinted == 0
+        minted = np.where(first, amount, muldiv(amount, self.tokenMinted, np.where(first, 1, self.totalSupply + self.WithdrawFund)))
+        minted = np.where(mask, minted, 0)
+
+        self.tokenMinted += minted
+        self.balance += np.where(mask, amount, 0)
+        self.totalSupply = np.where(mask, self.balance, self.totalSupply)
+        return minted
+
+    def burn(self, tokens, mask = None):
+        # ContractWriterBurn; returns the mutez paid out, zero where the pool had too little free liquidity
+        mask = self.mask(mask)
+        tokens = np.broadcast_to(np.asarray(tokens, dtype = np.int64), (self.paths,))
+
+        mask &= self.tokenMinted >= tokens
+        nav = self.totalSupply + self.WithdrawFund
+        transfer = muldiv(tokens, nav, np.where(self.tokenMinted == 0, 1, self.tokenMinted))
+        free = np.abs(nav - self.LockedSupply)
+        mask &= free >= transfer
+
+        self.tokenMinted = np.where(mask, self.tokenMinted - tokens, self.tokenMinted)
+
+        fromFund = mask & (self.WithdrawFund >= transfer)
+        fromSupply = mask & ~fromFund
+        self.totalSupply = np.where(fromSupply, np.abs(self.totalSupply - (transfer - self.WithdrawFund)), self.totalSupply)
+        self.WithdrawFund = np.where(fromFund, self.WithdrawFund - transfer, np.where(fromSupply, 0, self.WithdrawFund))
+
+        paid = np.where(mask, transfer, 0)
+        self.balance -= paid
+        return paid
+
+    def quote(self, price, strike, order, duration):
+        # premium stored on the position and the total the buyer must pay for it; -1 where the strike is
+        # outside the surface and the purchase fails. surfacePremium() over every path at once, as
+        # simulator.surface.premium() computes it for one
+        moneyness = strike * 10000 // price
+        bucket, offset = moneyness // premium_surface.STEP, moneyness % premium_surface.STEP
+
+        table = dense(self.surface)
+        rows, columns = table.shape
+        inside = (duration >= 0) & (duration < rows) & (bucket >= 0) & (bucket + 1 < columns)
+        duration, bucket = np.where(inside, duration, 0), np.where(inside, bucket, 0)
+        low = np.where(inside, table[duration, bucket], -1)
+        high = np.where(inside, table[duration, bucket + 1], -1)
+
+        between = np.where(high >= low, low + (high - low) * offset // premium_surface.STEP, low - (low - high) * offset // premium_surface.STEP)
+        unit = np.where(low < 0, -1, np.where(offset == 0, low, np.where(high < 0, -1, between)))
+        premium = np.where(unit >= 0, order * unit, -1)
+        return premium, np.where(unit >= 0, premium + order * 10000, -1)
+
+    def purchase(self, slot, now, price, strike, order, duration, paid, mask = None):
+        # PurchaseCallOption priced at the oracle price; returns (accepted, rejected by the utilization cap)
+        mask = self.mask(mask)
+        price, strike, order, duration, paid = [np.broadcast_to(np.asarray(v, dtype = np.int64), (self.paths,)) for v in (price, strike, order, duration, paid)]
+
+        premium, required = self.quote(price, strike, order, duration)
+        total = order * MUTEZ
+        locked = self.LockedSupply + total
+
+        ok = mask & (self.totalSupply > self.LockedSupply)
+        ok &= np.abs(self.totalSupply - self.LockedSupply) >= total
+        ok &= (premium >= 0) & (paid >= required)
+        capped = ok & (locked * 10 > self.totalSupply * 9)
+        ok &= ~capped
+
+        self.LockedSupply = np.where(ok, locked, self.LockedSupply)
+        self.adminAccount += np.where(ok, order * 9 * 1000, 0)
+        self.balance += np.where(ok, paid, 0)
+
+        rows = np.nonzero(ok)[0]
+        self.strike[rows, slot] = strike[rows]
+        self.options[rows, slot] = order[rows]
+        self.premium[rows, slot] = premium[rows]
+        self.reward[rows, slot] = order[rows] * 1000
+        self.expiry[rows, slot] = now + duration[rows] * DAY
+        self.open[rows, slot] = True
+        return ok, capped
+
+    def exercise(self, slot, now, price, mask = None):
+        # ExerciseCallOption; returns the payout to the holder
+        mask = self.mask(mask) & self.open[:, slot]
+        price = np.broadcast_to(np.asarray(price, dtype = np.int64), (self.paths,))
+
+        strike = self.strike[:, slot]
+        options = self.options[:, slot]
+        mask &= (now <= self.expiry[:, slot]) & (strike < price)
+
+        total = options * MUTEZ
+        left = muldiv(strike * MUTEZ, options, np.where(price == 0, 1, price))
+        profit = np.abs(total - left)
+
+        self.WithdrawFund += np.where(mask, self.premium[:, slot] + self.reward[:, slot], 0)
+        self.LockedSupply = np.where(mask, np.abs(self.LockedSupply - total), self.LockedSupply)
+        self.totalSupply = np.where(mask, np.abs(self.totalSupply - profit), self.totalSupply)
+
+        paid = np.where(mask, profit, 0)
+        self.balance -= paid
+        self.open[:, slot] &= ~mask
+        return paid
+
+    def free(self, slot, now, mask = None):
+        # FreeSecurity / SweepExpired; returns the keeper reward
+        mask = self.mask(mask) & self.open[:, slot] & (now > self.expiry[:, slot])
+
+        total = self.options[:, slot] * MUTEZ
+        self.LockedSupply = np.where(mask, np.abs(self.LockedSupply - total), self.LockedSupply)
+        self.WithdrawFund += np.where(mask, self.premium[:, slot], 0)
+
+        paid = np.where(mask, self.reward[:, slot], 0)
+        self.balance -= paid
+        self.open[:, slot] &= ~mask
+        return paid
+
+    def share_price(self):
+        # mutez of pool value per wXTZ, as used by ContractWriterMint and ContractWriterBurn
+        nav = (self.totalSupply + self.WithdrawFund).astype(np.float64)
+        return np.where(self.tokenMinted > 0, nav / np.maximum(self.tokenMinted, 1), 1.0)
+
+
+def simulate(paths = 10000, days = 90, price = 400, volatility = 0.8, deposit = 1000 * MUTEZ, orders = (1, 20), withdraw_probability = 0.05, seed = 0, surface = None):
+    # Steps every path one day at a time: a GBM price move, one ATM option order per day, exercise of
+    # in-the-money positions on their expiry day, sweep of expired ones and random LP withdrawals
+    # surface defaults to the flat one Securities is originated with, e.g. simulator.surface.generate(volatility)
+    rng = np.random.default_rng(seed)
+    durations = np.array(premium_surface.DURATIONS)
+
+    pool = PoolModel(paths, days, surface)
+    pool.mint(deposit)
+
+    prices = np.full(paths, float(price))
+    peak = pool.share_price()
+    drawdown = np.zeros(paths)
+    attempts = capped = 0
+
+    for day in range(days):
+        now = day * DAY
+        oracle = np.maximum(prices.round().astype(np.int64), 1)
+
+        # exercise on the last day the position is live, then sweep everything expired
+        for slot in range(day):
+            live = pool.open[:, slot]
+            if live.any():
+                pool.exercise(slot, now, oracle, live & (pool.expiry[:, slot] - now < DAY))
+                pool.free(slot, now)
+
+        order = rng.integers(orders[0], orders[1] + 1, size = paths)
+        duration = rng.choice(durations, size = paths)
+        _, required = pool.quote(oracle, oracle, order, duration)
+        accepted, rejected = pool.purchase(day, now, oracle, oracle, order, duration, required)
+        attempts += paths
+        capped += int(rejected.sum())
+
+        holders = rng.random(paths) < withdraw_probability
+        pool.burn(pool.tokenMinted // 10, holders)
+
+        share = pool.share_price()
+        peak = np.maximum(peak, share)
+        drawdown = np.maximum(drawdown, 1.0 - share / peak)
+
+        prices *= np.exp(volatility * np.sqrt(1 / 365.0) * rng.standard_normal(paths) - 0.5 * volatility ** 2 / 365.0)
+
+    share = pool.share_price()
+    return dict(
+        paths = paths,
+        days = days,
+        max_drawdown = dict(mean = float(drawdown.mean()), p95 = float(np.percentile(drawdown, 95)), max = float(drawdown.max())),
+        share_price = dict((p, float(np.percentile(share, p))) for p in (1, 5, 25, 50, 75, 95, 99)),
+        cap_rejection_rate = capped / float(attempts),
+        pool = pool,
+    )
+
+
+if __name__ == "__main__":
+    report = simulate()
+    del report["pool"]
+    print(report)
@@ -0,0 +1,111 @@
+# Off-chain generator of the Securities premium surface
+#
+#   python -m simulator.surface --volatility 0.8                          one volatility for every duration
+#   python -m simulator.surface --volatility 1=1.1,7=0.9,14=0.85,21=0.8 --markup 1.2 -o surface.json
+#   python -m simulator.surface --volatility 0.8 --michelson              UpdatePremiumSurface argument
+#
+# An option pays (price - strike) / price XTZ when exercised, which is a Black-Scholes call on the XTZ/USD
+# price divided by the spot price, so its premium only depends on the moneyness strike / price, the duration
+# and the volatility. Every bucket is priced at its lower bound, where surfacePremium() reads it exactly, and
+# the contract interpolates linearly in between.
+
+import argparse
+import json
+import math
+import sys
+
+DURATIONS = [1, 7, 14, 21]
+
+# the former flat premium table, in 10000 mutez per option
+INTEREST_RATE = {1: 1, 7: 3, 14: 5, 21: 7}
+
+STEP = 500
+BUCKETS = range(10, 41)
+
+
+def normal_cdf(x):
+    return 0.5 * (1.0 + math.erf(x / math.sqrt(2.0)))
+
+
+def call_premium(moneyness, days, volatility, rate = 0.0):
+    # XTZ per option: the Black-Scholes call price for spot 1 and strike moneyness
+    t = days / 365.0
+    if volatility <= 0 or t <= 0:
+        return max(1.0 - moneyness * math.exp(-rate * t), 0.0)
+    d1 = (math.log(1.0 / moneyness) + (rate + 0.5 * volatility ** 2) * t) / (volatility * math.sqrt(t))
+    d2 = d1 - volatility * math.sqrt(t)
+    return normal_cdf(d1) - moneyness * math.exp(-rate * t) * normal_cdf(d2)
+
+
+def generate(volatility, rate = 0.0, markup = 1.0, floor = 1000, durations = DURATIONS, step = STEP, buckets = BUCKETS):
+    # {(duration, bucket): mutez per option}; volatility is a number or a {duration: volatility} dict
+    surface = {}
+    for duration in durations:
+        sigma = volatility[duration] if isinstance(volatility, dict) else volatility
+        for bucket in buckets:
+            premium = call_premium(bucket * step / 10000.0, duration, sigma, rate)
+            surface[(duration, bucket)] = max(int(round(premium * markup * 1000000)), floor)
+    return surface
+
+
+def flat(rates = INTEREST_RATE, buckets = BUCKETS):
+    # the surface Securities is originated with: the former InterestRate premiums at every moneyness
+    return {(duration, bucket): rate * 10000 for duration, rate in rates.items() for bucket in buckets}
+
+
+def premium(surface, price, duration, strike, step = STEP):
+    # mutez per option as surfacePremium() computes it, or None when the strike is outside the surface
+    moneyness = strike * 10000 // price
+    bucket, offset = divmod(moneyness, step)
+    low = surface.get((duration, bucket))
+    if low is None:
+        return None
+    if offset == 0:
+        return low
+    high = surface.get((duration, bucket + 1))
+    if high is None:
+        return None
+    if high >= low:
+        return low + (high - low) * offset // step
+    return low - (low - high) * offset // step
+
+
+def points(surface):
+    # UpdatePremiumSurface argument as a list of dicts
+    return [dict(duration = duration, bucket = bucket, premium = value) for (duration, bucket), value in sorted(surface.items())]
+
+
+def parse_volatility(text):
+    if "=" not in text:
+        return float(text)
+    return {int(duration): float(sigma) for duration, sigma in (part.split("=") for part in text.split(","))}
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Generate the premium surface uploaded with UpdatePremiumSurface")
+    parser.add_argument("--volatility", type = parse_volatility, required = True, help = "annualized volatility, or duration=volatility pairs separated by commas")
+    parser.add_argument("--rate", type = float, default = 0.0, help = "annualized risk-free rate")
+    parser.add_argument("--markup", type = float, default = 1.0, help = "multiplier over the model premium kept by the pool")
+    parser.add_argument("--floor", type = int, default = 1000, help = "minimum premium in mutez per option")
+    parser.add_argument("--michelson", action = "store_true", help = "print the entry point argument as Michelson instead of JSON")
+    parser.add_argument("-o", "--output", help = "file to write to instead of stdout")
+    args = parser.parse_args(argv)
+
+    surface = generate(args.volatility, args.rate, args.markup, args.floor)
+
+    if args.michelson:
+        from benchmarks import michelson as m
+        text = m.seq([m.record(duration = m.nat(p["duration"]), bucket = m.nat(p["bucket"]), premium = m.nat(p["premium"])) for p in points(surface)])
+    else:
+        text = json.dumps(points(surface), indent = 1)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,7 +7,7 @@ import smartpy as sp
 
 class FA12_core(sp.Contract):
     def __init__(self, **extra_storage):
-        self.init(balances = sp.big_map(tvalue = sp.TRecord(approvals = sp.TMap(sp.TAddress, sp.TNat), balance = sp.TNat, locked = sp.TNat)), totalSupply = 0, **extra_storage)
+        self.init(balances = sp.big_map(tvalue = sp.TRecord(balance = sp.TNat, locked = sp.TNat)), allowances = sp.big_map(tkey = sp.TPair(sp.TAddress, sp.TAddress), tvalue = sp.TNat), totalSupply = 0, **extra_storage)
 
     @sp.entry_point
     def transfer(self, params):
@@ -15,7 +15,7 @@ class FA12_core(sp.Contract):
         sp.verify(self.is_administrator(sp.sender) |
             (~self.is_paused() &
                 ((params.from_ == sp.sender) |
-                 (self.data.balances[params.from_].approvals[sp.sender] >= params.value))))
+                 (self.data.allowances[sp.pair(params.from_, sp.sender)] >= params.value))))
         self.addAddressIfNecessary(params.to_)
 
         sp.verify(self.data.balances[params.from_].balance >= params.value)
@@ -26,23 +26,59 @@ class FA12_core(sp.Contract):
         self.data.balances[params.from_].balance = sp.as_nat(self.data.balances[params.from_].balance - params.value)
         self.data.balances[params.to_].balance += params.value
         sp.if (params.from_ != sp.sender) & (~self.is_administrator(sp.sender)):
-            self.data.balances[params.from_].approvals[sp.sender] = sp.as_nat(self.data.balances[params.from_].approvals[sp.sender] - params.value)
+            self.data.allowances[sp.pair(params.from_, sp.sender)] = sp.as_nat(self.data.allowances[sp.pair(params.from_, sp.sender)] - params.value)
+            self.emitApproval(params.from_, sp.sender)
+
+        sp.emit(sp.record(from_ = params.from_, to_ = params.to_, value = params.value), tag = "transfer", with_type = True)
+
+    @sp.entry_point
+    def transferBatch(self, params):
+        sp.set_type(params, sp.TList(sp.TRecord(from_ = sp.TAddress, txs = sp.TList(sp.TRecord(to_ = sp.TAddress, value = sp.TNat).layout(("to_", "value")))).layout(("from_", "txs"))))
+        sp.verify(self.is_administrator(sp.sender) | ~self.is_paused())
+
+        sp.for transfer in params:
+
+            AvailableBalance = sp.local('AvailableBalance',abs( self.data.balances[transfer.from_].balance - self.data.balances[transfer.from_].locked ))
+            TotalValue = sp.local('TotalValue', sp.nat(0))
+
+            sp.for tx in transfer.txs:
+
+                sp.verify(AvailableBalance.value >= tx.value , message = "Available Balance is less than transfer amount")
+                AvailableBalance.value = sp.as_nat(AvailableBalance.value - tx.value)
+                TotalValue.value += tx.value
+
+                self.addAddressIfNecessary(tx.to_)
+                self.data.balances[tx.to_].balance += tx.value
+
+                sp.emit(sp.record(from_ = transfer.from_, to_ = tx.to_, value = tx.value), tag = "transfer", with_type = True)
+
+            self.data.balances[transfer.from_].balance = sp.as_nat(self.data.balances[transfer.from_].balance - TotalValue.value)
+
+            # Allowance is checked and spent once per (from_, spender) for the whole list of txs
+            sp.if (transfer.from_ != sp.sender) & (~self.is_administrator(sp.sender)):
+                self.data.allowances[sp.pair(transfer.from_, sp.sender)] = sp.as_nat(self.data.allowances[sp.pair(transfer.from_, sp.sender)] - TotalValue.value, message = "Allowance is less than transfer amount")
+                self.emitApproval(transfer.from_, sp.sender)
 
     @sp.entry_point
     def approve(self, params):
         sp.set_type(params, sp.TRecord(spender = sp.TAddress, value = sp.TNat).layout(("spender", "value")))
         sp.verify(~self.is_paused())
-        alreadyApproved = self.data.balances[sp.sender].approvals.get(params.spender, 0)
+        alreadyApproved = self.data.allowances.get(sp.pair(sp.sender, params.spender), 0)
         sp.verify((alreadyApproved == 0) | (params.value == 0), "UnsafeAllowanceChange")
 
         AvailableBalance = sp.local('AvailableBalance',abs( self.data.balances[sp.sender].balance - self.data.balances[sp.sender].locked ))
         sp.verify(AvailableBalance.value >= params.value , message = "Available Balance is less than approval amount")
 
-        self.data.balances[sp.sender].approvals[params.spender] = params.value
+        self.data.allowances[sp.pair(sp.sender, params.spender)] = params.value
+        self.emitApproval(sp.sender, params.spender)
+
+    # Events carry the amount moved, or for allowances the allowance left after the change
+    def emitApproval(self, owner, spender):
+        sp.emit(sp.record(owner = owner, spender = spender, value = self.data.allowances[sp.pair(owner, spender)]), tag = "approval", with_type = True)
 
     def addAddressIfNecessary(self, address):
         sp.if ~ self.data.balances.contains(address):
-            self.data.balances[address] = sp.record(balance = 0, locked = 0,approvals = {}, )
+            self.data.balances[address] = sp.record(balance = 0, locked = 0)
 
     @sp.view(sp.TNat)
     def getBalance(self, params):
@@ -54,7 +90,7 @@ class FA12_core(sp.Contract):
 
     @sp.view(sp.TNat)
     def getAllowance(self, params):
-        sp.result(self.data.balances[params.owner].approvals[params.spender])
+        sp.result(self.data.allowances[sp.pair(params.owner, params.spender)])
 
     @sp.view(sp.TNat)
     def getTotalSupply(self, params):
@@ -69,28 +105,103 @@ class FA12_core(sp.Contract):
     def is_administrator(self, sender):
         return sp.bool(False)
 
+# Admin entry points and unlockFunds are lazy so transfers, mints and burns don't load them
 class FA12_mint_burn(FA12_core):
+
+    # Lockups are a FIFO queue of per-day buckets: mints on the same day share a bucket and matured buckets
+    # are popped from the head, so the queue length per address is bounded by the lockup duration in days
+    def expiryDay(self, time):
+        return sp.as_nat(time - sp.timestamp(0)) / 86400
+
+    # A bucket is stored as one nat: seconds since the epoch of its first mint + amount * 2^32
+    def packLockup(self, amount, time):
+        return sp.as_nat(time - sp.timestamp(0)) + amount * 2**32
+
+    def lockupAmount(self, packed):
+        return packed / 2**32
+
+    def lockupTime(self, packed):
+        return sp.timestamp(0).add_seconds(sp.to_int(packed % 2**32))
+
+    def releaseMatured(self, address):
+
+        Scanning = sp.local('Scanning', True)
+
+        sp.while Scanning.value:
+
+            Head = sp.local('Head', self.data.LockedBalance[address].head)
+
+            sp.if Head.value < self.data.LockedBalance[address].tail:
+
+                Bucket = sp.local('Bucket', self.data.LockedEntries[sp.pair(address, Head.value)])
+
+                sp.if sp.now > self.lockupTime(Bucket.value).add_days(sp.to_int(self.data.LockDuration)):
+
+                    self.data.balances[address].locked = abs(self.data.balances[address].locked - self.lockupAmount(Bucket.value))
+                    sp.emit(sp.record(address = address, amount = self.lockupAmount(Bucket.value)), tag = "unlock", with_type = True)
+                    del self.data.LockedEntries[sp.pair(address, Head.value)]
+
+                    self.data.LockedBalance[address].head = Head.value + 1
+
+                sp.else:
+                    Scanning.value = False
+
+            sp.else:
+                Scanning.value = False
+
+    def mintTokens(self, address, value):
+
+        self.addAddressIfNecessary(address)
+
+        sp.if self.data.LockedBalance.contains(address):
+            self.releaseMatured(address)
+        sp.else: 
+            self.data.LockedBalance[address] = sp.record(head = sp.nat(0), tail = sp.nat(0))
+
+        Tail = sp.local('Tail', self.data.LockedBalance[address].tail)
+        Merged = sp.local('Merged', False)
+
+        sp.if self.data.LockedBalance[address].head < Tail.value:
+
+            Last = sp.local('Last', sp.pair(address, sp.as_nat(Tail.value - 1)))
+
+            sp.if self.expiryDay(self.lockupTime(self.data.LockedEntries[Last.value])) == self.expiryDay(sp.now):
+
+                # The bucket keeps the time of its first mint, so the queue stays in time order and a mint later in
+                # the day unlocks with it, less than a day before its own LockDuration has passed
+                self.data.LockedEntries[Last.value] = self.packLockup(self.lockupAmount(self.data.LockedEntries[Last.value]) + value, self.lockupTime(self.data.LockedEntries[Last.value]))
+                Merged.value = True
+
+        sp.if ~Merged.value:
+
+            self.data.LockedEntries[sp.pair(address, Tail.value)] = self.packLockup(value, sp.now)
+            self.data.LockedBalance[address].tail = Tail.value + 1
+
+        self.data.balances[address].balance += value
+        self.data.balances[address].locked += value
+        
+        self.data.totalSupply += value
+
+        sp.emit(sp.record(address = address, value = value), tag = "mint", with_type = True)
+
     @sp.entry_point
     def mint(self, params):
 
         sp.set_type(params, sp.TRecord(address = sp.TAddress, value = sp.TNat))
         
         sp.verify(self.data.validator.contains(sp.sender))
-        
-        self.addAddressIfNecessary(params.address)
 
-        sp.if self.data.LockedBalance.contains(params.address):
+        self.mintTokens(params.address, params.value)
 
-            Index = sp.local('Index',sp.len(self.data.LockedBalance[params.address]))
-            self.data.LockedBalance[params.address][Index.value] = sp.record(amount = params.value, time = sp.now)
-        sp.else: 
-            self.data.LockedBalance[params.address] = sp.map()
-            self.data.LockedBalance[params.address][0] = sp.record(amount = params.value, time = sp.now)
+    @sp.entry_point
+    def mintBatch(self, params):
 
-        self.data.balances[params.address].balance += params.value
-        self.data.balances[params.address].locked += params.value
-        
-        self.data.totalSupply += params.value
+        sp.set_type(params, sp.TList(sp.TRecord(address = sp.TAddress, value = sp.TNat)))
+
+        sp.verify(self.data.validator.contains(sp.sender))
+
+        sp.for mint in params:
+            self.mintTokens(mint.address, mint.value)
 
     @sp.entry_point
     def burn(self, params):
@@ -104,22 +215,19 @@ class FA12_mint_burn(FA12_core):
         self.data.balances[params.address].balance = sp.as_nat(self.data.balances[params.address].balance - params.value)
         self.data.totalSupply = sp.as_nat(self.data.totalSupply - params.value)
 
+        sp.emit(sp.record(address = params.address, value = params.value), tag = "burn", with_type = True)
 
-    @sp.entry_point
+
+    @sp.entry_point(lazify = True)
     def unlockFunds(self,params):
 
         sp.set_type(params, sp.TRecord(address = sp.TAddress))
         
         sp.verify(self.data.LockedBalance.contains(params.address), message = "Address does not have funds LockedUp")
-        
-        sp.for i in self.data.LockedBalance[params.address].keys():
 
-            sp.if sp.now > self.data.LockedBalance[params.address][i].time.add_days(sp.to_int(self.data.LockDuration)):
-            
-                self.data.balances[params.address].locked = abs(self.data.balances[params.address].locked - self.data.LockedBalance[params.address][i].amount)
-                del self.data.LockedBalance[params.address][i]
+        self.releaseMatured(params.address)
 
-    @sp.entry_point
+    @sp.entry_point(lazify = True)
     def ModifyLockup(self,params):
 
         sp.set_type(params, sp.TRecord(duration = sp.TNat))
@@ -129,7 +237,7 @@ class FA12_mint_burn(FA12_core):
 
         self.data.LockDuration = params.duration
     
-    @sp.entry_point
+    @sp.entry_point(lazify = True)
     def ValidatorOperation(self,params):
         sp.set_type(params, sp.TRecord(address = sp.TAddress, Operation = sp.TNat))
 
@@ -145,7 +253,7 @@ class FA12_administrator(FA12_core):
     def is_administrator(self, sender):
         return sender == self.data.administrator
 
-    @sp.entry_point
+    @sp.entry_point(lazify = True)
     def setAdministrator(self, params):
         sp.set_type(params, sp.TAddress)
         sp.verify(self.is_administrator(sp.sender))
@@ -160,7 +268,7 @@ class FA12_pause(FA12_core):
     def is_paused(self):
         return self.data.paused
 
-    @sp.entry_point
+    @sp.entry_point(lazify = True)
     def setPause(self, params):
         sp.set_type(params, sp.TBool)
         sp.verify(self.is_administrator(sp.sender))
@@ -168,7 +276,7 @@ class FA12_pause(FA12_core):
 
 class FA12(FA12_mint_burn, FA12_administrator, FA12_pause, FA12_core):
     def __init__(self, admin):
-        FA12_core.__init__(self, paused = False, administrator = admin,validator = sp.set([admin]), LockedBalance = sp.big_map(),LockDuration = sp.nat(14))
+        FA12_core.__init__(self, paused = False, administrator = admin,validator = sp.set([admin]), LockedBalance = sp.big_map(tkey = sp.TAddress, tvalue = sp.TRecord(head = sp.TNat, tail = sp.TNat)), LockedEntries = sp.big_map(tkey = sp.TPair(sp.TAddress, sp.TNat), tvalue = sp.TNat),LockDuration = sp.nat(14))
 
 class Viewer(sp.Contract):
     def __init__(self, t):
@@ -203,4 +311,114 @@ if "templates" not in __name__:
         scenario += token.mint(address = bob.address, value = 400).run(sender = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF"), now = sp.timestamp(400))
         scenario += token.unlockFunds(address = bob.address).run(sender = bob)
         scenario += token.mint(address = bob.address, value = 400).run(sender = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF"), now = sp.timestamp(400))
-# KT18b68aLZji9WK8AoMhRuLGdbZEbyMrBnS8
\ No newline at end of file
+# KT18b68aLZji9WK8AoMhRuLGdbZEbyMrBnS8
+
+    @sp.add_test(name = "Bounded Lockup Release")
+    def test():
+
+        scenario = sp.test_scenario()
+        scenario.h1("Bounded Lockup Release")
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        writer = sp.test_account("Writer")
+
+        token = FA12(admin)
+        scenario += token
+
+        # 500 mints, one every 5 hours over ~104 days: the queue never holds more than LockDuration + 2 day buckets,
+        # and what is still locked is exactly the mints of the buckets whose first mint is at most 14 days old
+        first = {}
+        for i in range(500):
+
+            now = i * 5 * 3600
+            first.setdefault(now // 86400, now)
+            scenario += token.mint(address = writer.address, value = 10).run(sender = admin, now = sp.timestamp(now))
+
+            if i % 100 == 99:
+                scenario.h2("Unlock after %d mints" % (i + 1))
+                scenario += token.unlockFunds(address = writer.address).run(sender = writer, now = sp.timestamp(now))
+                scenario.verify(abs(token.data.LockedBalance[writer.address].tail - token.data.LockedBalance[writer.address].head) <= 16)
+                scenario.verify(token.data.balances[writer.address].locked == 10 * len([j for j in range(i + 1) if now <= first[j * 5 * 3600 // 86400] + 14 * 86400]))
+
+        scenario.verify(token.data.balances[writer.address].balance == 5000)
+
+        scenario.h2("A day's bucket unlocks 14 days after its first mint")
+        scenario += token.mint(address = admin, value = 10).run(sender = admin, now = sp.timestamp(200 * 86400))
+        scenario += token.mint(address = admin, value = 20).run(sender = admin, now = sp.timestamp(200 * 86400 + 7200))
+        scenario.verify(abs(token.data.LockedBalance[admin].tail - token.data.LockedBalance[admin].head) == 1)
+        scenario += token.unlockFunds(address = admin).run(sender = admin, now = sp.timestamp(214 * 86400))
+        scenario.verify(token.data.balances[admin].locked == 30)
+        scenario += token.unlockFunds(address = admin).run(sender = admin, now = sp.timestamp(214 * 86400 + 1))
+        scenario.verify(token.data.balances[admin].locked == 0)
+
+    @sp.add_test(name = "Allowances")
+    def test():
+
+        scenario = sp.test_scenario()
+        scenario.h1("Allowances")
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        alice = sp.test_account("Alice")
+        bob = sp.test_account("Robert")
+
+        token = FA12(admin)
+        scenario += token
+
+        scenario += token.mint(address = alice.address, value = 1000).run(sender = admin, now = sp.timestamp(0))
+        scenario += token.unlockFunds(address = alice.address).run(sender = alice, now = sp.timestamp(15 * 86400))
+
+        # Allowances live outside the balance record, so a transfer's cost doesn't depend on how many have been granted
+        for i in range(50):
+            scenario += token.approve(spender = sp.test_account("Spender_%d" % i).address, value = 10).run(sender = alice)
+
+        scenario.h2("Transfer from an account with 50 approvals")
+        scenario += token.transfer(from_ = alice.address, to_ = bob.address, value = 100).run(sender = alice)
+
+        scenario.h2("Transfer by an approved spender")
+        spender = sp.test_account("Spender_0")
+        scenario += token.transfer(from_ = alice.address, to_ = bob.address, value = 10).run(sender = spender)
+        scenario.verify(token.data.allowances[sp.pair(alice.address, spender.address)] == 0)
+
+        scenario.h2("UnsafeAllowanceChange")
+        scenario += token.approve(spender = sp.test_account("Spender_1").address, value = 20).run(sender = alice, valid = False)
+        scenario += token.approve(spender = sp.test_account("Spender_1").address, value = 0).run(sender = alice)
+
+    @sp.add_test(name = "Batch Transfer")
+    def test():
+
+        scenario = sp.test_scenario()
+        scenario.h1("Batch Transfer")
+
+        admin = sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")
+        pool = sp.test_account("Pool")
+        operator = sp.test_account("Operator")
+
+        token = FA12(admin)
+        scenario += token
+
+        scenario += token.mint(address = pool.address, value = 100000).run(sender = admin, now = sp.timestamp(0))
+        scenario += token.unlockFunds(address = pool.address).run(sender = pool, now = sp.timestamp(15 * 86400))
+
+        # Checks the balances a batch moves; the gas per transfer at these sizes comes from the token load of
+        # benchmarks/gas_report.py, the scenario interpreter doesn't report gas
+        for size in [1, 10, 100]:
+
+            scenario.h2("Batch of %d transfers" % size)
+
+            txs = [sp.record(to_ = sp.test_account("LP_%d" % i).address, value = 10) for i in range(size)]
+            scenario += token.transferBatch([sp.record(from_ = pool.address, txs = txs)]).run(sender = pool)
+
+        scenario.verify(token.data.balances[pool.address].balance == 100000 - 10 * 111)
+        scenario.verify(token.data.balances[sp.test_account("LP_0").address].balance == 30)
+        scenario.verify(token.data.balances[sp.test_account("LP_99").address].balance == 10)
+
+        scenario.h2("Batch by an approved spender")
+        scenario += token.approve(spender = operator.address, value = 50).run(sender = pool)
+
+        txs = [sp.record(to_ = sp.test_account("LP_%d" % i).address, value = 10) for i in range(5)]
+        scenario += token.transferBatch([sp.record(from_ = pool.address, txs = txs)]).run(sender = operator)
+        scenario.verify(token.data.allowances[sp.pair(pool.address, operator.address)] == 0)
+
+        scenario += token.transferBatch([sp.record(from_ = pool.address, txs = txs)]).run(sender = operator, valid = False)
+
+    sp.add_compilation_target("FA12", FA12(sp.address("tz1YCDdMbSB3HVbmiEHh1hnERBdoxZNdAUAF")))